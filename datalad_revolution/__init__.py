@@ -29,8 +29,29 @@ command_suite = (
             'rev-diff',
             'rev_diff'
         ),
+        (
+            'datalad_revolution.revmultistatus',
+            'RevMultiStatus',
+            'rev-multi-status',
+            'rev_multi_status'
+        ),
+        (
+            'datalad_revolution.revserver',
+            'RevServer',
+            'rev-server',
+            'rev_server'
+        ),
     ]
 )
 
-from datalad import setup_package
-from datalad import teardown_package
+
+# DataLad is only imported when tests are run, such that the thin client
+# (see `client`) starts without loading it
+def setup_package():
+    from datalad import setup_package
+    return setup_package()
+
+
+def teardown_package():
+    from datalad import teardown_package
+    return teardown_package()
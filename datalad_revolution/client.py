@@ -0,0 +1,222 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Thin client for a running rev-server
+
+Requests are forwarded to the server (see `revserver`) over its Unix
+socket, and results are rendered as they arrive. This module only uses
+the standard library, and the package does not load DataLad on import,
+so the client starts without the cost of loading DataLad.
+
+Protocol
+--------
+Requests and responses are JSON objects, one per line. A request::
+
+  {"id": 1, "command": "rev_status", "cwd": "/some/dir",
+   "kwargs": {"recursive": true}}
+
+is answered by any number of result responses, followed by one final
+response::
+
+  {"id": 1, "result": {"action": "status", "path": ..., ...}}
+  {"id": 1, "status": "done"}
+
+or, if the command failed::
+
+  {"id": 1, "error": "message"}
+
+Any number of requests can be sent over the same connection, one after
+the other.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import argparse
+import json
+import os
+import os.path as op
+import socket
+import subprocess
+import sys
+import tempfile
+
+# configuration item with the socket path, and the environment variable
+# that DataLad reads as the same item
+socket_cfg = 'datalad.revolution.server.socket'
+socket_env = 'DATALAD_REVOLUTION_SERVER_SOCKET'
+
+
+def get_socket_path():
+    """Return the socket path of the server of the current user
+
+    Like the server, the configuration item datalad.revolution.server.socket
+    is honored (as environment variable, or in Git's configuration),
+    before a default path is chosen.
+    """
+    path = os.environ.get(socket_env, None)
+    if path:
+        return path
+    try:
+        with open(os.devnull, 'w') as devnull:
+            path = subprocess.check_output(
+                ['git', 'config', '--get', socket_cfg],
+                stderr=devnull).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        # not configured, or no Git
+        path = None
+    if path:
+        return op.expanduser(path)
+    rundir = os.environ.get('XDG_RUNTIME_DIR', None) or tempfile.gettempdir()
+    return op.join(
+        rundir, 'datalad-revolution-{}.sock'.format(
+            os.getuid() if hasattr(os, 'getuid') else 0))
+
+
+class ServerError(RuntimeError):
+    """Raised when the server reports a failed request"""
+    pass
+
+
+def request(command, socket_path=None, cwd=None, **kwargs):
+    """Send a single request to the server
+
+    Parameters
+    ----------
+    command : str
+      Python API name of the command, e.g. 'rev_status'.
+    socket_path : str, optional
+      Defaults to `get_socket_path()`.
+    cwd : str, optional
+      Working directory the command is executed in. Defaults to the
+      current directory.
+    **kwargs
+      Command arguments.
+
+    Yields
+    ------
+    dict
+      Result records.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(socket_path or get_socket_path())
+        sock.sendall(json.dumps(dict(
+            id=1,
+            command=command,
+            cwd=cwd or os.getcwd(),
+            kwargs=kwargs,
+        )).encode('utf-8') + b'\n')
+        with sock.makefile('rb') as f:
+            for line in f:
+                msg = json.loads(line.decode('utf-8'))
+                if 'result' in msg:
+                    yield msg['result']
+                elif 'error' in msg:
+                    raise ServerError(msg['error'])
+                else:
+                    return
+        raise ServerError('connection closed by server')
+    finally:
+        sock.close()
+
+
+def _render(res):
+    if res.get('status') == 'ok' and res.get('state') == 'clean':
+        return
+    path = res.get('path', '')
+    cwd = os.getcwd()
+    if path.startswith(cwd + os.sep):
+        path = op.relpath(path, cwd)
+    if res.get('action') in ('status', 'diff') and res.get('status') == 'ok':
+        type_ = res.get('type', res.get('type_src', ''))
+        print(u'{:>9}: {}{}'.format(
+            res.get('state', 'unknown'), path,
+            ' ({})'.format(type_) if type_ else ''))
+    else:
+        msg = res.get('message', '')
+        if isinstance(msg, list):
+            msg = msg[0] % tuple(msg[1:])
+        print(u'{}({}): {}{}'.format(
+            res.get('action', ''), res.get('status', ''), path,
+            ' [{}]'.format(msg) if msg else ''))
+
+
+def _setup_parser():
+    parser = argparse.ArgumentParser(
+        prog='datalad-rev-client',
+        description='Forward commands to a running rev-server')
+    parser.add_argument(
+        '--socket',
+        help='socket of the server [default: as configured by {}, or a '
+        'user-specific path]'.format(socket_cfg))
+    parser.add_argument(
+        '--json', action='store_true',
+        help='output one JSON object per result')
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('ping', help='check whether the server is running')
+    for name in ('rev-status', 'rev-diff', 'rev-create'):
+        p = sub.add_parser(name)
+        p.add_argument('path', nargs='*')
+        p.add_argument('-d', '--dataset')
+        if name == 'rev-create':
+            p.add_argument('-f', '--force', action='store_true')
+            p.add_argument('-D', '--description')
+            p.add_argument('--no-annex', action='store_true')
+            continue
+        p.add_argument('--annex', nargs='?', const='basic')
+        p.add_argument('--untracked', default='normal')
+        p.add_argument('-r', '--recursive', action='store_true')
+        p.add_argument('-R', '--recursion-limit', type=int)
+        p.add_argument('-J', '--jobs')
+        if name == 'rev-diff':
+            p.add_argument('-f', '--from', dest='fr', default='HEAD')
+            p.add_argument('-t', '--to')
+        else:
+            p.add_argument('--dirty-only', action='store_true')
+    return parser
+
+
+def main(args=None):
+    parser = _setup_parser()
+    args = parser.parse_args(args)
+    if not args.command:
+        parser.error('a command is required')
+    socket_path = args.socket or get_socket_path()
+    kwargs = dict(
+        (k, v) for k, v in vars(args).items()
+        if k not in ('socket', 'json', 'command') and
+        v is not None and v is not False and v != [])
+    if 'jobs' in kwargs and kwargs['jobs'] != 'auto':
+        kwargs['jobs'] = int(kwargs['jobs'])
+    if args.command == 'rev-create' and 'path' in kwargs:
+        kwargs['path'] = kwargs['path'][0]
+    failed = False
+    try:
+        for res in request(
+                args.command.replace('-', '_'), socket_path=socket_path,
+                **kwargs):
+            if res.get('status') in ('impossible', 'error'):
+                failed = True
+            if args.json:
+                print(json.dumps(res))
+            else:
+                _render(res)
+    except (OSError, socket.error) as e:
+        sys.stderr.write(
+            'Cannot connect to server at {}: {}\n'.format(socket_path, e))
+        return 2
+    except ServerError as e:
+        sys.stderr.write('{}\n'.format(e))
+        return 1
+    if args.command == 'ping' and not args.json:
+        print('ok')
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,468 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Reading Git-style configuration files without calling Git
+
+Configuration files are parsed directly (see git-config(1) for the
+syntax), and cached process-wide until any of the files read (including
+files pulled in via `include.path`) change. The configuration of a
+dataset merges, in order of increasing precedence: the dataset's
+`.datalad/config`, the system, global, and repository Git configuration,
+and `DATALAD_*` environment variables, like DataLad's `ConfigManager`.
+
+Files that use conditional includes (`includeIf`) cannot be evaluated
+here, `get_dataset_config()` returns None for a dataset that requires
+them, and callers must fall back to querying Git. The configuration
+managers of pooled repositories read from the same cache, with the same
+fallback (see `dataset.RevolutionConfigManager`).
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from six import text_type
+
+from .gitindex import (
+    get_common_dir,
+    get_git_dir,
+)
+from .hierarchy import get_jobs
+from .utils import file_fingerprint
+
+lgr = logging.getLogger('datalad.revolution.config')
+
+_key_regex = re.compile(r'^[A-Za-z][A-Za-z0-9-]*$')
+_comment_regex = re.compile(r'[#;]')
+_escapes = {'n': '\n', 't': '\t', 'b': '\b', '"': '"', '\\': '\\'}
+_true = ('true', 'yes', 'on', '1')
+_false = ('false', 'no', 'off', '0', '')
+
+
+class UnsupportedConfig(ValueError):
+    """Raised for configuration that cannot be evaluated without Git"""
+    pass
+
+
+def _parse_value(line, lines):
+    """Parse a value, popping any continuation lines off `lines`"""
+    value = []
+    # length of the value without trailing unquoted whitespace
+    keep = 0
+    quoted = False
+    i = 0
+    while True:
+        n = len(line)
+        while i < n:
+            c = line[i]
+            if c == '\\':
+                if i + 1 >= n:
+                    # line continuation
+                    break
+                e = line[i + 1]
+                if e not in _escapes:
+                    raise ValueError('invalid escape: \\{}'.format(e))
+                value.append(_escapes[e])
+                keep = len(value)
+                i += 2
+                continue
+            if c == '"':
+                quoted = not quoted
+                keep = len(value)
+                i += 1
+                continue
+            if not quoted and c in '#;':
+                break
+            if not (not quoted and c.isspace() and not value):
+                value.append(c)
+                if quoted or not c.isspace():
+                    keep = len(value)
+            i += 1
+        else:
+            # end of line, not a continuation
+            break
+        if i < n and line[i] == '\\':
+            if not lines:
+                break
+            line = lines.pop()
+            i = 0
+            continue
+        # comment
+        break
+    if quoted:
+        raise ValueError('unterminated quote')
+    return ''.join(value[:keep])
+
+
+def _parse_section(header):
+    """Parse the inside of a section header into its key prefix"""
+    if '"' in header:
+        name, _, sub = header.partition('"')
+        if not sub.endswith('"'):
+            raise ValueError('invalid section header: {}'.format(header))
+        sub = sub[:-1]
+        out = []
+        i = 0
+        while i < len(sub):
+            if sub[i] == '\\' and i + 1 < len(sub):
+                i += 1
+            out.append(sub[i])
+            i += 1
+        return '{}.{}'.format(name.strip().lower(), ''.join(out))
+    name = header.strip()
+    if '.' in name:
+        # deprecated [section.subsection] syntax
+        sec, _, sub = name.partition('.')
+        return '{}.{}'.format(sec.lower(), sub.lower())
+    return name.lower()
+
+
+def parse_config(text):
+    """Parse the content of a configuration file
+
+    Returns
+    -------
+    list
+      (key, value) tuples, in order of definition. Keys are
+      'section[.subsection].name', with section and name in lower case.
+      The value is None for a key without '=' (an implicit boolean true).
+    """
+    items = []
+    lines = text.splitlines()
+    lines.reverse()
+    section = None
+    while lines:
+        line = lines.pop().strip()
+        if line.startswith(u'\ufeff'):
+            line = line[1:]
+        if not line or line[0] in '#;':
+            continue
+        if line[0] == '[':
+            end = line.find(']')
+            if end < 0:
+                raise ValueError('invalid section header: {}'.format(line))
+            # a section header that contains ']' within a subsection
+            # name is not supported
+            section = _parse_section(line[1:end])
+            line = line[end + 1:].strip()
+            if not line or line[0] in '#;':
+                continue
+        if section is None:
+            raise ValueError('key outside of a section: {}'.format(line))
+        name, eq, rest = line.partition('=')
+        if not eq:
+            # a bare key, possibly followed by a comment
+            name = _comment_regex.split(name, 1)[0]
+        name = name.strip()
+        if not _key_regex.match(name):
+            raise ValueError('invalid key: {}'.format(line))
+        key = '{}.{}'.format(section, name.lower())
+        if not eq:
+            items.append((key, None))
+            continue
+        value = _parse_value(rest, lines)
+        items.append((key, value))
+    return items
+
+
+# path -> (((path, fingerprint), ...), items, origins)
+_files = {}
+_files_lock = threading.Lock()
+
+
+def read_config_file(path, origins=False, _depth=0):
+    """Read a configuration file, following `include.path`
+
+    Results are cached until any of the files read changes.
+
+    Parameters
+    ----------
+    path : str
+    origins : bool
+      Whether to report the file each item was read from.
+
+    Returns
+    -------
+    list
+      (key, value) tuples, see `parse_config()`, or (key, value, origin)
+      tuples with `origins`. Empty if the file does not exist.
+
+    Raises
+    ------
+    UnsupportedConfig
+      If the file uses conditional includes.
+    """
+    path = op.abspath(path)
+    cached = _files.get(path)
+    if cached is None or \
+            not all(file_fingerprint(p) == fp for p, fp in cached[0]):
+        cached = _read_config_file(path, _depth)
+    return cached[2] if origins else cached[1]
+
+
+def _read_config_file(path, _depth):
+    fp = file_fingerprint(path)
+    deps = [(path, fp)]
+    items = []
+    if fp is not None:
+        try:
+            with open(path, 'rb') as f:
+                text = f.read().decode('utf-8')
+        except (IOError, OSError) as e:
+            lgr.debug('Cannot read %s: %s', path, e)
+            text = ''
+        for key, value in parse_config(text):
+            if key.startswith('includeif.'):
+                raise UnsupportedConfig(
+                    'conditional include in {}'.format(path))
+            items.append((key, value, path))
+            if key == 'include.path' and value:
+                if _depth > 10:
+                    raise UnsupportedConfig(
+                        'include loop in {}'.format(path))
+                inc = op.join(op.dirname(path), op.expanduser(value))
+                inc_items = read_config_file(inc, True, _depth + 1)
+                deps.extend(_files[op.abspath(inc)][0])
+                items.extend(inc_items)
+    cached = (tuple(deps), [(k, v) for k, v, o in items], items)
+    with _files_lock:
+        _files[path] = cached
+    return cached
+
+
+def dump_config(files, show_origin=False, includes=True):
+    """Return the content of configuration files like Git lists it
+
+    The output matches `git config -z -l [--show-origin]` for the same
+    files, with absolute paths as origins. Like Git, `includes` should be
+    disabled for a listing of specific files (`--file`, `--local`).
+
+    Raises
+    ------
+    UnsupportedConfig, ValueError, UnicodeDecodeError
+      If any file cannot be evaluated without Git.
+    """
+    out = []
+    for f in files:
+        f = op.abspath(f)
+        for key, value, origin in read_config_file(f, origins=True):
+            if not includes and origin != f:
+                continue
+            if show_origin:
+                out.append(u'file:{}\0'.format(origin))
+            out.append(
+                u'{}\0'.format(key) if value is None
+                else u'{}\n{}\0'.format(key, value))
+    return u''.join(out)
+
+
+def get_system_config_files():
+    """Return the paths of the system and global Git configuration files"""
+    files = []
+    if not os.environ.get('GIT_CONFIG_NOSYSTEM'):
+        files.append(os.environ.get('GIT_CONFIG_SYSTEM', '/etc/gitconfig'))
+    if 'GIT_CONFIG_GLOBAL' in os.environ:
+        files.append(os.environ['GIT_CONFIG_GLOBAL'])
+    else:
+        files.append(op.join(
+            os.environ.get('XDG_CONFIG_HOME', None) or
+            op.join(op.expanduser('~'), '.config'),
+            'git', 'config'))
+        files.append(op.join(op.expanduser('~'), '.gitconfig'))
+    return files
+
+
+class DatasetConfig(object):
+    """Merged, read-only configuration of a dataset
+
+    Values of keys that are defined multiple times are tuples, like in
+    DataLad's `ConfigManager`.
+
+    Parameters
+    ----------
+    items : iterable
+      (key, value) tuples, in order of increasing precedence.
+    """
+    def __init__(self, items):
+        cfg = OrderedDict()
+        for key, value in items:
+            if key in cfg:
+                prev = cfg[key]
+                cfg[key] = (prev if isinstance(prev, tuple) else (prev,)) + \
+                    (value,)
+            else:
+                cfg[key] = value
+        self._cfg = cfg
+
+    def __contains__(self, key):
+        return key in self._cfg
+
+    def __getitem__(self, key):
+        return self._cfg[key]
+
+    def keys(self):
+        return self._cfg.keys()
+
+    def items(self):
+        return self._cfg.items()
+
+    def get(self, key, default=None):
+        """Return the value of a key, the last one for a multi-value key"""
+        value = self._cfg.get(key, default)
+        return value[-1] if isinstance(value, tuple) else value
+
+    def getbool(self, key, default=None):
+        """Return the value of a key interpreted as a boolean"""
+        if key not in self._cfg:
+            return default
+        value = self.get(key)
+        if value is None:
+            return True
+        value = value.strip().lower()
+        if value in _true:
+            return True
+        if value in _false:
+            return False
+        try:
+            return bool(int(value))
+        except ValueError:
+            raise ValueError(
+                'not a boolean value for {}: {}'.format(key, value))
+
+
+def _env_items():
+    return [
+        (k.replace('__', '-').replace('_', '.').lower(), v)
+        for k, v in sorted(os.environ.items())
+        if k.startswith('DATALAD_')
+    ]
+
+
+def get_dataset_config(ds_path):
+    """Return the merged configuration of a dataset
+
+    Parameters
+    ----------
+    ds_path : str
+      Root of the dataset.
+
+    Returns
+    -------
+    DatasetConfig or None
+      None if the configuration cannot be evaluated without Git.
+    """
+    ds_path = op.abspath(text_type(ds_path))
+    git_dir = get_git_dir(ds_path)
+    files = [op.join(ds_path, '.datalad', 'config')] + \
+        get_system_config_files()
+    if git_dir:
+        files.append(op.join(get_common_dir(git_dir), 'config'))
+    items = []
+    try:
+        for f in files:
+            items.extend(read_config_file(f))
+    except (UnsupportedConfig, ValueError, UnicodeDecodeError) as e:
+        lgr.debug('Cannot read configuration of %s: %s', ds_path, e)
+        return None
+    items.extend(_env_items())
+    return DatasetConfig(items)
+
+
+def get_git_config_files(worktree):
+    """Return the configuration files Git reads in a work tree, in order
+
+    Parameters
+    ----------
+    worktree : str or None
+      Root of the work tree, or None for the configuration outside of any
+      repository.
+
+    Returns
+    -------
+    list or None
+      None, if the files cannot be determined without Git (e.g. for a
+      directory that is not the root of a work tree, or configuration
+      passed via the environment).
+    """
+    if any(v in os.environ for v in (
+            'GIT_DIR', 'GIT_CONFIG', 'GIT_CONFIG_PARAMETERS',
+            'GIT_CONFIG_COUNT')):
+        return None
+    files = get_system_config_files()
+    if worktree is None:
+        return files
+    git_dir = get_git_dir(worktree)
+    if git_dir is None:
+        return None
+    repo_config = op.join(get_common_dir(git_dir), 'config')
+    try:
+        cfg = DatasetConfig(read_config_file(repo_config))
+        if cfg.getbool('extensions.worktreeconfig', False):
+            # per-worktree configuration is not supported
+            return None
+    except (UnsupportedConfig, ValueError, UnicodeDecodeError):
+        return None
+    return files + [repo_config]
+
+
+def get_trust_ctime(ds_path):
+    """Return Git's core.trustctime setting for a dataset"""
+    cfg = get_dataset_config(ds_path)
+    return cfg.getbool('core.trustctime', True) if cfg is not None else True
+
+
+def get_excludes_file(ds_path):
+    """Return the path of the global excludes file configured for a dataset
+
+    Returns
+    -------
+    str or None
+      None, if core.excludesFile is not configured.
+    """
+    cfg = get_dataset_config(ds_path)
+    path = cfg.get('core.excludesfile') if cfg is not None else None
+    return op.expanduser(path) if path else None
+
+
+def load_hierarchy_config(root, jobs='auto'):
+    """Read the configuration of all installed datasets of a hierarchy
+
+    Configuration files of all datasets are read in parallel, and end up in
+    the process-wide cache, from where later `get_dataset_config()` calls
+    for these datasets are served.
+
+    Parameters
+    ----------
+    root : str
+      Root dataset of the hierarchy.
+    jobs : int or 'auto'
+
+    Returns
+    -------
+    OrderedDict
+      Dataset path -> `DatasetConfig` (or None, see `get_dataset_config()`),
+      in depth-first order.
+    """
+    # only imported here, the registry reads `.gitmodules` with this module
+    from .registry import get_registry
+    paths = []
+    todo = [op.abspath(text_type(root))]
+    while todo:
+        path = todo.pop()
+        paths.append(path)
+        todo.extend(reversed([
+            rec.path for rec in get_registry(path) if rec.installed]))
+    with ThreadPoolExecutor(max_workers=get_jobs(jobs)) as pool:
+        configs = list(pool.map(get_dataset_config, paths))
+    return OrderedDict(zip(paths, configs))
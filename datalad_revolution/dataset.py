@@ -1,12 +1,22 @@
 """Amendment of the DataLad `Dataset` base class"""
 __docformat__ = 'restructuredtext'
 
+import copy
+import os
 import os.path as op
+import threading
 from collections import OrderedDict
 from six import text_type
 
 from . import utils as ut
+from .config import (
+    UnsupportedConfig,
+    dump_config,
+    get_git_config_files,
+)
+from .registry import SubdatasetIndex
 
+from datalad.config import ConfigManager
 from datalad.distribution.dataset import (
     Dataset as RevolutionDataset,
     EnsureDataset as EnsureRevDataset,
@@ -23,6 +33,87 @@ lgr = logging.getLogger('datalad.dataset')
 # remove deprecated method from API
 setattr(RevolutionDataset, 'get_subdatasets', ut.nothere)
 
+
+def _read_config(cm, args):
+    """Return what `git config <args>` reports, or None to call Git"""
+    if args[:2] != ['-z', '-l']:
+        return None
+    show_origin = '--show-origin' in args
+    opts = [a for a in args[2:] if a != '--show-origin']
+    if len(opts) == 2 and opts[0] == '--file':
+        files = [op.join(cm._runner.cwd or os.getcwd(), opts[1])]
+    elif not opts or opts == ['--local']:
+        worktree = None if '--git-dir=' in cm._config_cmd \
+            else cm._runner.cwd or os.getcwd()
+        files = get_git_config_files(worktree)
+        if files is None:
+            return None
+        if opts:
+            files = files[-1:] if worktree else []
+    else:
+        return None
+    try:
+        return dump_config(files, show_origin=show_origin, includes=not opts)
+    except (UnsupportedConfig, ValueError, UnicodeDecodeError) as e:
+        lgr.debug('Cannot read configuration without Git: %s', e)
+        return None
+
+
+class RevolutionConfigManager(ConfigManager):
+    """ConfigManager that reads configuration files without calling Git
+
+    Configuration is served from the same process-wide cache of parsed
+    configuration files that is used by all other consumers (see
+    `datalad_revolution.config`), and Git is only called for anything
+    that cannot be read from the files directly. Only used for the
+    repositories of the extension's pool (see `bind_config()`), any other
+    configuration manager is left alone.
+
+    Pooled instances are shared by worker threads. A configuration is
+    loaded into a copy, with copies of all mutable state, which then
+    replaces the loaded state at once, such that no reader sees it
+    partially loaded.
+    """
+    def __init__(self, *args, **kwargs):
+        # the constructor already loads the configuration
+        self._reload_lock = threading.RLock()
+        super(RevolutionConfigManager, self).__init__(*args, **kwargs)
+
+    def reload(self, force=False):
+        with self._reload_lock:
+            loaded = copy.copy(self)
+            loaded._store = dict(self._store)
+            loaded._cfgfiles = set(self._cfgfiles)
+            super(RevolutionConfigManager, loaded).reload(force=force)
+            self.__dict__.update(loaded.__dict__)
+
+    def _run(self, args, where=None, reload=False, **kwargs):
+        out = None if where or reload else _read_config(self, args)
+        if out is None:
+            return super(RevolutionConfigManager, self)._run(
+                args, where=where, reload=reload, **kwargs)
+        return out, ''
+
+
+def bind_config(repo):
+    """Serve the configuration of a repository by a RevolutionConfigManager
+
+    Parameters
+    ----------
+    repo : GitRepo
+      Its configuration manager is replaced, unless it already is one.
+
+    Returns
+    -------
+    RevolutionConfigManager
+    """
+    cfg = repo._cfg
+    if not isinstance(cfg, RevolutionConfigManager):
+        cfg = RevolutionConfigManager(dataset=repo, source='any')
+        repo._cfg = cfg
+    return cfg
+
+
 # this is here to make it easier for extensions that use this already
 # TODO remove when merged into datalad-core, but keep in extension code
 datasetmethod = rev_datasetmethod
@@ -58,6 +149,10 @@ def sort_paths_by_datasets(orig_dataset_arg, paths):
     """
     errors = []
     paths_by_ds = OrderedDict()
+    # registered subdatasets, only read if a path points to a dataset
+    subdatasets = SubdatasetIndex(op.abspath(text_type(
+        getattr(orig_dataset_arg, 'path', orig_dataset_arg)))) \
+        if orig_dataset_arg else None
     # sort any path argument into the respective subdatasets
     for p in sorted(paths):
         # it is important to capture the exact form of the
@@ -82,7 +177,11 @@ def sort_paths_by_datasets(orig_dataset_arg, paths):
                 # distinguish rsync-link syntax to identify
                 # the dataset as whole (e.g. 'ds') vs its
                 # content (e.g. 'ds/')
-                super_root = rev_get_dataset_root(op.dirname(root))
+                super_root = subdatasets.get_parent(root)
+                if super_root is None:
+                    # not registered in the hierarchy of the reference
+                    # dataset, e.g. the reference dataset itself
+                    super_root = rev_get_dataset_root(op.dirname(root))
                 if super_root:
                     # the dataset identified by the path argument
                     # is contained in a superdataset, and no
@@ -0,0 +1,320 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Early-exit detection of modifications in a dataset (hierarchy)
+
+Instead of a full status report, only the first modification is searched
+for, and all outstanding work is cancelled as soon as one is found. All
+datasets of a hierarchy are inspected in parallel, in two phases, with the
+cheapest checks first:
+
+1. Index stat data, staged changes, and the HEAD commit of each installed
+   subdataset compared to the commit recorded in its superdataset. No file
+   content is read in this phase.
+2. Content of files whose stat data changed (see `faststatus`), and
+   discovery of untracked content (see `untracked`).
+
+The content of a dataset whose index cannot be read directly (see
+`gitindex.open_index()`) is inspected with a regular status query in the
+second phase.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import threading
+
+from datalad.core.local.status import Status
+
+from .config import get_trust_ctime
+from .faststatus import (
+    get_entry_type,
+    index_matches_head,
+    verify_candidates,
+)
+from .gitindex import (
+    get_git_dir,
+    hexsha,
+    open_index,
+    read_ref,
+)
+from .hierarchy import (
+    WorkStealingPool,
+    get_jobs,
+)
+from .registry import get_registry
+from .repopool import get_dataset
+from .statcache import StatCache
+from .untracked import iter_untracked
+
+lgr = logging.getLogger('datalad.revolution.dirty')
+
+
+def find_change(ds_path, untracked='normal', recursive=False,
+                recursion_limit=None, jobs=None, trust_ctime=None):
+    """Return the first modification found in a dataset (hierarchy)
+
+    Installed subdatasets are always inspected, as any modification in
+    them renders the subdataset itself modified in its superdataset.
+
+    Parameters
+    ----------
+    ds_path : str
+      Root of the dataset.
+    untracked : {'no', 'normal', 'all'}
+      Whether untracked content counts as a modification.
+    recursive : bool
+      If False, a modification within a subdataset is reported as a
+      modification of the subdataset itself.
+    recursion_limit : int, optional
+      Reporting depth with `recursive`, see `recursive`.
+    jobs : int or 'auto', optional
+      Number of datasets inspected at the same time.
+    trust_ctime : bool, optional
+      Whether to consider ctime changes. Defaults to the core.trustctime
+      setting of each dataset.
+
+    Returns
+    -------
+    dict or None
+      A status result for a modification, or None if the dataset
+      (hierarchy) is clean. Which of several modifications is reported is
+      not deterministic.
+    """
+    finder = _ChangeFinder(
+        ds_path, untracked,
+        (recursion_limit if recursion_limit is not None else float('inf'))
+        if recursive else 0,
+        get_jobs(jobs), trust_ctime)
+    return finder.run()
+
+
+def is_dirty(ds_path, untracked='normal', jobs=None):
+    """Whether a dataset, or any of its installed subdatasets, is modified
+
+    Parameters
+    ----------
+    ds_path : str
+    untracked : {'no', 'normal', 'all'}
+      Whether untracked content counts as a modification.
+    jobs : int or 'auto', optional
+
+    Returns
+    -------
+    bool
+    """
+    return find_change(ds_path, untracked=untracked, jobs=jobs) is not None
+
+
+class _ChangeFinder(object):
+    def __init__(self, refds_path, untracked, level, jobs, trust_ctime):
+        self.refds_path = refds_path
+        self.untracked = untracked
+        # deepest dataset whose content is reported
+        self.level = level
+        self.jobs = jobs
+        self.trust_ctime = trust_ctime
+        self.found = None
+        self.error = None
+        self._deferred = []
+        self._lock = threading.Lock()
+        self._idle = threading.Event()
+        self._pending = 0
+        self._pool = None
+
+    def run(self):
+        self._run_phase([(self._check_index, ([self.refds_path],))])
+        if self.found is None and self.error is None:
+            self._run_phase([
+                (self._check_content, args) for args in self._deferred])
+        if self.error is not None:
+            raise self.error
+        return self.found
+
+    def _run_phase(self, tasks):
+        self._pool = WorkStealingPool(self.jobs)
+        self._pending = 0
+        self._idle.clear()
+        try:
+            for fn, args in tasks:
+                self._submit(fn, *args)
+            if not tasks:
+                self._idle.set()
+            self._idle.wait()
+        finally:
+            self._pool.cancel()
+            self._pool.shutdown()
+
+    def _submit(self, fn, *args):
+        with self._lock:
+            self._pending += 1
+        self._pool.submit(self._run, fn, args)
+
+    def _run(self, fn, args):
+        try:
+            if self.found is None:
+                fn(*args)
+        except Exception as e:
+            with self._lock:
+                if self.error is None:
+                    self.error = e
+            self._idle.set()
+        finally:
+            with self._lock:
+                self._pending -= 1
+                finished = not self._pending
+            if finished:
+                self._idle.set()
+
+    def _report(self, chain, res):
+        with self._lock:
+            if self.found is not None:
+                return
+            depth = len(chain) - 1
+            if depth > self.level:
+                # report the subdataset that contains the modification
+                # in the deepest reported dataset
+                level = int(self.level)
+                res = dict(
+                    path=chain[level + 1],
+                    type='dataset',
+                    state='modified',
+                    parentds=chain[level],
+                )
+            res.update(
+                action='status',
+                refds=self.refds_path,
+                status='ok',
+            )
+            self.found = res
+        self._pool.cancel()
+        self._idle.set()
+
+    def _report_path(self, chain, path, type_, state):
+        self._report(chain, dict(
+            path=path,
+            type=type_,
+            state=state,
+            parentds=chain[-1],
+        ))
+
+    def _report_dataset(self, chain):
+        # the dataset itself is modified in its superdataset
+        self._report(chain[:-1] or chain, dict(
+            path=chain[-1],
+            type='dataset',
+            state='modified',
+            parentds=chain[-2] if len(chain) > 1 else None,
+        ))
+
+    def _check_index(self, chain):
+        ds_path = chain[-1]
+        git_dir = get_git_dir(ds_path)
+        index_path = op.join(git_dir, 'index') if git_dir else None
+        if not index_path or not op.exists(index_path):
+            if git_dir and read_ref(git_dir) is not None:
+                # all committed content is deleted
+                self._report_dataset(chain)
+                return
+            with self._lock:
+                self._deferred.append((chain, {}, None))
+            return
+        cache = StatCache(git_dir)
+        idx = open_index(git_dir)
+        if idx is None:
+            # the index cannot be read directly, a regular status query
+            # decides in the second phase
+            candidates = None
+        else:
+            with idx:
+                candidates = self._scan_index(chain, git_dir, idx, cache)
+            if candidates is None:
+                return
+        subdatasets = []
+        for rec in get_registry(ds_path):
+            if not rec.installed:
+                continue
+            if read_ref(get_git_dir(rec.path)) != rec.gitshasum:
+                self._report_path(chain, rec.path, 'dataset', 'modified')
+                return
+            subdatasets.append(rec.path)
+        with self._lock:
+            self._deferred.append((chain, candidates, cache))
+        for path in subdatasets:
+            self._submit(self._check_index, chain + [path])
+
+    def _scan_index(self, chain, git_dir, idx, cache):
+        """Return the entries with changed stat data, None once reported"""
+        ds_path = chain[-1]
+        candidates = {}
+        trust_ctime = self.trust_ctime
+        if trust_ctime is None:
+            trust_ctime = get_trust_ctime(ds_path)
+        for entry, st in idx.changed(ds_path, trust_ctime=trust_ctime):
+            if self.found is not None:
+                return None
+            path = op.normpath(op.join(ds_path, os.fsdecode(entry.path)))
+            if entry.stage:
+                self._report_path(
+                    chain, path, get_entry_type(path, entry), 'modified')
+                return None
+            if st is None:
+                self._report_path(
+                    chain, path, get_entry_type(path, entry), 'deleted')
+                return None
+            hit = cache.lookup(os.fsdecode(entry.path), st)
+            if hit is None or hit[0] != hexsha(entry):
+                candidates[entry.path] = (entry, st)
+        if not index_matches_head(ds_path, git_dir, idx):
+            # staged changes, it is not worth finding out which
+            self._report_dataset(chain)
+            return None
+        return candidates
+
+    def _check_content(self, chain, candidates, cache):
+        ds_path = chain[-1]
+        if candidates is None:
+            # the state of subdatasets is checked separately
+            self._query(chain, None, self.untracked, 'commit')
+            return
+        if candidates:
+            verify_candidates(ds_path, candidates, cache, self.jobs)
+            cache.flush()
+        if candidates and self._query(
+                chain,
+                [op.join(ds_path, os.fsdecode(p)) for p in candidates],
+                'no', 'full'):
+            return
+        if self.untracked == 'no':
+            return
+        for relpath, type_ in iter_untracked(
+                ds_path, self.untracked, jobs=1):
+            self._report_path(
+                chain, op.normpath(op.join(ds_path, relpath)), type_,
+                'untracked')
+            return
+
+    def _query(self, chain, paths, untracked, eval_subdataset_state):
+        """Regular status query, True if a modification was reported"""
+        for r in Status.__call__(
+                path=paths,
+                dataset=get_dataset(chain[-1]),
+                untracked=untracked,
+                recursive=False,
+                eval_subdataset_state=eval_subdataset_state,
+                result_renderer=None,
+                on_failure="ignore",
+                return_type='generator'):
+            if r.get('status') == 'ok' and r.get('state') != 'clean':
+                self._report(chain, r)
+                return True
+            if self.found is not None:
+                return True
+        return False
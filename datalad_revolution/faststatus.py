@@ -0,0 +1,320 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Fast path for status reports on (mostly) clean work trees
+
+The index is read directly (see `gitindex`), and its stat data is compared
+to the work tree. If the index matches the HEAD commit, any entry with
+matching stat data is known to be clean and is reported without further
+inspection. Only the remaining candidates are passed on to a regular
+status query as path constraints. Untracked content is discovered by
+listing the work tree directly (see `untracked`).
+
+Files whose index stat data is outdated, but whose content was found to
+be unmodified before, are recognized by their stat fingerprint (see
+`statcache`), without reading their content again. Any remaining regular
+files are hashed in parallel (see `hashing`), and compared to the blob
+in the index, or the last known annex key of an unlocked file.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import stat
+
+from datalad.cmd import GitRunner
+from datalad.support.exceptions import CommandError
+
+from .config import get_trust_ctime
+from .gitindex import (
+    MODE_FILE,
+    MODE_GITLINK,
+    MODE_SYMLINK,
+    MODE_TYPE_MASK,
+    get_git_dir,
+    hexsha,
+    open_index,
+    read_commit_tree,
+    read_ref,
+)
+from .hashing import (
+    HashStats,
+    hash_files,
+    large_file_threshold,
+    verify_annex_keys,
+)
+from .statcache import StatCache
+from .untracked import (
+    collect_tracked,
+    git_order,
+    iter_untracked,
+)
+
+lgr = logging.getLogger('datalad.revolution.faststatus')
+
+# beyond this number of changed entries, passing them on to a regular
+# status query as path constraints is no longer worth it
+max_candidates = 1000
+
+
+def get_head_tree(path, git_dir):
+    """Return the ID of the tree of HEAD, or None on an unborn branch"""
+    head = read_ref(git_dir)
+    if head is None:
+        return None
+    tree = read_commit_tree(git_dir, head)
+    if tree is None:
+        # packed commit, ask Git
+        try:
+            out, err = GitRunner(cwd=path).run(
+                ['git', 'rev-parse', '--verify', '--quiet', 'HEAD^{tree}'],
+                expect_fail=True)
+        except CommandError:
+            return None
+        tree = out.strip() or None
+    return tree
+
+
+def index_matches_head(path, git_dir, idx):
+    """Whether the index of a repository has no staged changes"""
+    tree = idx.tree_sha()
+    if tree is not None:
+        return tree == get_head_tree(path, git_dir)
+    # the cache-tree is invalidated, ask Git to compare the trees
+    try:
+        GitRunner(cwd=path).run(
+            ['git', 'diff-index', '--cached', '--quiet', 'HEAD', '--'],
+            expect_fail=True)
+    except CommandError:
+        return False
+    return True
+
+
+def get_entry_type(path, entry):
+    """Report the type of an index entry, in terms of a status report"""
+    mode = entry.mode & MODE_TYPE_MASK
+    if mode == MODE_GITLINK:
+        return 'dataset'
+    if mode == MODE_SYMLINK:
+        try:
+            target = os.readlink(path)
+        except OSError:
+            return 'symlink'
+        # symlinks to annexed content are reported as files
+        return 'file' if '.git/annex/objects/' in target.replace(
+            os.sep, '/') else 'symlink'
+    return 'file'
+
+
+def fast_status(ds_path, query, refds_path=None, untracked='no',
+                trust_ctime=None, annotate=None, jobs=None):
+    """Status report of a single dataset, using the index as a fast path
+
+    Parameters
+    ----------
+    ds_path : str
+      Root of the dataset.
+    query : callable
+      Called with a list of absolute paths to obtain regular status
+      results for entries whose state cannot be determined from the
+      index alone.
+    refds_path : str, optional
+      Reported as 'refds'. Defaults to `ds_path`.
+    untracked : {'no', 'normal', 'all'}
+      How to report untracked content, see `untracked.iter_untracked()`.
+    trust_ctime : bool, optional
+      Whether to consider ctime changes. Defaults to the dataset's
+      core.trustctime setting.
+    annotate : callable, optional
+      Called with a list of all results for unmodified content that were
+      determined from the index. Can amend these results in-place (e.g.
+      with annex properties). Requires all results of the dataset to be
+      held in memory before they are yielded.
+    jobs : int or 'auto', optional
+      Number of threads hashing files, and listing directories for
+      untracked content.
+
+    Returns
+    -------
+    generator or None
+      None, if the fast path cannot be used (no index, or one that cannot
+      be read directly, see `gitindex.open_index()`, staged changes,
+      unmerged entries, or too many changed entries), and a regular status
+      query must be performed instead. Otherwise a generator of status
+      results in the order of a regular status query: untracked content
+      first, in Git's order, followed by all tracked content, in index
+      order.
+    """
+    git_dir = get_git_dir(ds_path)
+    idx = open_index(git_dir)
+    if idx is None:
+        return None
+    if trust_ctime is None:
+        trust_ctime = get_trust_ctime(ds_path)
+    cache = StatCache(git_dir)
+    try:
+        candidates = {}
+        # the state of a subdataset cannot be judged from its stat data
+        for entry, st in idx.changed(
+                ds_path, trust_ctime=trust_ctime, gitlinks=True):
+            if entry.stage:
+                lgr.debug('Unmerged entries in %s, no fast status', ds_path)
+                idx.close()
+                return None
+            if st is not None and \
+                    entry.mode & MODE_TYPE_MASK != MODE_GITLINK:
+                # stat data in the index may be outdated, while the
+                # content is known to be unchanged since it was last
+                # inspected
+                hit = cache.lookup(os.fsdecode(entry.path), st)
+                if hit is not None and hit[0] == hexsha(entry):
+                    continue
+            candidates[entry.path] = (entry, st)
+            if len(candidates) > max_candidates:
+                lgr.debug('Too many changed entries in %s, no fast status',
+                          ds_path)
+                idx.close()
+                return None
+        if not index_matches_head(ds_path, git_dir, idx):
+            lgr.debug('Index of %s does not match HEAD, no fast status',
+                      ds_path)
+            idx.close()
+            return None
+    except Exception:
+        idx.close()
+        raise
+    return _yield_fast_status(
+        ds_path, refds_path or ds_path, idx, candidates, query, untracked,
+        cache, annotate, jobs)
+
+
+def verify_candidates(ds_path, candidates, cache, jobs=None):
+    """Remove candidates whose content is found to be unmodified
+
+    Regular files are hashed (with `jobs` threads), and compared to the
+    Git blob in the index, or, for an unlocked annexed file, to the last
+    annex key recorded in the stat cache. The stat fingerprint of any
+    unmodified file is recorded.
+    """
+    blobs = {}
+    keys = {}
+    for p, (entry, st) in candidates.items():
+        if st is None or not stat.S_ISREG(st.st_mode) or \
+                entry.mode & MODE_TYPE_MASK != MODE_FILE:
+            continue
+        relpath = os.fsdecode(p)
+        path = op.join(ds_path, relpath)
+        rec = cache.recorded(relpath)
+        if rec is not None and rec[1] and rec[0] == hexsha(entry):
+            keys[path] = (p, rec[1])
+        elif st.st_size < large_file_threshold:
+            # larger files are annexed, the blob is a pointer file
+            blobs[path] = p
+    if not blobs and not keys:
+        return
+    stats = HashStats()
+    unmodified = []
+    for path, digest in hash_files(
+            blobs, 'sha1', jobs=jobs, stats=stats, git_blob=True):
+        p = blobs[path]
+        if digest == hexsha(candidates[p][0]):
+            unmodified.append((p, None))
+    for path, match in verify_annex_keys(
+            {path: key for path, (p, key) in keys.items()},
+            jobs=jobs, stats=stats):
+        if match:
+            unmodified.append(keys[path])
+    lgr.debug('Hashed %s in %s, %i unmodified', stats, ds_path,
+              len(unmodified))
+    for p, key in unmodified:
+        entry, st = candidates.pop(p)
+        cache.update(os.fsdecode(p), st, hexsha(entry), key)
+
+
+def _query_candidates(ds_path, candidates, query, cache, jobs):
+    queried = {}
+    verify_candidates(ds_path, candidates, cache, jobs)
+    if not candidates:
+        cache.flush()
+        return queried
+    for r in query([
+            op.join(ds_path, os.fsdecode(p)) for p in candidates]):
+        queried.setdefault(op.normpath(r['path']), []).append(r)
+    # remember the stat fingerprint of any file found to be unmodified
+    for p, (entry, st) in candidates.items():
+        if st is None:
+            continue
+        relpath = os.fsdecode(p)
+        for r in queried.get(op.normpath(op.join(ds_path, relpath)), []):
+            if r.get('state') == 'clean' and r.get('type') == 'file':
+                cache.update(relpath, st, hexsha(entry), r.get('key'))
+    cache.flush()
+    return queried
+
+
+def _yield_fast_status(ds_path, refds_path, idx, candidates, query,
+                       untracked, cache, annotate, jobs):
+    with idx:
+        if untracked != 'no':
+            # like a regular status query, untracked content is reported
+            # first, in Git's order
+            for relpath, type_ in sorted(
+                    iter_untracked(
+                        ds_path, untracked, jobs=jobs,
+                        tracked=collect_tracked(
+                            os.fsdecode(entry.path) for entry in idx)),
+                    key=git_order):
+                yield dict(
+                    action='status',
+                    path=op.normpath(op.join(ds_path, relpath)),
+                    type=type_,
+                    state='untracked',
+                    parentds=ds_path,
+                    refds=refds_path,
+                    status='ok',
+                )
+        queried = _query_candidates(ds_path, candidates, query, cache, jobs)
+        if annotate is None:
+            for r, fast in _iter_tracked(
+                    ds_path, refds_path, idx, candidates, queried):
+                yield r
+        else:
+            res = list(_iter_tracked(
+                ds_path, refds_path, idx, candidates, queried))
+            annotate([r for r, fast in res if fast])
+            for r, fast in res:
+                yield r
+            del res
+
+
+def _iter_tracked(ds_path, refds_path, idx, candidates, queried):
+    for entry in idx:
+        path = op.normpath(op.join(ds_path, os.fsdecode(entry.path)))
+        if entry.path in candidates:
+            for r in queried.pop(path, []):
+                yield r, False
+            continue
+        sha = hexsha(entry)
+        yield dict(
+            action='status',
+            path=path,
+            type=get_entry_type(path, entry),
+            state='clean',
+            gitshasum=sha,
+            prev_gitshasum=sha,
+            parentds=ds_path,
+            refds=refds_path,
+            status='ok',
+        ), True
+    # anything that was reported for a candidate path, but not under
+    # its exact name
+    for res in queried.values():
+        for r in res:
+            yield r, False
@@ -0,0 +1,284 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Evaluation of Git's ignore rules without calling Git
+
+Supports the pattern syntax documented in gitignore(5), read from
+per-directory `.gitignore` files, `$GIT_DIR/info/exclude`, and a global
+excludes file. The latter is Git's default one, unless a caller passes
+the file configured as `core.excludesFile` (see
+`config.get_excludes_file()`).
+
+The rules of each ignore file are compiled once into a combined regular
+expression, and cached process-wide until the file changes. Datasets of a
+hierarchy (and repeated status queries) share these compiled rules.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import re
+import threading
+
+from .utils import file_fingerprint
+
+lgr = logging.getLogger('datalad.revolution.gitignore')
+
+
+def translate(pattern):
+    """Translate a single gitignore pattern into a regular expression
+
+    Parameters
+    ----------
+    pattern : str
+      A pattern with leading '!' and trailing '/' already removed.
+
+    Returns
+    -------
+    str
+      Regular expression that matches the full path relative to the
+      directory the pattern was defined in.
+    """
+    # a pattern without a slash (other than a trailing one, which is
+    # already removed) matches at any level
+    anchored = '/' in pattern
+    if pattern.startswith('/'):
+        pattern = pattern[1:]
+    res = [] if anchored else ['(?:.*/)?']
+    i, n = 0, len(pattern)
+    while i < n:
+        c = pattern[i]
+        if c == '*':
+            if pattern[i:i + 3] == '**/' and (i == 0 or pattern[i - 1] == '/'):
+                # any number of leading directories
+                res.append('(?:.*/)?')
+                i += 3
+                continue
+            if pattern[i:i + 2] == '**' and i + 2 == n and \
+                    (i == 0 or pattern[i - 1] == '/'):
+                # everything inside
+                res.append('.*')
+                i += 2
+                continue
+            res.append('[^/]*')
+        elif c == '?':
+            res.append('[^/]')
+        elif c == '[':
+            j = pattern.find(']', i + 2 if pattern[i + 1:i + 2] in
+                             ('!', '^', ']') else i + 1)
+            if j < 0:
+                res.append(re.escape(c))
+            else:
+                cls = pattern[i + 1:j]
+                if cls[0] in ('!', '^'):
+                    cls = '^' + cls[1:]
+                res.append('[' + cls.replace('\\', '\\\\') + ']')
+                i = j
+        elif c == '\\' and i + 1 < n:
+            i += 1
+            res.append(re.escape(pattern[i]))
+        else:
+            res.append(re.escape(c))
+        i += 1
+    return ''.join(res)
+
+
+def parse_rules(lines):
+    """Parse the lines of an ignore file
+
+    Yields
+    ------
+    (str, bool, bool)
+      Regular expression (see `translate()`), whether the pattern is
+      negated, and whether it only matches directories.
+    """
+    for line in lines:
+        line = line.rstrip('\n\r')
+        if not line or line.startswith('#'):
+            continue
+        # trailing spaces are ignored, unless escaped
+        stripped = line.rstrip(' ')
+        if stripped.endswith('\\') and len(stripped) < len(line):
+            stripped += ' '
+        line = stripped
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+        yield translate(line), negate, dir_only
+
+
+def read_rules(path):
+    """Read and parse an ignore file, returns an empty list if missing"""
+    try:
+        with open(path) as f:
+            return list(parse_rules(f))
+    except (IOError, OSError, UnicodeDecodeError):
+        return []
+
+
+class RuleSet(object):
+    """Compiled rules of a single ignore file
+
+    All rules of a file are combined into a single regular expression
+    (one for files, one for directories), with one capturing group per
+    rule. Rules are alternated in reverse order, such that the first
+    matching alternative is the rule with the highest precedence.
+
+    Parameters
+    ----------
+    rules : list
+      As returned by `parse_rules()`.
+    """
+    __slots__ = ('_file_rx', '_file_negate', '_dir_rx', '_dir_negate')
+
+    def __init__(self, rules):
+        rules = list(reversed(rules))
+        self._dir_rx, self._dir_negate = self._compile(rules)
+        self._file_rx, self._file_negate = self._compile(
+            [r for r in rules if not r[2]])
+
+    @staticmethod
+    def _compile(rules):
+        if not rules:
+            return None, None
+        # patterns only use non-capturing groups, so group N is rule N
+        rx = re.compile('|'.join('({})'.format(r[0]) for r in rules))
+        return rx, [None] + [r[1] for r in rules]
+
+    def match(self, path, is_dir=False):
+        """Match a path relative to the directory of the ignore file
+
+        Returns
+        -------
+        bool or None
+          True if the path is ignored, False if it is explicitly not
+          ignored (negated rule), None if no rule matches.
+        """
+        rx, negate = (self._dir_rx, self._dir_negate) if is_dir \
+            else (self._file_rx, self._file_negate)
+        if rx is None:
+            return None
+        m = rx.fullmatch(path)
+        if m is None:
+            return None
+        return not negate[m.lastindex]
+
+
+# path -> (stat fingerprint, RuleSet or None)
+_rule_sets = {}
+_rule_sets_lock = threading.Lock()
+
+
+def get_rule_set(path):
+    """Return the compiled rules of an ignore file
+
+    Compiled rules are cached for the lifetime of the process, and shared
+    by all datasets. A cache entry is invalidated when the file's
+    modification time, change time, size, or inode change.
+
+    Returns
+    -------
+    RuleSet or None
+      None, if the file does not exist, or does not define any rule.
+    """
+    fp = file_fingerprint(path)
+    if fp is None:
+        return None
+    cached = _rule_sets.get(path)
+    if cached is not None and cached[0] == fp:
+        return cached[1]
+    rules = read_rules(path)
+    rule_set = RuleSet(rules) if rules else None
+    with _rule_sets_lock:
+        _rule_sets[path] = (fp, rule_set)
+    return rule_set
+
+
+def get_excludes_file():
+    """Return the path of Git's default global excludes file"""
+    return op.join(
+        os.environ.get('XDG_CONFIG_HOME', None) or
+        op.join(op.expanduser('~'), '.config'),
+        'git', 'ignore')
+
+
+class IgnoreMatcher(object):
+    """Matcher for the ignore rules effective in one directory
+
+    Matchers are chained: `for_directory()` returns a matcher that adds
+    the rules of a subdirectory's `.gitignore` to those of its parent.
+
+    Parameters
+    ----------
+    levels : list
+      (base, RuleSet) tuples, in order of increasing precedence. `base`
+      is the directory (relative to the work tree root, with trailing
+      slash, or empty) the rules were defined in.
+    """
+    __slots__ = ('_levels',)
+
+    def __init__(self, levels):
+        self._levels = levels
+
+    @classmethod
+    def for_worktree(cls, worktree, git_dir=None, excludes_file=None):
+        """Create a matcher for the root directory of a work tree
+
+        Parameters
+        ----------
+        worktree : str
+        git_dir : str, optional
+          Used to locate `info/exclude`.
+        excludes_file : str, optional
+          Path of a global excludes file (core.excludesFile). Defaults to
+          Git's default location.
+        """
+        sources = [excludes_file or get_excludes_file()]
+        if git_dir:
+            sources.append(op.join(git_dir, 'info', 'exclude'))
+        sources.append(op.join(worktree, '.gitignore'))
+        levels = []
+        for src in sources:
+            rule_set = get_rule_set(src)
+            if rule_set is not None:
+                levels.append(('', rule_set))
+        return cls(levels)
+
+    def for_directory(self, worktree, reldir):
+        """Matcher for a subdirectory, including its own `.gitignore`"""
+        rule_set = get_rule_set(op.join(worktree, reldir, '.gitignore'))
+        if rule_set is None:
+            return self
+        return IgnoreMatcher(
+            self._levels + [(reldir.rstrip('/') + '/', rule_set)])
+
+    def is_ignored(self, relpath, is_dir=False):
+        """Whether a path (relative to the work tree root) is ignored
+
+        The path's parent directories must not be ignored themselves,
+        i.e. the caller is expected to not descend into ignored directories.
+        """
+        for base, rule_set in reversed(self._levels):
+            if base:
+                if not relpath.startswith(base):
+                    continue
+                res = rule_set.match(relpath[len(base):], is_dir)
+            else:
+                res = rule_set.match(relpath, is_dir)
+            if res is not None:
+                return res
+        return False
+
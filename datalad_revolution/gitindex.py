@@ -0,0 +1,547 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Direct, read-only access to Git's index file and refs
+
+The index file (format versions 2 to 4) is memory-mapped and entries are
+parsed lazily, one at a time. This is used as a fast path to determine
+which tracked files have changed stat data, without a `git ls-files` or
+`git status` subprocess. Only SHA-1 repositories are supported, and
+neither split nor sparse indexes (see `open_index()`), callers must fall
+back to querying Git for those, and for indexes with entries that are
+not in the work tree or not really staged (extended flags).
+
+See Documentation/technical/index-format.txt in the Git sources for the
+format specification.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import glob
+import logging
+import mmap
+import os
+import os.path as op
+import stat
+import struct
+import zlib
+from binascii import hexlify
+from collections import namedtuple
+
+lgr = logging.getLogger('datalad.revolution.gitindex')
+
+
+# ctime s/ns, mtime s/ns, dev, ino, mode, uid, gid, size, sha1, flags
+_entry_struct = struct.Struct('>10I20sH')
+_entry_header_size = _entry_struct.size
+_header_struct = struct.Struct('>4sII')
+_ext_header_struct = struct.Struct('>4sI')
+_sha_size = 20
+
+# entry flags
+_FLAG_EXTENDED = 0x4000
+_FLAG_STAGE_MASK = 0x3000
+_FLAG_NAME_MASK = 0x0fff
+
+# object modes
+MODE_FILE = 0o100000
+MODE_GITLINK = 0o160000
+MODE_SYMLINK = 0o120000
+MODE_TYPE_MASK = 0o170000
+
+
+class IndexEntry(namedtuple(
+        'IndexEntry',
+        ['ctime_s', 'ctime_ns', 'mtime_s', 'mtime_ns', 'dev', 'ino', 'mode',
+         'uid', 'gid', 'size', 'sha', 'flags', 'path'])):
+    """A single index entry
+
+    `path` is the raw (bytes) path relative to the work tree root, `sha`
+    the raw 20-byte object ID (see `hexsha()`). All stat values are
+    truncated to 32 bit, as recorded in the index.
+    """
+    __slots__ = ()
+
+    @property
+    def stage(self):
+        return (self.flags & _FLAG_STAGE_MASK) >> 12
+
+
+def hexsha(entry):
+    """Return the hex object ID of an index entry"""
+    return hexlify(entry.sha).decode('ascii')
+
+
+class GitIndex(object):
+    """Lazy reader for a Git index file
+
+    Usage::
+
+      with GitIndex(op.join(git_dir, 'index')) as idx:
+          for entry in idx:
+              ...
+
+    Parameters
+    ----------
+    path : str
+      Path to the index file.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._map = None
+        self._fd = os.open(path, os.O_RDONLY)
+        try:
+            st = os.fstat(self._fd)
+            self.mtime_s = int(st.st_mtime)
+            self.mtime_ns = st.st_mtime_ns % 1000000000
+            self._map = mmap.mmap(self._fd, 0, access=mmap.ACCESS_READ)
+        except Exception:
+            os.close(self._fd)
+            raise
+        sig, self.version, self._count = _header_struct.unpack_from(
+            self._map, 0)
+        if sig != b'DIRC' or self.version not in (2, 3, 4):
+            self.close()
+            raise ValueError(
+                'Unsupported index file format at {}'.format(path))
+        self._entries_end = None
+        self._extended = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+            os.close(self._fd)
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        # this loop is as tight as it gets, avoid any per-entry
+        # overhead beyond unpacking the fixed-size entry header
+        m = self._map
+        unpack = _entry_struct.unpack_from
+        new_entry = tuple.__new__
+        v4 = self.version == 4
+        offset = _header_struct.size
+        prev = b''
+        extended = False
+        for i in range(self._count):
+            fields = unpack(m, offset)
+            flags = fields[11]
+            pos = offset + _entry_header_size
+            if flags & _FLAG_EXTENDED:
+                pos += 2
+                extended = True
+            if v4:
+                # prefix-compressed name: number of bytes to strip from
+                # the previous name, followed by the NUL-terminated suffix
+                strip, pos = _read_varint(m, pos)
+                end = m.find(b'\0', pos)
+                path = prev[:len(prev) - strip] + m[pos:end]
+                prev = path
+                offset = end + 1
+            else:
+                namelen = flags & _FLAG_NAME_MASK
+                if namelen == _FLAG_NAME_MASK:
+                    end = m.find(b'\0', pos)
+                else:
+                    end = pos + namelen
+                path = m[pos:end]
+                # entries are NUL-padded to a multiple of 8 bytes
+                offset += (end - offset + 8) & ~7
+            yield new_entry(IndexEntry, fields + (path,))
+        self._entries_end = offset
+        self._extended = extended
+
+    def _skip_entries(self):
+        if self._entries_end is None:
+            for e in self:
+                pass
+        return self._entries_end
+
+    def has_extended_flags(self):
+        """Whether any entry has extended flags
+
+        These are entries that are not in the work tree (skip-worktree),
+        or not really staged (intent-to-add).
+        """
+        self._skip_entries()
+        return self._extended
+
+    def iter_extensions(self):
+        """Yield (signature, offset, size) for all index extensions"""
+        offset = self._skip_entries()
+        end = len(self._map) - _sha_size
+        while offset + _ext_header_struct.size <= end:
+            sig, size = _ext_header_struct.unpack_from(self._map, offset)
+            offset += _ext_header_struct.size
+            yield sig, offset, size
+            offset += size
+
+    def tree_sha(self):
+        """Return the hex ID of the tree object corresponding to the index
+
+        This is read from the cache-tree ('TREE') extension.
+
+        Returns
+        -------
+        str or None
+          None, if there is no cache-tree extension, or it is invalidated
+          for the root directory.
+        """
+        for sig, offset, size in self.iter_extensions():
+            if sig != b'TREE':
+                continue
+            m = self._map
+            # root entry: empty path, NUL, entry count, space,
+            # subtree count, newline, object ID (if entry count >= 0)
+            nul = m.find(b'\0', offset, offset + size)
+            nl = m.find(b'\n', nul, offset + size)
+            if nul != offset or nl < 0:
+                return None
+            counts = m[nul + 1:nl].split(b' ')
+            if int(counts[0]) < 0:
+                return None
+            return hexlify(m[nl + 1:nl + 1 + _sha_size]).decode('ascii')
+        return None
+
+    def is_racy(self, entry):
+        """Whether an entry was modified too close to the index write
+
+        Stat data of such entries cannot be trusted to indicate an
+        unmodified file.
+        """
+        return (entry.mtime_s, entry.mtime_ns) >= \
+            (self.mtime_s & 0xffffffff, self.mtime_ns)
+
+    def changed(self, worktree, trust_ctime=True, gitlinks=False):
+        """Report entries whose work tree stat data does not match the index
+
+        Work tree directories are listed with `os.scandir()` once, and
+        only the listings of the current directory and its parents are
+        kept around at any time.
+
+        Parameters
+        ----------
+        worktree : str
+          Path to the root of the work tree.
+        trust_ctime : bool
+          Whether to consider ctime changes (see Git's core.trustctime).
+        gitlinks : bool
+          If True, gitlink (submodule) entries are always reported, as
+          their state cannot be judged from stat data.
+
+        Yields
+        ------
+        IndexEntry, os.stat_result or None
+          For every entry that is unmerged, racily clean, or whose type,
+          size, timestamps, or inode differ from the work tree. `None`
+          is reported instead of a stat result for entries that are
+          missing from the work tree.
+        """
+        listings = _DirListings(os.fsencode(worktree))
+        for entry in self:
+            st = listings.stat(entry.path)
+            if gitlinks and entry.mode & MODE_TYPE_MASK == MODE_GITLINK:
+                yield entry, st
+            elif st is None or entry.stage or self.is_racy(entry) or \
+                    not stat_matches(entry, st, trust_ctime):
+                yield entry, st
+
+
+def open_index(git_dir):
+    """Open the index of a repository, if it can be read directly
+
+    Parameters
+    ----------
+    git_dir : str or None
+
+    Returns
+    -------
+    GitIndex or None
+      None, if there is no index, or if the repository or its index use
+      features that are not supported: SHA-256 object IDs, a split index
+      (whose entries are spread over several files), a sparse checkout
+      or index (whose entries do not match the work tree), or entries with
+      extended flags (skip-worktree, intent-to-add).
+    """
+    if git_dir is None:
+        return None
+    index_path = op.join(git_dir, 'index')
+    if not op.exists(index_path):
+        return None
+    # only imported here, configuration reading needs this module
+    from .config import (
+        DatasetConfig,
+        get_system_config_files,
+        read_config_file,
+    )
+    common_dir = get_common_dir(git_dir)
+    items = []
+    try:
+        for f in get_system_config_files() + [
+                op.join(common_dir, 'config'),
+                op.join(git_dir, 'config.worktree')]:
+            items.extend(read_config_file(f))
+        cfg = DatasetConfig(items)
+        unsupported = \
+            (cfg.get('extensions.objectformat') or 'sha1').lower() \
+            != 'sha1' or \
+            cfg.getbool('core.splitindex', False) or \
+            cfg.getbool('core.sparsecheckout', False) or \
+            cfg.getbool('index.sparse', False)
+    except ValueError as e:
+        lgr.debug('Cannot evaluate configuration of %s: %s', git_dir, e)
+        unsupported = True
+    if unsupported:
+        lgr.debug('Unsupported repository features in %s', git_dir)
+        return None
+    try:
+        idx = GitIndex(index_path)
+    except ValueError as e:
+        lgr.debug('%s', e)
+        return None
+    if glob.glob(op.join(git_dir, 'sharedindex.*')):
+        # the index may still be split, even though it is no longer
+        # configured
+        if any(sig in (b'link', b'sdir')
+               for sig, offset, size in idx.iter_extensions()):
+            lgr.debug('Split index in %s', git_dir)
+            idx.close()
+            return None
+    # extended flags require format version 3 or later
+    if idx.version > 2 and idx.has_extended_flags():
+        lgr.debug('Extended index entry flags in %s', git_dir)
+        idx.close()
+        return None
+    return idx
+
+
+def iter_staged(worktree, git_dir=None):
+    """Yield the path, mode, object ID, and stage of all index entries
+
+    The index is read directly if possible (see `open_index()`), and with
+    `git ls-files` otherwise.
+
+    Yields
+    ------
+    (bytes, int, str, int)
+      Path relative to the work tree root ('/' as separator), mode, hex
+      object ID, and merge stage, in index order.
+    """
+    if git_dir is None:
+        git_dir = get_git_dir(worktree)
+    idx = open_index(git_dir)
+    if idx is not None:
+        with idx:
+            for entry in idx:
+                yield entry.path, entry.mode, hexsha(entry), entry.stage
+        return
+    if git_dir is None or not op.exists(op.join(git_dir, 'index')):
+        return
+    # only imported here, this module does not need DataLad otherwise
+    from datalad.cmd import GitRunner
+    out, err = GitRunner(cwd=worktree).run(
+        ['git', 'ls-files', '--stage', '-z'])
+    for line in out.split('\0'):
+        if not line:
+            continue
+        # <mode> SP <object> SP <stage> TAB <path>
+        props, path = line.split('\t', 1)
+        mode, sha, stage = props.split(' ')
+        yield os.fsencode(path), int(mode, 8), sha, int(stage)
+
+
+def stat_matches(entry, st, trust_ctime=True):
+    """Whether a stat result matches the stat data of an index entry"""
+    mode = entry.mode & MODE_TYPE_MASK
+    if mode == MODE_GITLINK:
+        # a subdataset, its state cannot be judged by stat data
+        return stat.S_ISDIR(st.st_mode)
+    if mode == MODE_SYMLINK:
+        if not stat.S_ISLNK(st.st_mode):
+            return False
+    elif not stat.S_ISREG(st.st_mode) or \
+            bool(st.st_mode & 0o100) != bool(entry.mode & 0o100):
+        return False
+    if entry.size != st.st_size & 0xffffffff:
+        return False
+    if (entry.mtime_s, entry.mtime_ns) != (
+            int(st.st_mtime) & 0xffffffff, st.st_mtime_ns % 1000000000):
+        return False
+    if trust_ctime and (entry.ctime_s, entry.ctime_ns) != (
+            int(st.st_ctime) & 0xffffffff, st.st_ctime_ns % 1000000000):
+        return False
+    # not recorded on all platforms
+    if entry.ino and entry.ino != st.st_ino & 0xffffffff:
+        return False
+    if entry.dev and entry.dev != st.st_dev & 0xffffffff:
+        return False
+    return True
+
+
+def scandir(path):
+    """Return all entries of a directory, as listed by `os.scandir()`
+
+    The listing is read completely, which closes the directory on all
+    supported Python versions (the iterator is only a context manager
+    since Python 3.6).
+    """
+    return list(os.scandir(path))
+
+
+class _DirListings(object):
+    """Cache of `os.scandir()` results for a path in sorted traversal"""
+    def __init__(self, root):
+        self._root = root
+        self._listings = {}
+
+    def _get(self, dirpath):
+        listing = self._listings.get(dirpath)
+        if listing is None:
+            # drop all listings that are not of a parent directory,
+            # they cannot be needed again when iterating sorted paths
+            for d in [d for d in self._listings
+                      if not dirpath.startswith(d + b'/') and d != b'']:
+                del self._listings[d]
+            try:
+                listing = dict((e.name, e) for e in scandir(
+                    op.join(self._root, dirpath) if dirpath else self._root))
+            except OSError:
+                listing = {}
+            self._listings[dirpath] = listing
+        return listing
+
+    def stat(self, path):
+        dirpath, _, name = path.rpartition(b'/')
+        e = self._get(dirpath).get(name)
+        if e is None:
+            return None
+        try:
+            return e.stat(follow_symlinks=False)
+        except OSError:
+            return None
+
+
+def _read_varint(m, pos):
+    # Git's offset varint encoding, as used for index v4 path compression
+    c = m[pos]
+    pos += 1
+    val = c & 0x7f
+    while c & 0x80:
+        c = m[pos]
+        pos += 1
+        val = ((val + 1) << 7) | (c & 0x7f)
+    return val, pos
+
+
+def get_git_dir(path):
+    """Return the path of the Git directory of a repository work tree
+
+    Supports `.git` directories and `.git` files pointing elsewhere (as
+    used for submodules and linked work trees).
+
+    Returns
+    -------
+    str or None
+    """
+    dot_git = op.join(path, '.git')
+    if op.isdir(dot_git):
+        return dot_git
+    try:
+        with open(dot_git) as f:
+            line = f.readline().strip()
+    except (IOError, OSError):
+        return None
+    if not line.startswith('gitdir:'):
+        return None
+    return op.normpath(op.join(path, line[7:].strip()))
+
+
+def get_common_dir(git_dir):
+    """Return the Git directory shared by all work trees of a repository"""
+    try:
+        with open(op.join(git_dir, 'commondir')) as f:
+            return op.normpath(op.join(git_dir, f.read().strip()))
+    except (IOError, OSError):
+        return git_dir
+
+
+def read_ref(git_dir, ref='HEAD'):
+    """Resolve a ref to a commit ID, by reading loose and packed refs
+
+    Parameters
+    ----------
+    git_dir : str
+    ref : str
+      Full ref name, or 'HEAD'.
+
+    Returns
+    -------
+    str or None
+      None if the ref cannot be resolved, e.g. on an unborn branch.
+    """
+    common_dir = get_common_dir(git_dir)
+    for i in range(10):
+        # HEAD and other pseudo refs are per work tree
+        d = git_dir if '/' not in ref else common_dir
+        try:
+            with open(op.join(d, ref)) as f:
+                content = f.read().strip()
+        except (IOError, OSError):
+            return _read_packed_ref(common_dir, ref)
+        if content.startswith('ref:'):
+            ref = content[4:].strip()
+            continue
+        return content or None
+    # symref loop
+    return None
+
+
+def _read_packed_ref(common_dir, ref):
+    try:
+        with open(op.join(common_dir, 'packed-refs')) as f:
+            for line in f:
+                if line.startswith(('#', '^')):
+                    continue
+                parts = line.split()
+                if len(parts) == 2 and parts[1] == ref:
+                    return parts[0]
+    except (IOError, OSError):
+        pass
+    return None
+
+
+def read_commit_tree(git_dir, commit):
+    """Return the tree ID of a commit, if it is stored as a loose object
+
+    Returns
+    -------
+    str or None
+      None, if the commit is not available as a loose object (e.g. it
+      is packed), or cannot be read.
+    """
+    obj = op.join(get_common_dir(git_dir), 'objects', commit[:2], commit[2:])
+    try:
+        with open(obj, 'rb') as f:
+            # the tree is on the first line after the object header,
+            # no need to inflate the whole commit
+            head = zlib.decompressobj().decompress(f.read(256), 128)
+    except (IOError, OSError, zlib.error):
+        return None
+    hdr, _, body = head.partition(b'\0')
+    if not hdr.startswith(b'commit ') or not body.startswith(b'tree '):
+        return None
+    return body[5:45].decode('ascii')
@@ -0,0 +1,259 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Parallel content hashing
+
+Files are hashed on a thread pool. Small files are read into a reusable
+buffer per thread, large files are memory-mapped, such that neither
+requires a copy of the file content in Python. `hashlib` releases the GIL
+while hashing, hence threads hash in parallel. Annex keys for the
+hash-based git-annex backends can be computed from the hashes.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import hashlib
+import logging
+import mmap
+import os
+import os.path as op
+import re
+import threading
+import time
+from concurrent.futures import (
+    ThreadPoolExecutor,
+    as_completed,
+)
+
+from .hierarchy import get_jobs
+
+lgr = logging.getLogger('datalad.revolution.hashing')
+
+# files of at least this size are memory-mapped
+large_file_threshold = 64 * 1024 * 1024
+_bufsize = 1024 * 1024
+
+# git-annex backend name -> hashlib algorithm
+annex_backends = {
+    'MD5': 'md5',
+    'SHA1': 'sha1',
+    'SHA256': 'sha256',
+    'SHA512': 'sha512',
+}
+
+_ext_regex = re.compile(r'^[a-zA-Z0-9]{1,4}$')
+_buffers = threading.local()
+
+
+class HashStats(object):
+    """Accounting of a hashing run"""
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.start = time.time()
+        self.end = None
+        self._lock = threading.Lock()
+
+    def add(self, size):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    @property
+    def duration(self):
+        return (self.end or time.time()) - self.start
+
+    @property
+    def throughput(self):
+        """Bytes per second"""
+        return self.bytes / self.duration if self.duration else 0.0
+
+    def __str__(self):
+        return '{} files, {:.1f} MB in {:.2f} s ({:.1f} MB/s)'.format(
+            self.files, self.bytes / 1e6, self.duration,
+            self.throughput / 1e6)
+
+
+def hash_file(path, algorithm='md5', git_blob=False):
+    """Compute the hex digest of a file's content
+
+    Large files are memory-mapped and hashed in one go, anything else is
+    read in chunks into a buffer that is reused by the calling thread.
+
+    Parameters
+    ----------
+    path : str
+    algorithm : str
+      Any algorithm supported by `hashlib`.
+    git_blob : bool
+      If True, compute the ID of a Git blob object with the file's content
+      instead (`algorithm` must match the hash function of the repository,
+      i.e. 'sha1').
+
+    Returns
+    -------
+    str
+    """
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if git_blob:
+            h.update(b'blob %d\0' % size)
+        if size >= large_file_threshold:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                h.update(m)
+            return h.hexdigest()
+        buf = getattr(_buffers, 'buf', None)
+        if buf is None:
+            buf = _buffers.buf = memoryview(bytearray(_bufsize))
+        readinto = f.readinto
+        update = h.update
+        n = readinto(buf)
+        while n:
+            update(buf[:n])
+            n = readinto(buf)
+    return h.hexdigest()
+
+
+def hash_files(paths, algorithm='md5', jobs='auto', stats=None,
+               git_blob=False):
+    """Hash many files in parallel
+
+    Parameters
+    ----------
+    paths : iterable
+    algorithm : str
+      Any algorithm supported by `hashlib`.
+    jobs : int or 'auto'
+      Number of threads to use.
+    stats : HashStats, optional
+      Updated with the number of files and bytes hashed.
+    git_blob : bool
+      Compute Git blob IDs, see `hash_file()`.
+
+    Yields
+    ------
+    (str, str or Exception)
+      Path and hex digest, or the exception raised when reading the file,
+      in order of completion.
+    """
+    jobs = get_jobs(jobs)
+    if stats is None:
+        stats = HashStats()
+    small, large = [], []
+    for p in paths:
+        try:
+            size = os.stat(p).st_size
+        except OSError as e:
+            yield p, e
+            continue
+        (large if size >= large_file_threshold else small).append((p, size))
+
+    threads = ThreadPoolExecutor(max_workers=jobs)
+    try:
+        futures = {}
+        # large files first, they take longest
+        for p, size in large + small:
+            futures[threads.submit(
+                hash_file, p, algorithm, git_blob)] = (p, size)
+        for f in as_completed(futures):
+            p, size = futures[f]
+            try:
+                digest = f.result()
+            except Exception as e:
+                yield p, e
+                continue
+            stats.add(size)
+            yield p, digest
+    finally:
+        threads.shutdown(wait=True)
+        stats.end = time.time()
+        lgr.debug('Hashed %s', stats)
+
+
+def get_key_extension(path):
+    """Return the extension git-annex uses for a file in an *E backend key
+
+    Up to two extensions of one to four alphanumeric characters each are
+    considered, e.g. '.tar.gz'.
+    """
+    name = op.basename(path)
+    parts = name.split('.')[1:]
+    exts = []
+    for p in reversed(parts[-2:]):
+        if not _ext_regex.match(p):
+            break
+        exts.insert(0, p)
+    return ''.join('.' + e for e in exts)
+
+
+def get_annex_key(path, backend, digest, size):
+    """Return the annex key of a file, given its content hash and size
+
+    Parameters
+    ----------
+    path : str
+      Only used to determine the extension for *E backends.
+    backend : str
+      E.g. 'MD5E', 'SHA256'.
+    digest : str
+    size : int
+    """
+    ext = get_key_extension(path) if backend.endswith('E') else ''
+    return '{}-s{}--{}{}'.format(backend, size, digest, ext)
+
+
+def get_key_backend(key):
+    """Return the backend of an annex key, and the hash algorithm
+
+    Returns
+    -------
+    (str, str or None)
+      Backend name, and the name of the corresponding `hashlib`
+      algorithm, or None for non-hash backends (e.g. URL, WORM).
+    """
+    backend = key.split('-', 1)[0]
+    return backend, annex_backends.get(
+        backend[:-1] if backend.endswith('E') else backend)
+
+
+def verify_annex_keys(files, jobs='auto', stats=None):
+    """Check whether files match given annex keys, by hashing their content
+
+    Parameters
+    ----------
+    files : dict
+      Mapping of file paths to annex keys.
+    jobs : int or 'auto'
+      Number of threads to use, see `hash_files()`.
+    stats : HashStats, optional
+      Updated with the number of files and bytes hashed.
+
+    Yields
+    ------
+    (str, bool)
+      Path and whether its content matches the key. Files with keys of
+      backends that are not hash-based are reported as not matching.
+    """
+    by_algorithm = {}
+    for path, key in files.items():
+        backend, algorithm = get_key_backend(key)
+        if algorithm is None:
+            yield path, False
+            continue
+        by_algorithm.setdefault(algorithm, []).append(path)
+    for algorithm, paths in by_algorithm.items():
+        for path, digest in hash_files(
+                paths, algorithm, jobs=jobs, stats=stats):
+            if isinstance(digest, Exception):
+                yield path, False
+                continue
+            key = files[path]
+            backend = get_key_backend(key)[0]
+            yield path, key == get_annex_key(
+                path, backend, digest, os.stat(path).st_size)
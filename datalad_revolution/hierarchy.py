@@ -0,0 +1,310 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Parallel traversal of dataset hierarchies
+
+Recursive commands process one dataset at a time, and learn about the
+subdatasets to descend into from the results of the superdataset. The
+traversal engine in this module dispatches such per-dataset work to a
+pool of worker threads with work stealing: subdatasets discovered by a
+worker are queued with that worker (depth-first), idle workers steal
+the oldest queued work of others (breadth-first). This keeps all workers
+busy on deep hierarchies with uneven fan-out, while results are still
+reported in the order of a serial traversal.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import multiprocessing
+import os.path as op
+import random
+import threading
+from bisect import bisect_left
+from collections import deque
+
+from six import text_type
+
+lgr = logging.getLogger('datalad.revolution.hierarchy')
+
+
+class WorkStealingPool(object):
+    """Thread pool with one work queue per worker
+
+    Work submitted from within a worker thread is added to that worker's
+    own queue, and taken from it LIFO. Work submitted from any other
+    thread is distributed round-robin. Workers without work steal from
+    the other end of another worker's queue.
+
+    Parameters
+    ----------
+    jobs : int
+      Number of worker threads.
+    """
+    def __init__(self, jobs):
+        self.jobs = max(1, jobs)
+        self._queues = [deque() for i in range(self.jobs)]
+        self._cond = threading.Condition()
+        self._local = threading.local()
+        self._pending = 0
+        self._next = 0
+        self._cancelled = False
+        self._stopped = False
+        self._threads = [
+            threading.Thread(
+                target=self._work,
+                args=(i,),
+                name='datalad-revolution-worker-{}'.format(i))
+            for i in range(self.jobs)
+        ]
+        for t in self._threads:
+            t.daemon = True
+            t.start()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def submit(self, fn, *args):
+        """Queue a call of `fn(*args)`"""
+        with self._cond:
+            if self._cancelled or self._stopped:
+                return
+            idx = getattr(self._local, 'idx', None)
+            if idx is None:
+                idx = self._next
+                self._next = (self._next + 1) % self.jobs
+            self._queues[idx].append((fn, args))
+            self._pending += 1
+            self._cond.notify()
+
+    def cancel(self):
+        """Drop all queued work, work in progress is not interrupted"""
+        with self._cond:
+            self._cancelled = True
+            for q in self._queues:
+                self._pending -= len(q)
+                q.clear()
+            self._cond.notify_all()
+
+    def wait(self):
+        """Block until all submitted work is done"""
+        with self._cond:
+            while self._pending:
+                self._cond.wait()
+
+    def shutdown(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+        for t in self._threads:
+            if t is not threading.current_thread():
+                t.join()
+
+    def _get_work(self, idx):
+        # must be called with the lock held
+        own = self._queues[idx]
+        if own:
+            return own.pop()
+        victims = [q for q in self._queues if q]
+        if victims:
+            return random.choice(victims).popleft()
+        return None
+
+    def _work(self, idx):
+        self._local.idx = idx
+        while True:
+            with self._cond:
+                work = self._get_work(idx)
+                while work is None:
+                    if self._stopped:
+                        return
+                    self._cond.wait()
+                    work = self._get_work(idx)
+            fn, args = work
+            try:
+                fn(*args)
+            except Exception as e:  # pragma: no cover
+                # callers are expected to handle their errors
+                lgr.debug('Unhandled exception in worker: %s', e)
+            finally:
+                with self._cond:
+                    self._pending -= 1
+                    self._cond.notify_all()
+
+
+class _Node(object):
+    __slots__ = ('path', 'args', 'depth', 'results', 'children', 'error',
+                 'done')
+
+    def __init__(self, path, args, depth):
+        self.path = path
+        self.args = args
+        self.depth = depth
+        self.results = None
+        self.children = []
+        self.error = None
+        self.done = threading.Event()
+
+
+def get_jobs(jobs):
+    """Turn a `jobs` parameter value into a number of worker threads"""
+    if jobs is None:
+        return 1
+    if jobs == 'auto':
+        try:
+            return multiprocessing.cpu_count()
+        except NotImplementedError:
+            return 1
+    return max(1, int(jobs))
+
+
+def traverse_hierarchy(root, process, discover, recursion_limit=None,
+                       jobs=None, args=()):
+    """Process a dataset hierarchy, dataset by dataset
+
+    Parameters
+    ----------
+    root : path
+      Root dataset of the hierarchy.
+    process : callable
+      Called as `process(path, *args)` for each dataset, must return a
+      list of result records (dicts with a 'path' property). `args` are
+      those given for the root dataset, and whatever `discover` returned
+      for any subdataset.
+    discover : callable
+      Called as `discover(path, results)` with the results of `process`
+      for a dataset. Must return an iterable of `(subdataset_path, args)`
+      tuples for all subdatasets that shall be processed next.
+    recursion_limit : int, optional
+      Maximum number of levels to descend below the root dataset.
+    jobs : int or 'auto', optional
+      Number of worker threads. With a single job (the default) the
+      hierarchy is processed serially in the calling thread. Otherwise
+      `process` and `discover` must be thread-safe. A subdataset is
+      only processed once `process` and `discover` are done for its
+      superdataset, and instances shared by both (see `repopool`) are
+      never used concurrently.
+    args : tuple, optional
+      Arguments for processing the root dataset.
+
+    Yields
+    ------
+    dict
+      Results of all datasets, in the order of a serial depth-first
+      traversal: the results of a subdataset directly follow the result
+      record of the superdataset that has the subdataset's path, or
+      follow all superdataset results if there is no such record.
+    """
+    jobs = get_jobs(jobs)
+    root = _Node(text_type(root), tuple(args), 0)
+    if jobs < 2:
+        for r in _traverse_serial(root, process, discover, recursion_limit):
+            yield r
+        return
+
+    pool = WorkStealingPool(jobs)
+
+    def run(node):
+        try:
+            node.results = process(node.path, *node.args)
+            if recursion_limit is None or node.depth < recursion_limit:
+                node.children = [
+                    _Node(text_type(p), tuple(args), node.depth + 1)
+                    for p, args in discover(node.path, node.results)]
+        except Exception as e:
+            node.error = e
+        if not pool.cancelled:
+            # push in reverse order to get the first subdataset
+            # popped first by this worker
+            for child in reversed(node.children):
+                pool.submit(run, child)
+        node.done.set()
+
+    pool.submit(run, root)
+    try:
+        for r in _emit(root):
+            yield r
+    finally:
+        # also reached when the consumer stops iterating early
+        pool.cancel()
+        pool.shutdown()
+
+
+def _emit(node):
+    node.done.wait()
+    if node.error is not None:
+        raise node.error
+    children = dict((c.path, c) for c in node.children)
+    for r in node.results:
+        yield r
+        child = children.pop(text_type(r.get('path')), None)
+        if child is not None and child is not node:
+            for cr in _emit(child):
+                yield cr
+    for child in node.children:
+        if child.path in children:
+            for cr in _emit(child):
+                yield cr
+
+
+def _traverse_serial(node, process, discover, recursion_limit):
+    results = process(node.path, *node.args)
+    if recursion_limit is None or node.depth < recursion_limit:
+        node.children = [
+            _Node(text_type(p), tuple(args), node.depth + 1)
+            for p, args in discover(node.path, results)]
+    node.results = results
+    node.done.set()
+    children = dict((c.path, c) for c in node.children)
+    for r in results:
+        yield r
+        child = children.pop(text_type(r.get('path')), None)
+        if child is not None and child is not node:
+            for cr in _traverse_serial(
+                    child, process, discover, recursion_limit):
+                yield cr
+    for child in node.children:
+        if child.path in children:
+            for cr in _traverse_serial(
+                    child, process, discover, recursion_limit):
+                yield cr
+
+
+class PathPrefixes(object):
+    """Query paths, to decide which datasets a query can touch
+
+    Parameters
+    ----------
+    paths : iterable
+      Absolute paths.
+    """
+    def __init__(self, paths):
+        self._paths = sorted(set(op.normpath(text_type(p)) for p in paths))
+        self._set = frozenset(self._paths)
+
+    def covers(self, path):
+        """Whether a path is, or is underneath, any of the query paths"""
+        path = op.normpath(text_type(path))
+        while path not in self._set:
+            parent = op.dirname(path)
+            if parent == path:
+                return False
+            path = parent
+        return True
+
+    def leads_to(self, path):
+        """Whether any of the query paths is underneath a path"""
+        prefix = op.join(op.normpath(text_type(path)), '')
+        # all paths with this prefix sort right behind it
+        i = bisect_left(self._paths, prefix)
+        return i < len(self._paths) and self._paths[i].startswith(prefix)
+
+    def is_relevant(self, path):
+        """Whether a dataset at a path can contain anything queried"""
+        return self.covers(path) or self.leads_to(path)
@@ -0,0 +1,242 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Index of the subdatasets registered in a dataset hierarchy
+
+The subdatasets of a dataset are read once from the gitlinks in its index
+(see `gitindex`) and the submodule sections in `.gitmodules` (parsed like
+any other configuration file, see `config`). The result
+is cached process-wide until either file changes. An index of a whole
+hierarchy is assembled from these per-dataset registries on demand, such
+that parent/child relations are resolved with dictionary lookups instead
+of repeated queries of the file system.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import threading
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+
+from six import text_type
+
+from .config import parse_config
+from .gitindex import (
+    MODE_GITLINK,
+    MODE_TYPE_MASK,
+    get_git_dir,
+    iter_staged,
+)
+from .utils import file_fingerprint
+
+lgr = logging.getLogger('datalad.revolution.registry')
+
+class SubdatasetRecord(namedtuple(
+        'SubdatasetRecord',
+        ('path', 'parentds', 'gitshasum', 'name', 'url'))):
+    """A subdataset registered in a superdataset
+
+    `path` and `parentds` are absolute paths, `gitshasum` is the recorded
+    commit. `name` and `url` are None for a gitlink without a matching
+    submodule section in `.gitmodules`.
+    """
+    __slots__ = ()
+
+    @property
+    def installed(self):
+        """Whether the subdataset is installed, evaluated on access"""
+        return op.exists(op.join(self.path, '.git'))
+
+
+def parse_gitmodules(path):
+    """Read the submodule sections of a `.gitmodules` file
+
+    Returns
+    -------
+    OrderedDict
+      Submodule name -> dict of (lower-case) option names and values.
+      Empty if the file does not exist, or cannot be parsed.
+    """
+    modules = OrderedDict()
+    try:
+        with open(path, 'rb') as f:
+            items = parse_config(f.read().decode('utf-8'))
+    except (IOError, OSError, ValueError) as e:
+        if op.exists(path):
+            lgr.debug('Cannot read %s: %s', path, e)
+        return modules
+    for key, value in items:
+        # submodule names may contain dots, option names cannot
+        section, _, option = key.rpartition('.')
+        if section.startswith('submodule.'):
+            modules.setdefault(section[len('submodule.'):], {})[option] = \
+                value
+    return modules
+
+
+class SubdatasetRegistry(object):
+    """Subdatasets registered in a single dataset
+
+    Parameters
+    ----------
+    ds_path : str
+    records : iterable
+      `SubdatasetRecord` instances.
+    """
+    def __init__(self, ds_path, records):
+        self.path = ds_path
+        self._records = OrderedDict((r.path, r) for r in records)
+
+    def __len__(self):
+        return len(self._records)
+
+    def __iter__(self):
+        return iter(self._records.values())
+
+    def __contains__(self, path):
+        return path in self._records
+
+    def get(self, path):
+        """Return the record of a subdataset at a path, or None"""
+        return self._records.get(path)
+
+    def containing(self, path):
+        """Return the record of the subdataset at, or above a path, or None
+        """
+        while len(path) > len(self.path):
+            rec = self._records.get(path)
+            if rec is not None:
+                return rec
+            path = op.dirname(path)
+        return None
+
+    @classmethod
+    def from_dataset(cls, ds_path):
+        """Read the registry of a dataset from its index and `.gitmodules`
+        """
+        git_dir = get_git_dir(ds_path)
+        if git_dir is None or not op.exists(op.join(git_dir, 'index')):
+            return cls(ds_path, [])
+        modules = parse_gitmodules(op.join(ds_path, '.gitmodules'))
+        by_path = dict(
+            (props['path'].rstrip('/'), (name, props.get('url')))
+            for name, props in modules.items()
+            if props.get('path'))
+        records = []
+        for path, mode, sha, stage in iter_staged(ds_path, git_dir):
+            if mode & MODE_TYPE_MASK != MODE_GITLINK or stage:
+                continue
+            relpath = os.fsdecode(path)
+            name, url = by_path.get(relpath, (None, None))
+            records.append(SubdatasetRecord(
+                op.normpath(op.join(ds_path, relpath)),
+                ds_path,
+                sha,
+                name,
+                url))
+        return cls(ds_path, records)
+
+
+# dataset path -> (fingerprint, SubdatasetRegistry)
+_registries = {}
+_registries_lock = threading.Lock()
+
+
+def get_registry(ds_path):
+    """Return the subdataset registry of a dataset
+
+    Registries are cached for the lifetime of the process, and invalidated
+    when the dataset's index or `.gitmodules` change.
+
+    Parameters
+    ----------
+    ds_path : str
+      Absolute path of the dataset.
+
+    Returns
+    -------
+    SubdatasetRegistry
+    """
+    ds_path = op.normpath(text_type(ds_path))
+    git_dir = get_git_dir(ds_path)
+    fp = (
+        file_fingerprint(op.join(git_dir, 'index')) if git_dir else None,
+        file_fingerprint(op.join(ds_path, '.gitmodules')),
+    )
+    cached = _registries.get(ds_path)
+    if cached is not None and cached[0] == fp:
+        return cached[1]
+    registry = SubdatasetRegistry.from_dataset(ds_path)
+    with _registries_lock:
+        _registries[ds_path] = (fp, registry)
+    return registry
+
+
+class SubdatasetIndex(object):
+    """Registered subdatasets of a dataset hierarchy
+
+    Registries of installed subdatasets are read as queries reach into
+    them, and kept for the lifetime of the index. Create a new index to
+    pick up changes.
+
+    Parameters
+    ----------
+    root : str
+      Absolute path of the root dataset of the hierarchy.
+    """
+    def __init__(self, root):
+        self.root = op.normpath(text_type(root))
+        self._registries = {}
+
+    def _registry(self, ds_path):
+        registry = self._registries.get(ds_path)
+        if registry is None:
+            registry = self._registries[ds_path] = get_registry(ds_path)
+        return registry
+
+    def get(self, path):
+        """Return the record of a registered subdataset, or None
+
+        Parameters
+        ----------
+        path : str
+          Absolute path.
+        """
+        path = op.normpath(text_type(path))
+        if not path.startswith(self.root + os.sep):
+            return None
+        ds_path = self.root
+        while True:
+            rec = self._registry(ds_path).containing(path)
+            if rec is None:
+                return None
+            if rec.path == path:
+                return rec
+            if not rec.installed:
+                return None
+            ds_path = rec.path
+
+    def get_parent(self, path):
+        """Return the path of the superdataset a subdataset is registered in
+
+        Returns
+        -------
+        str or None
+          None if the path is not a registered subdataset in the hierarchy.
+        """
+        rec = self.get(path)
+        return None if rec is None else rec.parentds
+
+    def get_children(self, ds_path):
+        """Return the records of all subdatasets registered in a dataset"""
+        return list(self._registry(op.normpath(text_type(ds_path))))
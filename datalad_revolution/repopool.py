@@ -0,0 +1,229 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Process-wide pool of dataset and repository instances
+
+Dataset and repository classes are flyweights: as long as an instance
+for a path exists, constructing another one for the same path returns it,
+without repeating config reads or version checks. However, instances are
+only held by weak references, and are typically lost between commands, or
+even between the datasets of a recursive command.
+
+The pool keeps strong references to the most recently used instances, up
+to a configurable number. Any code in this process that instantiates a
+dataset or repository for a pooled path (including DataLad core commands)
+receives the pooled instance. A pooled instance is discarded when its
+path, the inode of its `.git`, its Git or dataset config file, or the
+presence of an annex changes. The configuration of pooled repositories is
+read without calling Git (see `dataset.RevolutionConfigManager`).
+
+Every pooled annex repository may keep batched git-annex processes (and
+their pipes) around. These are closed when the repository is dropped from
+the pool, and restarted on demand, should the instance still be in use.
+
+Pooled instances are created under a lock, and are completely set up
+when they are returned. Worker threads of a parallel traversal (see
+`hierarchy`) may share them: a dataset is only processed after the
+processing of its superdataset, which may instantiate it, is complete.
+
+rev-create does not take instances from the pool: the dataset it creates
+has no instance to reuse, and a superdataset given by path must keep its
+path semantics (relative paths are relative to the working directory,
+not to the superdataset). A pooled superdataset instance is still reused,
+as the same flyweight.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import threading
+from collections import OrderedDict
+
+from six import text_type
+
+from .dataset import (
+    RevolutionDataset,
+    bind_config,
+)
+from .gitindex import get_git_dir
+from .tracing import get_configured_trace
+
+lgr = logging.getLogger('datalad.revolution.repopool')
+
+# default maximum number of pooled datasets, each may hold open files
+# and git-annex processes
+default_size = 100
+
+
+def _fingerprint(path):
+    """Identity of the repository at a path, or None if there is none"""
+    try:
+        dot_git = os.lstat(op.join(path, '.git'))
+    except OSError:
+        return None
+    git_dir = get_git_dir(path)
+    if git_dir is None:
+        return None
+    try:
+        config = os.stat(op.join(git_dir, 'config'))
+    except OSError:
+        return None
+    try:
+        ds_config = os.stat(op.join(path, '.datalad', 'config'))
+        ds_config = (
+            ds_config.st_ino, ds_config.st_mtime_ns, ds_config.st_size)
+    except OSError:
+        ds_config = None
+    return (
+        dot_git.st_ino,
+        dot_git.st_mode,
+        config.st_ino,
+        config.st_mtime_ns,
+        config.st_size,
+        ds_config,
+        op.exists(op.join(git_dir, 'annex')),
+    )
+
+
+def _forget_flyweight(obj):
+    # make sure the next instantiation for this path yields a new object
+    instances = getattr(type(obj), '_unique_instances', None)
+    if instances is None:
+        return
+    for k, v in list(instances.items()):
+        if v is obj:
+            instances.pop(k, None)
+
+
+class RepoPool(object):
+    """Size-bounded pool of dataset instances, validated on reuse
+
+    Parameters
+    ----------
+    size : int
+      Maximum number of pooled datasets. The least recently used ones are
+      dropped first.
+    """
+    def __init__(self, size=default_size):
+        self.size = size
+        self._datasets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._datasets)
+
+    def get_dataset(self, path):
+        """Return the pooled dataset instance for a path
+
+        Parameters
+        ----------
+        path : str
+          Absolute path of the dataset root.
+
+        Returns
+        -------
+        RevolutionDataset
+          The dataset is only pooled if it has a repository.
+        """
+        path = op.abspath(text_type(path))
+        fp = _fingerprint(path)
+        dropped = []
+        with self._lock:
+            cached = self._datasets.pop(path, None)
+            if cached is not None:
+                if cached[0] == fp:
+                    self._datasets[path] = cached
+                    return cached[1]
+                lgr.debug('Discarding outdated instances for %s', path)
+                self._forget(cached[1])
+                dropped.append(cached[1])
+            # instances are set up completely before any other thread can
+            # obtain them, the lazily set up repository and configuration
+            # of a dataset are not thread-safe
+            ds = RevolutionDataset(path)
+            repo = ds.repo
+            if fp is not None and repo is not None:
+                # pooled repositories read their configuration without Git
+                bind_config(repo)
+                self._datasets[path] = (fp, ds)
+                while len(self._datasets) > self.size:
+                    dropped.append(self._datasets.popitem(last=False)[1][1])
+        # other threads need not wait for processes to finish
+        for old in dropped:
+            self._close(old)
+        return ds
+
+    def get_repo(self, path):
+        """Return the pooled repository instance for a dataset path
+
+        Returns
+        -------
+        GitRepo or AnnexRepo or None
+          None if there is no repository at the path.
+        """
+        return self.get_dataset(path).repo
+
+    def clear(self):
+        """Drop all pooled instances"""
+        with self._lock:
+            dropped = [ds for fp, ds in self._datasets.values()]
+            self._datasets.clear()
+        for ds in dropped:
+            self._close(ds)
+
+    @staticmethod
+    def _forget(ds):
+        repo = getattr(ds, '_repo', None)
+        if repo is not None:
+            _forget_flyweight(repo)
+        _forget_flyweight(ds)
+
+    @staticmethod
+    def _close(ds):
+        # like AnnexRepo.precommit(), the processes are restarted on demand
+        batched = getattr(getattr(ds, '_repo', None), '_batched', None)
+        if batched is not None:
+            batched.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide pool
+
+    Its size is determined by the configuration item
+    'datalad.revolution.repopool.size' when the pool is first used. Then,
+    tracing of git/git-annex calls is enabled, if configured (see
+    `tracing.get_configured_trace()`).
+    """
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from datalad import cfg
+                # tracing by configuration starts with the first command
+                # that uses the pool
+                get_configured_trace()
+                _pool = RepoPool(int(cfg.get(
+                    'datalad.revolution.repopool.size', None) or
+                    default_size))
+    return _pool
+
+
+def get_dataset(path):
+    """Return a dataset instance from the process-wide pool"""
+    return get_pool().get_dataset(path)
+
+
+def get_repo(path):
+    """Return a repository instance from the process-wide pool"""
+    return get_pool().get_repo(path)
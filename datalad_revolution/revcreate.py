@@ -35,6 +35,7 @@ class RevCreate(Create):
                  no_annex=False,
                  fake_dates=False,
                  cfg_proc=None):
+        # not served from the repo pool, see `datalad_revolution.repopool`
         for r in Create.__call__(path=path,
                                  initopts=initopts,
                                  force=force,
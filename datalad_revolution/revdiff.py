@@ -17,10 +17,21 @@ from datalad.interface.base import (
     build_doc,
 )
 from datalad.interface.utils import eval_results
+from datalad.interface.common_opts import jobs_opt
+from datalad.consts import PRE_INIT_COMMIT_SHA
+from datalad.support.gitrepo import GitRepo
 
+from .config import load_hierarchy_config
 from .dataset import (
     rev_datasetmethod,
+    require_rev_dataset,
 )
+from .hierarchy import (
+    get_jobs,
+    traverse_hierarchy,
+)
+from .repopool import get_dataset
+from .treediff import iter_diff
 
 from datalad.core.local.diff import (
     Diff,
@@ -54,7 +65,22 @@ class RevDiff(Diff):
 
     Reports are very similar to those of the `rev-status` command, with the
     distinguished content types and states being identical.
+
+    With --jobs, a recursive difference report (without path constraints)
+    is processed dataset by dataset on a pool of worker threads. The report
+    is identical to that of a serial query.
+
+    A report between two recorded states (with --to), without path
+    constraints and annex properties, is streamed: records are reported
+    while the trees of both states are read, and memory use does not
+    depend on the size of the difference. Records on deleted content are
+    then reported in path order, rather than after all other records of a
+    dataset. Such a report is always serial, --jobs has no effect.
     """
+    _params_ = dict(
+        Diff._params_,
+        jobs=jobs_opt,
+    )
 
     @staticmethod
     @rev_datasetmethod(name='rev_diff')
@@ -67,7 +93,25 @@ class RevDiff(Diff):
             annex=None,
             untracked='normal',
             recursive=False,
-            recursion_limit=None):
+            recursion_limit=None,
+            jobs=None):
+        if to is not None and path is None and not annex:
+            ds = require_rev_dataset(
+                dataset, check_installed=True, purpose='difference reporting')
+            for r in iter_diff(
+                    ds.path, fr, to,
+                    recursion_limit=(recursion_limit if recursive else 0)):
+                r.update(refds=ds.path, action='diff', logger=lgr)
+                yield r
+            return
+
+        if recursive and path is None and get_jobs(jobs) > 1:
+            ds = require_rev_dataset(
+                dataset, check_installed=True, purpose='difference reporting')
+            for r in _parallel_diff(
+                    ds, fr, to, annex, untracked, recursion_limit, jobs):
+                yield r
+            return
 
         for r in Diff.__call__(
                 fr=fr,
@@ -82,3 +126,43 @@ class RevDiff(Diff):
                 on_failure="ignore",
                 return_type='generator'):
             yield r
+
+
+def _parallel_diff(ds, fr, to, annex, untracked, recursion_limit, jobs):
+    refds_path = ds.path
+
+    def process(path, fr=fr, to=to):
+        res = []
+        for r in Diff.__call__(
+                fr=fr,
+                to=to,
+                dataset=get_dataset(path),
+                annex=annex,
+                untracked=untracked,
+                recursive=False,
+                result_renderer=None,
+                on_failure="ignore",
+                return_type='generator'):
+            r['refds'] = refds_path
+            res.append(r)
+        return res
+
+    def discover(path, results):
+        # the state pair of a subdataset is determined by its
+        # record in the superdataset
+        return [
+            (r['path'],
+             (r.get('prev_gitshasum', PRE_INIT_COMMIT_SHA),
+              None if to is None else r.get('gitshasum')))
+            for r in results
+            if r.get('type') == 'dataset' and r['path'] != path
+            and r.get('state') not in ('clean', 'deleted')
+            and GitRepo.is_valid_repo(r['path'])
+        ]
+
+    # read the configuration of all datasets at once, rather than one
+    # dataset after the other as they are processed
+    load_hierarchy_config(refds_path, jobs=jobs)
+    return traverse_hierarchy(
+        refds_path, process, discover,
+        recursion_limit=recursion_limit, jobs=jobs)
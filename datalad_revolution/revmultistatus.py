@@ -0,0 +1,182 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Report status of many independent datasets in a single process"""
+
+__docformat__ = 'restructuredtext'
+
+
+import logging
+import threading
+from six.moves import queue
+
+from datalad.interface.base import (
+    Interface,
+    build_doc,
+)
+from datalad.interface.utils import eval_results
+from datalad.interface.common_opts import jobs_opt
+from datalad.support.constraints import (
+    EnsureStr,
+)
+from datalad.support.exceptions import InsufficientArgumentsError
+from datalad.support.param import Parameter
+from datalad.dochelpers import exc_str
+from datalad.utils import assure_list
+
+from .hierarchy import (
+    WorkStealingPool,
+    get_jobs,
+)
+from .repopool import get_dataset
+from .revstatus import RevStatus
+
+from datalad.core.local.status import Status
+
+lgr = logging.getLogger('datalad.revolution.multistatus')
+
+# results held back, before workers wait for them to be consumed
+max_pending_results = 10000
+
+_done = object()
+
+
+@build_doc
+class RevMultiStatus(Interface):
+    """Report on the state of many independent datasets.
+
+    Performs a status query (see rev-status) for each of the given
+    datasets, in a single process. Datasets are processed on a bounded pool
+    of worker threads, and results are reported as they become available.
+    Each result carries the dataset it belongs to in a 'root' property.
+    Results of a single dataset are reported in order, but results of
+    different datasets may be interleaved.
+
+    Unlike a number of separate rev-status calls, this shares any
+    information that can be reused across datasets (e.g. compiled ignore
+    rules, or global configuration) and avoids the startup cost of one
+    process per dataset.
+    """
+    _params_ = dict(
+        path=Parameter(
+            args=("path",),
+            metavar='DATASET',
+            nargs='+',
+            doc="""root directory of a dataset to report on. Any number of
+            independent datasets can be given.""",
+            constraints=EnsureStr()),
+        annex=Status._params_['annex'],
+        untracked=Status._params_['untracked'],
+        recursive=Status._params_['recursive'],
+        recursion_limit=Status._params_['recursion_limit'],
+        jobs=jobs_opt,
+    )
+
+    @staticmethod
+    @eval_results
+    def __call__(
+            path,
+            annex=None,
+            untracked='normal',
+            recursive=False,
+            recursion_limit=None,
+            jobs='auto'):
+        if not path:
+            raise InsufficientArgumentsError(
+                'at least one dataset is required')
+        for r in multi_status(
+                path,
+                annex=annex,
+                untracked=untracked,
+                recursive=recursive,
+                recursion_limit=recursion_limit,
+                jobs=jobs):
+            yield r
+
+    custom_result_renderer = Status.custom_result_renderer
+
+
+def multi_status(roots, annex=None, untracked='normal', recursive=False,
+                 recursion_limit=None, jobs='auto'):
+    """Status reports of any number of datasets, processed in parallel
+
+    Parameters
+    ----------
+    roots : list
+      Paths of the datasets.
+    annex, untracked, recursive, recursion_limit
+      See `RevStatus`.
+    jobs : int or 'auto'
+      Number of datasets processed at the same time.
+
+    Yields
+    ------
+    dict
+      Status results, with the dataset path given in `roots` added as
+      'root', in the order they become available.
+    """
+    roots = assure_list(roots)
+    if not roots:
+        return
+    results = queue.Queue(maxsize=max_pending_results)
+    stop = threading.Event()
+
+    def put(r):
+        # give up waiting for the consumer, if it stops early
+        while not stop.is_set():
+            try:
+                results.put(r, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def run(root):
+        try:
+            for r in RevStatus.__call__(
+                    dataset=get_dataset(root),
+                    annex=annex,
+                    untracked=untracked,
+                    recursive=recursive,
+                    recursion_limit=recursion_limit,
+                    # parallelism is across datasets
+                    jobs=1,
+                    result_renderer=None,
+                    on_failure="ignore",
+                    return_type='generator'):
+                r['root'] = root
+                if not put(r):
+                    return
+        except Exception as e:
+            put(dict(
+                action='status',
+                path=root,
+                root=root,
+                status='error',
+                message=exc_str(e),
+                logger=lgr))
+        finally:
+            put(_done)
+
+    pool = WorkStealingPool(min(get_jobs(jobs), len(roots)))
+    # workers take their queued work LIFO, submit in reverse to process
+    # datasets roughly in the given order
+    for root in reversed(roots):
+        pool.submit(run, root)
+    remaining = len(roots)
+    try:
+        while remaining:
+            r = results.get()
+            if r is _done:
+                remaining -= 1
+                continue
+            yield r
+    finally:
+        stop.set()
+        pool.cancel()
+        pool.shutdown()
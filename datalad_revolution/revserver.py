@@ -0,0 +1,241 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Serve commands from a long-running process over a Unix socket"""
+
+__docformat__ = 'restructuredtext'
+
+
+import json
+import logging
+import os
+import os.path as op
+import socket
+import threading
+from importlib import import_module
+
+from six import text_type
+from six.moves import socketserver
+
+from datalad.interface.base import (
+    Interface,
+    build_doc,
+)
+from datalad.interface.utils import eval_results
+from datalad.support.constraints import (
+    EnsureNone,
+    EnsureStr,
+)
+from datalad.support.param import Parameter
+from datalad.dochelpers import exc_str
+
+from .client import get_socket_path
+from .dataset import rev_get_dataset_root
+
+lgr = logging.getLogger('datalad.revolution.server')
+
+# Python API name -> (module, class) of the commands that can be served
+commands = {
+    'rev_status': ('datalad_revolution.revstatus', 'RevStatus'),
+    'rev_diff': ('datalad_revolution.revdiff', 'RevDiff'),
+    'rev_create': ('datalad_revolution.revcreate', 'RevCreate'),
+    'rev_multi_status': ('datalad_revolution.revmultistatus',
+                         'RevMultiStatus'),
+}
+
+
+@build_doc
+class RevServer(Interface):
+    """Serve commands from a long-running process.
+
+    Starts a server that listens on a Unix socket, and executes the
+    rev-status, rev-diff, rev-create, and rev-multi-status commands on
+    request, until it is interrupted. Dataset and repository objects, and
+    any other cached information, are kept between requests. This saves
+    the startup cost of a new process for every command, which dominates
+    the runtime of a status query on a small, clean dataset.
+
+    Requests can be sent with the thin `datalad-rev-client` command line
+    tool, or by any program that speaks the line-based JSON protocol
+    documented in the `datalad_revolution.client` module.
+
+    Only a single command is executed at a time, and its results are sent
+    when it is complete. The socket is only accessible to the user running
+    the server.
+    """
+    _params_ = dict(
+        socket=Parameter(
+            args=("--socket",),
+            metavar='PATH',
+            doc="""path of the Unix socket to listen on. By default, this
+            is determined by the configuration item
+            'datalad.revolution.server.socket', or a user-specific path
+            in XDG_RUNTIME_DIR, or the system's temporary directory.""",
+            constraints=EnsureStr() | EnsureNone()),
+    )
+
+    @staticmethod
+    @eval_results
+    def __call__(socket=None):
+        if socket is None:
+            from datalad import cfg
+            socket = cfg.get('datalad.revolution.server.socket', None) or \
+                get_socket_path()
+        server = CommandServer(socket)
+        lgr.info('Serving commands at %s', socket)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.close()
+        yield dict(
+            action='rev-server',
+            path=socket,
+            status='ok',
+            message='server stopped',
+            logger=lgr)
+
+
+class _ConnectionLost(Exception):
+    pass
+
+
+def _get_command(name):
+    module, cls = commands[name]
+    return getattr(import_module(module), cls)
+
+
+def _resolve_path(path, cwd, as_content):
+    # the trailing separator, or '.', addresses the content of a dataset,
+    # rather than the dataset in its superdataset
+    resolved = op.normpath(op.join(cwd, path))
+    if path.endswith(op.sep) or path == op.curdir or (
+            as_content and rev_get_dataset_root(resolved) == resolved):
+        resolved += op.sep
+    return resolved
+
+
+def _resolve_kwargs(name, kwargs, cwd):
+    """Make the paths of a request absolute, with respect to its `cwd`
+
+    The working directory of the server is shared by all threads, and is
+    never changed. Instead, a status or diff request without a dataset is
+    executed on the dataset at `cwd`, with paths that address the content
+    of a dataset, like they would without a dataset.
+    """
+    kwargs = dict(kwargs)
+    implicit = name in ('rev_status', 'rev_diff') and \
+        not kwargs.get('dataset', None)
+    if kwargs.get('dataset', None):
+        kwargs['dataset'] = op.normpath(op.join(cwd, kwargs['dataset']))
+    elif implicit:
+        # without a dataset at cwd, the command fails like it would there
+        kwargs['dataset'] = rev_get_dataset_root(cwd) or cwd
+    path = kwargs.get('path', None)
+    if isinstance(path, list):
+        kwargs['path'] = [_resolve_path(p, cwd, implicit) for p in path]
+    elif path:
+        kwargs['path'] = _resolve_path(path, cwd, implicit)
+    return kwargs
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        for line in self.rfile:
+            try:
+                req = json.loads(line.decode('utf-8'))
+                if not isinstance(req, dict):
+                    raise ValueError('not an object')
+            except ValueError as e:
+                self.send(dict(id=None, error='invalid request: {}'.format(
+                    exc_str(e))))
+                continue
+            try:
+                self.server.execute(req, self.send)
+            except _ConnectionLost as e:
+                lgr.debug('Connection lost: %s', exc_str(e))
+                return
+
+    def send(self, msg):
+        try:
+            self.wfile.write(
+                json.dumps(msg, default=text_type).encode('utf-8') + b'\n')
+            self.wfile.flush()
+        except (IOError, OSError, socket.error) as e:
+            raise _ConnectionLost(e)
+
+
+class CommandServer(socketserver.ThreadingMixIn,
+                    socketserver.UnixStreamServer):
+    """Server executing commands for requests on a Unix socket
+
+    Parameters
+    ----------
+    path : str
+      Path of the socket. A stale socket from a previous server that did
+      not shut down properly is replaced.
+    """
+    daemon_threads = True
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        if op.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except (IOError, OSError, socket.error):
+                lgr.debug('Removing stale socket %s', path)
+                os.unlink(path)
+            else:
+                raise RuntimeError(
+                    'A server is already running at {}'.format(path))
+            finally:
+                probe.close()
+        # the socket must not be accessible to anyone else
+        umask = os.umask(0o177)
+        try:
+            socketserver.UnixStreamServer.__init__(self, path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def close(self):
+        self.server_close()
+        if op.exists(self.path):
+            os.unlink(self.path)
+
+    def execute(self, req, send):
+        """Execute a request, and send all responses"""
+        rid = req.get('id', None)
+        name = req.get('command', None)
+        if name == 'ping':
+            send(dict(id=rid, status='done', pid=os.getpid()))
+            return
+        if name not in commands:
+            send(dict(id=rid, error='unknown command: {}'.format(name)))
+            return
+        try:
+            kwargs = _resolve_kwargs(
+                name, req.get('kwargs', None) or {},
+                req.get('cwd', None) or os.getcwd())
+            # a slow client must not hold up other requests, results are
+            # only sent once the command is done
+            with self._lock:
+                results = list(_get_command(name).__call__(
+                    result_renderer=None,
+                    on_failure='ignore',
+                    return_type='generator',
+                    **kwargs))
+        except Exception as e:
+            send(dict(id=rid, error=exc_str(e)))
+            return
+        for r in results:
+            r.pop('logger', None)
+            send(dict(id=rid, result=r))
+        send(dict(id=rid, status='done'))
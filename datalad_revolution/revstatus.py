@@ -12,13 +12,41 @@ __docformat__ = 'restructuredtext'
 
 
 import logging
+import os.path as op
+from collections import OrderedDict
+
+from six import text_type
 
 from datalad.interface.base import (
     build_doc,
 )
 from datalad.interface.utils import eval_results
+from datalad.interface.common_opts import jobs_opt
+from datalad.support.gitrepo import GitRepo
+from datalad.support.param import Parameter
+from datalad.utils import assure_list
+from . import utils as ut
 from .dataset import (
     rev_datasetmethod,
+    require_rev_dataset,
+    sort_paths_by_datasets,
+)
+from .hierarchy import (
+    PathPrefixes,
+    get_jobs,
+    traverse_hierarchy,
+)
+from .config import load_hierarchy_config
+from .dirty import find_change
+from .faststatus import fast_status
+from .registry import get_registry
+from .repopool import (
+    get_dataset,
+    get_repo,
+)
+from .sharedcache import (
+    get_max_age,
+    shared_results,
 )
 
 from datalad.core.local.status import Status
@@ -106,7 +134,43 @@ class RevStatus(Status):
     - 'modified'
     - 'deleted'
     - 'untracked'
+
+    *Parallel processing*
+
+    With --jobs, a recursive status query is processed dataset by dataset
+    on a pool of worker threads. The report is identical to that of a
+    serial query. A recursive query with path constraints only visits the
+    datasets containing the query paths, and the subdatasets underneath
+    them, no matter how many other subdatasets exist in the hierarchy.
+
+    The state of unmodified files is determined from Git's index directly,
+    and only changed files are inspected further. Files whose content was
+    found to be unmodified before are recognized by their file system
+    properties, without reading their content again. Untracked content is
+    discovered by listing directories in parallel.
+
+    *Concurrent queries*
+
+    If enabled for a dataset with the configuration item
+    'datalad.revolution.sharedcache.enable', identical status queries of the
+    entire dataset (without path constraints) issued by several processes
+    at the same time are performed only once, and the results are shared
+    (see `datalad_revolution.sharedcache`).
     """
+    _params_ = dict(
+        Status._params_,
+        jobs=jobs_opt,
+        dirty_only=Parameter(
+            args=("--dirty-only",),
+            action='store_true',
+            doc="""only determine whether there is any modification. The
+            first modification found is reported, and the query stops
+            immediately. Nothing is reported for a clean dataset
+            (hierarchy). Without path constraints, the cheapest checks are
+            performed first, across all datasets, and the content of
+            installed subdatasets is always inspected (as any modification
+            renders the subdataset itself modified)."""),
+    )
 
     @staticmethod
     @rev_datasetmethod(name='rev_status')
@@ -117,15 +181,206 @@ class RevStatus(Status):
             annex=None,
             untracked='normal',
             recursive=False,
-            recursion_limit=None):
-        for r in Status.__call__(
-                path=path,
-                dataset=dataset,
-                annex=annex,
-                untracked=untracked,
-                recursive=recursive,
-                recursion_limit=recursion_limit,
-                result_renderer=None,
-                on_failure="ignore",
-                return_type='generator'):
+            recursion_limit=None,
+            jobs=None,
+            dirty_only=False):
+        if dirty_only and path is None:
+            ds = require_rev_dataset(
+                dataset, check_installed=True, purpose='status reporting')
+            res = find_change(
+                ds.path, untracked=untracked, recursive=recursive,
+                recursion_limit=recursion_limit, jobs=jobs)
+            if res is not None:
+                yield res
+            return
+
+        if path is None and not dirty_only:
+            ds = require_rev_dataset(
+                dataset, check_installed=True, purpose='status reporting')
+            max_age = get_max_age(ds.path)
+            if max_age is not None:
+                for r in shared_results(
+                        ds.path,
+                        dict(
+                            command='status',
+                            annex=annex,
+                            untracked=untracked,
+                            recursive=recursive,
+                            recursion_limit=recursion_limit),
+                        lambda: _status(
+                            None, ds, annex, untracked, recursive,
+                            recursion_limit, jobs),
+                        max_age=max_age,
+                        recursion_limit=recursion_limit if recursive
+                        else 0):
+                    yield r
+                return
+
+        for r in _status(
+                path, dataset, annex, untracked, recursive, recursion_limit,
+                jobs):
+            if not dirty_only:
+                yield r
+            elif r.get('status') != 'ok' or r.get('state') != 'clean':
+                yield r
+                # closing the generator cancels any outstanding work
+                return
+
+
+def _status(path, dataset, annex, untracked, recursive, recursion_limit,
+            jobs):
+    if recursive and path is None and get_jobs(jobs) > 1:
+        ds = require_rev_dataset(
+            dataset, check_installed=True, purpose='status reporting')
+        for r in _parallel_status(
+                ds, annex, untracked, recursion_limit, jobs):
+            yield r
+        return
+    if recursive and path is not None and recursion_limit is None:
+        ds = require_rev_dataset(
+            dataset, check_installed=True, purpose='status reporting')
+        for r in _targeted_status(
+                ds, dataset, path, annex, untracked, jobs):
+            yield r
+        return
+    if not recursive and path is None:
+        ds = require_rev_dataset(
+            dataset, check_installed=True, purpose='status reporting')
+        for r in _status_dataset(
+                ds.path, ds.path, annex, untracked, jobs):
+            yield r
+        return
+
+    for r in Status.__call__(
+            path=path,
+            dataset=dataset,
+            annex=annex,
+            untracked=untracked,
+            recursive=recursive,
+            recursion_limit=recursion_limit,
+            result_renderer=None,
+            on_failure="ignore",
+            return_type='generator'):
+        yield r
+
+
+def _query_dataset(ds_path, refds_path, annex, untracked, paths=None):
+    """Non-recursive status of a single dataset"""
+    for r in Status.__call__(
+            path=paths,
+            dataset=get_dataset(ds_path),
+            annex=annex,
+            untracked=untracked,
+            recursive=False,
+            result_renderer=None,
+            on_failure="ignore",
+            return_type='generator'):
+        r['refds'] = refds_path
+        yield r
+
+
+def _status_dataset(ds_path, refds_path, annex, untracked, jobs=None):
+    """Non-recursive status of a single dataset, fast path if possible"""
+    def query(paths=None):
+        return _query_dataset(ds_path, refds_path, annex, untracked, paths)
+
+    def annotate(records):
+        # annex properties are looked up by key, no content is read
+        repo = get_repo(ds_path)
+        if not records or not hasattr(repo, 'get_content_annexinfo'):
+            return
+        init = OrderedDict((ut.Path(r['path']), r) for r in records)
+        # only the annotated records are queried, without paths the whole
+        # repository would be
+        repo.get_content_annexinfo(
+            paths=list(init),
+            init=init,
+            eval_availability=annex in ('availability', 'all'))
+
+    res = fast_status(
+        ds_path, query, refds_path=refds_path, untracked=untracked,
+        annotate=annotate if annex else None, jobs=jobs)
+    return query() if res is None else res
+
+
+def _is_installed_dataset(registry, r):
+    """Whether a status record is for an installed subdataset
+
+    Like a regular status query, any dataset is descended into, including
+    one that is not (yet) registered in its superdataset. The registry
+    only saves the validation of a registered one.
+    """
+    if r.get('type') != 'dataset' or r.get('state') == 'deleted':
+        return False
+    if r['path'] in registry:
+        return registry.get(r['path']).installed
+    return GitRepo.is_valid_repo(r['path'])
+
+
+def _parallel_status(ds, annex, untracked, recursion_limit, jobs):
+    refds_path = ds.path
+
+    def process(path):
+        return list(_status_dataset(
+            path, refds_path, annex, untracked, jobs))
+
+    def discover(path, results):
+        registry = get_registry(path)
+        return [
+            (r['path'], ())
+            for r in results
+            if _is_installed_dataset(registry, r)
+        ]
+
+    # read the configuration of all datasets at once, rather than one
+    # dataset after the other as they are processed
+    load_hierarchy_config(refds_path, jobs=jobs)
+    return traverse_hierarchy(
+        refds_path, process, discover,
+        recursion_limit=recursion_limit, jobs=jobs)
+
+
+def _targeted_status(ds, dataset, path, annex, untracked, jobs):
+    """Recursive status, pruned to the datasets the paths can touch"""
+    refds_path = ds.path
+    paths_by_ds, errors = sort_paths_by_datasets(dataset, assure_list(path))
+    for e in errors:
+        yield e
+    queries = [(text_type(root), text_type(p))
+               for root, ps in paths_by_ds.items() for p in ps]
+    prefixes = PathPrefixes(p for root, p in queries)
+    # query paths that address a subdataset in its superdataset, whose
+    # content is then reported in full
+    records = set(p for root, p in queries if p != root)
+
+    def redundant(root, p):
+        # anything underneath another query path is reported with the
+        # latter already
+        return prefixes.covers(op.dirname(p)) or (p == root and p in records)
+
+    def process(path, paths=None):
+        # a query path that is the dataset root (given with a trailing
+        # separator) addresses all of the dataset's content
+        if paths is None or path in paths:
+            return list(_status_dataset(
+                path, refds_path, annex, untracked, jobs))
+        return list(_query_dataset(path, refds_path, annex, untracked, paths))
+
+    def discover(path, results):
+        registry = get_registry(path)
+        # only subdatasets that hold queried content are descended into
+        return [
+            (r['path'], ())
+            for r in results
+            if prefixes.is_relevant(r['path'])
+            and _is_installed_dataset(registry, r)
+        ]
+
+    for root, ps in paths_by_ds.items():
+        root = text_type(root)
+        ps = [text_type(p) for p in ps if not redundant(root, text_type(p))]
+        if not ps:
+            continue
+        for r in traverse_hierarchy(
+                root, process, discover, jobs=jobs, args=(ps,)):
             yield r
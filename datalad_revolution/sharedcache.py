@@ -0,0 +1,288 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Sharing of query results between processes
+
+Identical queries on the same dataset, issued by any number of processes
+at the same time, are executed only once: the first process computes the
+results, while all others wait for it to finish, and then read its
+results from disk. Queries are identical if they have the same parameters,
+and if the HEAD commit and the index of the dataset, and of all installed
+subdatasets a recursive query covers, are unchanged.
+
+A result written to disk is only reused by a process that was already
+waiting for it when it was written, or, optionally, for a configurable
+number of seconds afterwards (which requires synchronized clocks on all
+hosts that access the dataset). This protects against reporting outdated
+results for work tree modifications, which neither change HEAD nor the
+index.
+
+The results are kept inside the Git directory of the dataset, and access
+is coordinated with POSIX file locks, which also work on NFS. Sharing is
+opt-in, per dataset, with the configuration items
+'datalad.revolution.sharedcache.enable' and
+'datalad.revolution.sharedcache.maxage' (seconds, default 0).
+"""
+
+__docformat__ = 'restructuredtext'
+
+import errno
+import hashlib
+import json
+import logging
+import os
+import os.path as op
+import threading
+import time
+
+from six import text_type
+
+from .config import get_dataset_config
+from .gitindex import (
+    get_git_dir,
+    read_ref,
+)
+from .registry import get_registry
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    # no file locks on this platform, sharing is not supported
+    fcntl = None
+
+lgr = logging.getLogger('datalad.revolution.sharedcache')
+
+# results and locks not used for this many seconds are removed
+expiry = 24 * 3600
+
+# POSIX locks are held per process, threads of the same process are
+# coordinated separately
+_thread_locks = {}
+_thread_locks_lock = threading.Lock()
+
+
+def get_max_age(ds_path):
+    """Return the sharing configuration of a dataset
+
+    Returns
+    -------
+    float or None
+      None, if sharing is not enabled for the dataset, or not supported.
+      Otherwise, the number of seconds after its completion, for which a
+      result is reused.
+    """
+    if fcntl is None:
+        return None
+    cfg = get_dataset_config(ds_path)
+    if cfg is None or not cfg.getbool(
+            'datalad.revolution.sharedcache.enable', False):
+        return None
+    return float(cfg.get('datalad.revolution.sharedcache.maxage', None) or 0)
+
+
+def _get_state(git_dir):
+    try:
+        st = os.stat(op.join(git_dir, 'index'))
+        index = (st.st_ino, st.st_size, st.st_mtime_ns)
+    except OSError:
+        index = None
+    return read_ref(git_dir), index
+
+
+def get_key(ds_path, params, recursion_limit=0):
+    """Return the key of a query, or None if the dataset has no repository
+
+    Parameters
+    ----------
+    ds_path : str
+      Root of the dataset.
+    params : dict
+      Query parameters, must be JSON-serializable.
+    recursion_limit : int or None
+      Number of levels of installed subdatasets (as registered in their
+      superdatasets) whose state is part of the key. None for all.
+    """
+    ds_path = op.abspath(text_type(ds_path))
+    git_dir = get_git_dir(ds_path)
+    if git_dir is None:
+        return None
+    states = [[ds_path, _get_state(git_dir)]]
+    todo = [(ds_path, 0)]
+    while todo:
+        path, level = todo.pop()
+        if recursion_limit is not None and level >= recursion_limit:
+            continue
+        for rec in get_registry(path):
+            sub_git_dir = get_git_dir(rec.path)
+            if sub_git_dir is None:
+                continue
+            states.append([rec.path, _get_state(sub_git_dir)])
+            todo.append((rec.path, level + 1))
+    return hashlib.sha1(json.dumps(
+        [states, params], sort_keys=True, default=text_type,
+    ).encode('utf-8')).hexdigest()
+
+
+def _get_thread_lock(key):
+    with _thread_locks_lock:
+        lock = _thread_locks.get(key, None)
+        if lock is None:
+            lock = _thread_locks[key] = threading.Lock()
+        return lock
+
+
+def _purge(cache_dir, keep):
+    # best effort, another process may remove the same files
+    now = time.time()
+    try:
+        names = os.listdir(cache_dir)
+    except OSError:
+        return
+    for name in names:
+        if name.startswith(keep):
+            continue
+        path = op.join(cache_dir, name)
+        try:
+            if now - os.stat(path).st_mtime > expiry:
+                os.unlink(path)
+        except OSError:
+            pass
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_mtime
+
+
+def _read(path):
+    """Return shared results, or None if they cannot be read"""
+    try:
+        with open(path, 'rb') as f:
+            return [json.loads(line.decode('utf-8')) for line in f]
+    except (IOError, OSError, ValueError) as e:
+        lgr.debug('Cannot read shared results from %s: %s', path, e)
+        return None
+
+
+def _lock(cache_dir, lock_path):
+    """Return the open and locked lock file, or None if locking fails
+
+    E.g. on a read-only file system, or without lock support on NFS.
+    """
+    try:
+        try:
+            os.makedirs(cache_dir)
+        except OSError as e:
+            # another process may have created it
+            if e.errno != errno.EEXIST:
+                raise
+        lock = open(lock_path, 'a')
+    except (IOError, OSError) as e:
+        lgr.debug('Cannot share results in %s: %s', cache_dir, e)
+        return None
+    try:
+        fcntl.lockf(lock, fcntl.LOCK_EX)
+    except (IOError, OSError) as e:
+        lgr.debug('Cannot lock %s: %s', lock_path, e)
+        lock.close()
+        return None
+    return lock
+
+
+def shared_results(ds_path, params, compute, max_age=0, recursion_limit=0):
+    """Yield the results of a query, shared with concurrent processes
+
+    Parameters
+    ----------
+    ds_path : str
+      Root of the dataset the query is performed on.
+    params : dict
+      All parameters that determine the query results, must be
+      JSON-serializable.
+    compute : callable
+      Called without arguments to perform the query, must return an
+      iterable of JSON-serializable result records. The 'logger' property
+      of records is not shared.
+    max_age : float
+      Number of seconds after its completion, for which a result is reused
+      by a process that did not wait for it.
+    recursion_limit : int or None
+      Number of subdataset levels the query covers, see `get_key()`.
+
+    Yields
+    ------
+    dict
+      Result records, only once the query is complete (and no lock is
+      held anymore). If results cannot be shared (e.g. the Git directory
+      is read-only, or file locks are not supported), the query is
+      performed without sharing.
+    """
+    key = get_key(ds_path, params, recursion_limit=recursion_limit)
+    if key is None or fcntl is None:
+        for r in compute():
+            yield r
+        return
+    cache_dir = op.join(
+        get_git_dir(ds_path), 'datalad', 'revolution', 'sharedcache')
+    result_path = op.join(cache_dir, key + '.json')
+    # a result completed while waiting for the lock is always reused
+    before = _stat(result_path)
+    lock_path = op.join(cache_dir, key + '.lock')
+    results = None
+    with _get_thread_lock(key):
+        lock = _lock(cache_dir, lock_path)
+        if lock is None:
+            results = list(compute())
+        else:
+            try:
+                try:
+                    # keep the lock from being purged while it is in use
+                    os.utime(lock_path, None)
+                except OSError:
+                    pass
+                st = _stat(result_path)
+                if st is not None and (
+                        (before is None or st[:2] != before[:2]) or
+                        (max_age and st[2] >= time.time() - max_age)):
+                    lgr.debug('Reading shared results of %s', ds_path)
+                    results = _read(result_path)
+                if results is None:
+                    results = _compute(result_path, compute)
+            finally:
+                fcntl.lockf(lock, fcntl.LOCK_UN)
+                lock.close()
+            _purge(cache_dir, key)
+    for r in results:
+        yield r
+
+
+def _compute(result_path, compute):
+    results = list(compute())
+    tmp_path = '{}.{}.tmp'.format(result_path, os.getpid())
+    try:
+        with open(tmp_path, 'wb') as f:
+            for r in results:
+                shared = dict(r)
+                shared.pop('logger', None)
+                f.write(json.dumps(
+                    shared, default=text_type).encode('utf-8'))
+                f.write(b'\n')
+        os.rename(tmp_path, result_path)
+    except (IOError, OSError) as e:
+        lgr.debug('Cannot share results in %s: %s', result_path, e)
+    finally:
+        if op.exists(tmp_path):
+            # incomplete results are never shared
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+    return results
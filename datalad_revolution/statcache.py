@@ -0,0 +1,183 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Persistent cache of file stat fingerprints
+
+For each file, the cache records a stat fingerprint (inode, size, mtime,
+ctime) together with the Git object ID and annex key of the file content
+at the time the fingerprint was taken. As long as the fingerprint of a
+file is unchanged, its content is known without reading it.
+
+The cache is kept per dataset in an SQLite database inside the Git
+directory. It is loaded in full on first use, and updates are written
+back in a single transaction. The cache is an optimization only: if the
+database cannot be read or written (e.g. it is locked by another process
+for too long, corrupt, or in a read-only dataset), or Python lacks SQLite
+support, files are treated as not cached. A corrupt database is replaced
+with the next update.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import time
+
+try:
+    import sqlite3
+except ImportError:  # pragma: no cover
+    # Python built without SQLite, nothing is cached
+    sqlite3 = None
+
+lgr = logging.getLogger('datalad.revolution.statcache')
+
+# seconds to wait for a database that is locked by another process
+lock_timeout = 1
+
+# fingerprints of files modified less than this many seconds before they
+# are recorded are not trusted, as a subsequent modification may not
+# change the timestamps on file systems with coarse timestamp resolution
+racy_interval = 2
+
+
+def fingerprint(st):
+    """Return the stat fingerprint of a stat result"""
+    # SQLite integers are signed 64 bit
+    return (st.st_ino & 0x7fffffffffffffff, st.st_size, st.st_mtime_ns,
+            st.st_ctime_ns)
+
+
+class StatCache(object):
+    """Stat fingerprint cache of a single dataset
+
+    Usage::
+
+      with StatCache(git_dir) as cache:
+          hit = cache.lookup('sub/file.dat', os.lstat(path))
+          ...
+          cache.update('sub/file.dat', os.lstat(path), gitsha, key)
+
+    Parameters
+    ----------
+    git_dir : str
+      Git directory of the dataset.
+    """
+    def __init__(self, git_dir):
+        self.path = op.join(git_dir, 'datalad', 'revolution', 'statcache.db')
+        self._entries = None
+        self._updates = {}
+        self._corrupt = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.flush()
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=lock_timeout)
+
+    def _load(self):
+        self._entries = {}
+        if sqlite3 is None or not op.exists(self.path):
+            return
+        entries = {}
+        try:
+            db = self._connect()
+            try:
+                for row in db.execute('SELECT * FROM stat'):
+                    entries[row[0]] = (tuple(row[1:5]), row[5], row[6])
+            finally:
+                db.close()
+        except sqlite3.Error as e:
+            lgr.debug('Cannot read stat cache at %s: %s', self.path, e)
+            # anything but a lock or I/O failure renders the file useless
+            self._corrupt = isinstance(e, sqlite3.DatabaseError) and \
+                not isinstance(e, sqlite3.OperationalError)
+            return
+        self._entries = entries
+
+    def lookup(self, relpath, st):
+        """Look up the content of a file with a given stat result
+
+        Returns
+        -------
+        (str, str or None) or None
+          Git object ID and annex key of the file content, if the stat
+          fingerprint matches the recorded one, None otherwise.
+        """
+        if self._entries is None:
+            self._load()
+        rec = self._entries.get(relpath)
+        if rec is None or rec[0] != fingerprint(st):
+            return None
+        return rec[1], rec[2]
+
+    def recorded(self, relpath):
+        """Return the last recorded content of a file, regardless of its stat
+
+        Returns
+        -------
+        (str, str or None) or None
+          Git object ID and annex key, or None if nothing was recorded.
+        """
+        if self._entries is None:
+            self._load()
+        rec = self._entries.get(relpath)
+        return None if rec is None else (rec[1], rec[2])
+
+    def update(self, relpath, st, gitsha, key=None):
+        """Record the content of a file with a given stat result
+
+        Returns
+        -------
+        bool
+          Whether the record was taken. Fingerprints of recently modified
+          files are not recorded.
+        """
+        if time.time() - max(st.st_mtime, st.st_ctime) < racy_interval:
+            return False
+        if self._entries is None:
+            self._load()
+        rec = (fingerprint(st), gitsha, key)
+        if self._entries.get(relpath) != rec:
+            self._entries[relpath] = rec
+            self._updates[relpath] = rec
+        return True
+
+    def flush(self):
+        """Write all updates to the database"""
+        if not self._updates or sqlite3 is None:
+            self._updates = {}
+            return
+        try:
+            if not op.exists(op.dirname(self.path)):
+                os.makedirs(op.dirname(self.path))
+            if self._corrupt:
+                lgr.debug('Replacing corrupt stat cache at %s', self.path)
+                os.unlink(self.path)
+                self._corrupt = False
+            db = self._connect()
+            try:
+                with db:
+                    db.execute(
+                        'CREATE TABLE IF NOT EXISTS stat ('
+                        'path TEXT PRIMARY KEY, ino INTEGER, size INTEGER, '
+                        'mtime_ns INTEGER, ctime_ns INTEGER, gitsha TEXT, '
+                        'key TEXT) WITHOUT ROWID')
+                    db.executemany(
+                        'INSERT OR REPLACE INTO stat VALUES (?,?,?,?,?,?,?)',
+                        [(p,) + rec[0] + rec[1:]
+                         for p, rec in self._updates.items()])
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError) as e:
+            # e.g. a read-only dataset, or a lock held for too long
+            lgr.debug('Cannot update stat cache at %s: %s', self.path, e)
+        self._updates = {}
@@ -0,0 +1,77 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test the single-pass ANSI color lexer of the documentation against the
+rule-based one"""
+
+import itertools
+import os.path as op
+import sys
+
+from datalad.tests.utils import (
+    SkipTest,
+    assert_equal,
+    ok_,
+)
+
+# the lexer is part of the documentation sources, not of the package
+_utils_dir = op.join(
+    op.dirname(op.dirname(op.dirname(op.abspath(__file__)))), 'docs', 'utils')
+
+
+def _import_bench():
+    if not op.exists(op.join(_utils_dir, 'bench_ansi_lexer.py')):
+        raise SkipTest('documentation sources are not available')
+    try:
+        import pygments.lexer  # noqa: F401
+    except ImportError:
+        raise SkipTest('pygments is not available')
+    sys.path.insert(0, _utils_dir)
+    try:
+        import bench_ansi_lexer
+    finally:
+        sys.path.remove(_utils_dir)
+    return bench_ansi_lexer
+
+
+def _runs(tokens):
+    # text with the same token, as runs without empty pieces
+    return [
+        (token, ''.join(v for _, v in group))
+        for token, group in itertools.groupby(
+            ((t, v) for _, t, v in tokens if v), key=lambda x: x[0])]
+
+
+def _check_same_output(lexer_cls, text):
+    import pygments.lexer
+    regex = list(pygments.lexer.RegexLexer.get_tokens_unprocessed(
+        lexer_cls(), text))
+    single_pass = list(lexer_cls().get_tokens_unprocessed(text))
+    assert_equal(_runs(single_pass), _runs(regex))
+    # runs are reported in order, at the escape sequence they start with
+    positions = [i for i, t, v in single_pass]
+    assert_equal(positions, sorted(positions))
+    ok_(all(0 <= i < len(text) for i in positions))
+
+
+def test_same_output():
+    bench = _import_bench()
+    lexer_cls = bench.AnsiColorLexer
+    for line in bench.special_lines:
+        _check_same_output(lexer_cls, line)
+        # with a color carried over from preceding text
+        _check_same_output(lexer_cls, '\x1b[1;31mred ' + line + 'after')
+    for seed in range(3):
+        _check_same_output(lexer_cls, bench.make_transcript(2000, seed))
+    _check_same_output(lexer_cls, '')
+    _check_same_output(lexer_cls, 'no escapes at all')
+
+
+def test_benchmark():
+    bench = _import_bench()
+    assert_equal(bench.main(['--lines', '100', '--repeat', '1']), 0)
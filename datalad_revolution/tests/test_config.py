@@ -0,0 +1,178 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test reading configuration without Git"""
+
+import os.path as op
+import subprocess
+
+from datalad.api import create
+from datalad.config import (
+    ConfigManager,
+    _parse_gitconfig_dump,
+)
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    ok_,
+    with_tempfile,
+)
+
+from .. import dataset as rds
+from ..registry import (
+    get_registry,
+    parse_gitmodules,
+)
+from ..repopool import get_dataset
+from ..tracing import trace_subprocesses
+
+_config = u'''\
+[core]
+\tbare = false
+\tTrustCtime
+[remote "Origin"]
+\turl = http://example.com/x  # comment
+\tfetch = a
+\tfetch = "b ; c"
+[datalad "revolution.x"]
+\tvalue = "quoted \\"value\\"" \\
+continued
+[include]
+\tpath = included
+'''
+
+_included = u'''\
+[datalad "included"]
+\tname = Included
+[remote "Origin"]
+\tfetch = d
+'''
+
+
+_gitmodules = u'''\
+# comment
+[submodule "sub"]
+\tpath = sub
+\turl = ./sub ; comment
+[submodule "with.dots and \\"quotes\\""]
+\tPath = "other sub"
+\turl = "http://example.com/#x"
+\tbranch
+[remote "origin"]
+\turl = nothere
+[submodule.legacy]
+\tpath = legacy
+'''
+
+
+def _git_config(cm, args):
+    out, err = ConfigManager._run(cm, args)
+    return out
+
+
+def _config_calls(trace):
+    return len([r for r in trace.records if 'config' in r.argv])
+
+
+def _parsed(dump, cwd):
+    return _parse_gitconfig_dump(dump, {}, set(), replace=True, cwd=cwd)
+
+
+@with_tempfile(mkdir=True)
+def test_config_like_git(path):
+    ds = create(path, no_annex=True)
+    git_dir = op.join(path, '.git')
+    with open(op.join(git_dir, 'config'), 'a') as f:
+        f.write(_config)
+    with open(op.join(git_dir, 'included'), 'w') as f:
+        f.write(_included)
+    with open(op.join(path, '.datalad', 'config'), 'a') as f:
+        f.write(u'[datalad "dataset"]\n\tflag\n')
+    cm = ConfigManager(ds)
+    for args in (
+            ['-z', '-l', '--show-origin'],
+            ['-z', '-l', '--show-origin', '--local'],
+            ['-z', '-l'],
+            ['-z', '-l', '--show-origin', '--file',
+             op.join(path, '.datalad', 'config')]):
+        dump = rds._read_config(cm, args)
+        ok_(dump is not None)
+        assert_equal(_parsed(dump, path), _parsed(_git_config(cm, args), path))
+    # outside of any repository
+    cm = ConfigManager()
+    args = ['-z', '-l', '--show-origin']
+    assert_equal(
+        _parsed(rds._read_config(cm, args), path),
+        _parsed(_git_config(cm, args), path))
+
+
+@with_tempfile(mkdir=True)
+def test_config_manager(path):
+    ds = create(path, no_annex=True)
+    with open(op.join(path, '.git', 'config'), 'a') as f:
+        f.write(_config)
+    with open(op.join(path, '.git', 'included'), 'w') as f:
+        f.write(_included)
+    # DataLad's own configuration managers are left alone
+    with trace_subprocesses() as trace:
+        ConfigManager(ds)
+    ok_(_config_calls(trace))
+    with trace_subprocesses() as trace:
+        cm = rds.RevolutionConfigManager(ds)
+    assert_equal(_config_calls(trace), 0)
+    assert_equal(cm.get('datalad.included.name'), 'Included')
+    assert_equal(cm.get('remote.Origin.fetch'), ('a', 'b ; c', 'd'))
+    assert_in(op.join(path, '.git', 'included'), cm._cfgfiles)
+    # conditional includes are left to Git
+    with open(op.join(path, '.git', 'config'), 'a') as f:
+        f.write(u'[includeIf "gitdir:/nowhere/"]\n\tpath = x\n')
+    with trace_subprocesses() as trace:
+        cm.reload(force=True)
+    assert_equal(_config_calls(trace), 1)
+    assert_equal(cm.get('datalad.included.name'), 'Included')
+
+
+@with_tempfile(mkdir=True)
+def test_pooled_config(path):
+    create(path, no_annex=True)
+    ds = get_dataset(path)
+    ok_(isinstance(ds.config, rds.RevolutionConfigManager))
+    ok_(ds.config is ds.repo.config)
+    ok_(rds.bind_config(ds.repo) is ds.config)
+
+
+@with_tempfile(mkdir=True)
+def test_gitmodules(path):
+    ds = create(path, no_annex=True)
+    gitmodules = op.join(path, '.gitmodules')
+    assert_equal(parse_gitmodules(gitmodules), {})
+    with open(gitmodules, 'w') as f:
+        f.write(_gitmodules)
+    out = subprocess.check_output(
+        ['git', 'config', '-z', '--file', gitmodules, '--list'], cwd=path)
+    git = []
+    for line in out.decode('utf-8').split('\0'):
+        key, _, value = line.partition('\n')
+        if key.startswith('submodule.'):
+            section, _, option = key.rpartition('.')
+            git.append((section[len('submodule.'):], option,
+                        value if '\n' in line else None))
+    assert_equal(
+        [(name, option, value)
+         for name, props in parse_gitmodules(gitmodules).items()
+         for option, value in props.items()],
+        git)
+    # gitlinks are matched to their submodule sections by path
+    sub = create(op.join(path, 'sub'), no_annex=True)
+    ds.repo.add_submodule('sub', url='./sub')
+    with open(gitmodules, 'w') as f:
+        f.write(_gitmodules)
+    assert_equal(
+        [(rec.path, rec.name, rec.url, rec.gitshasum)
+         for rec in get_registry(path)],
+        [(sub.path, 'sub', './sub', sub.repo.get_hexsha())])
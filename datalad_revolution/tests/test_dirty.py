@@ -0,0 +1,110 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test early-exit detection of modifications"""
+
+import os
+import os.path as op
+import subprocess
+
+from datalad.api import create
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    ok_,
+    with_tempfile,
+)
+
+from ..dataset import RevolutionDataset as Dataset
+from ..dirty import (
+    find_change,
+    is_dirty,
+)
+from ..tracing import (
+    command_type,
+    trace_subprocesses,
+)
+from .. import revstatus  # noqa: F401
+
+
+def _write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def _dirty_only(path, **kwargs):
+    return list(Dataset(path).rev_status(
+        dirty_only=True, result_renderer=None, **kwargs))
+
+
+@with_tempfile(mkdir=True)
+def test_early_exit(path):
+    ds = create(path, no_annex=True)
+    sub = ds.create('sub', no_annex=True)
+    subsub = sub.create('subsub', no_annex=True)
+    for d in (ds, sub, subsub):
+        _write(op.join(d.path, 'file'), 'content')
+    ds.save(recursive=True)
+    assert_false(is_dirty(path))
+    assert_equal(_dirty_only(path, recursive=True), [])
+
+    # a modification deep down renders the subdataset modified, or is
+    # reported itself in a recursive query
+    _write(op.join(subsub.path, 'file'), 'modified')
+    res = find_change(path)
+    assert_equal(
+        (res['path'], res['type'], res['state']),
+        (sub.path, 'dataset', 'modified'))
+    res = _dirty_only(path, recursive=True, recursion_limit=1)
+    assert_equal(len(res), 1)
+    assert_equal(res[0]['path'], subsub.path)
+    res = _dirty_only(path, recursive=True)
+    assert_equal(len(res), 1)
+    assert_equal(
+        (res[0]['path'], res[0]['state'], res[0]['parentds']),
+        (op.join(subsub.path, 'file'), 'modified', subsub.path))
+
+    # a deleted file is found in the index, without any content being
+    # inspected anywhere
+    os.unlink(op.join(path, 'file'))
+    with trace_subprocesses() as trace:
+        res = _dirty_only(path, recursive=True)
+    assert_equal(len(res), 1)
+    assert_equal(
+        (res[0]['path'], res[0]['state']),
+        (op.join(path, 'file'), 'deleted'))
+    assert_equal(
+        [r.argv for r in trace.records
+         if command_type(r.argv) == 'git ls-files'],
+        [])
+
+
+@with_tempfile(mkdir=True)
+def test_split_index(path):
+    ds = create(path, no_annex=True)
+    _write(op.join(path, 'file'), 'content')
+    subprocess.check_call(
+        ['git', 'config', 'core.splitIndex', 'true'], cwd=path)
+    subprocess.check_call(['git', 'update-index', '--split-index'], cwd=path)
+    ds.save()
+    ok_(any(n.startswith('sharedindex.')
+            for n in os.listdir(op.join(path, '.git'))))
+    assert_false(is_dirty(path))
+    assert_equal(_dirty_only(path), [])
+
+    _write(op.join(path, 'untracked'), 'content')
+    res = find_change(path)
+    assert_equal(
+        (res['path'], res['state']),
+        (op.join(path, 'untracked'), 'untracked'))
+    assert_false(is_dirty(path, untracked='no'))
+    _write(op.join(path, 'file'), 'modified')
+    res = find_change(path, untracked='no')
+    assert_equal(
+        (res['path'], res['state']),
+        (op.join(path, 'file'), 'modified'))
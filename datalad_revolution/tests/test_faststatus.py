@@ -0,0 +1,152 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test fast status reports against Git's"""
+
+import os
+import os.path as op
+import subprocess
+
+from datalad.tests.utils import (
+    SkipTest,
+    assert_equal,
+    ok_,
+    with_tempfile,
+)
+
+from ..dataset import RevolutionDataset as Dataset
+from ..faststatus import fast_status
+from ..gitindex import (
+    iter_staged,
+    open_index,
+)
+from .. import revstatus  # noqa: F401
+
+_porcelain_states = {
+    'M': 'modified',
+    'T': 'modified',
+    'D': 'deleted',
+    '?': 'untracked',
+}
+
+
+def _git(path, *args):
+    return subprocess.check_output(('git',) + args, cwd=path)
+
+
+def _make_repo(path, *init_args):
+    try:
+        _git(op.dirname(path), 'init', '-q', *(init_args + (path,)))
+    except subprocess.CalledProcessError:
+        raise SkipTest('git does not support {}'.format(init_args))
+    _git(path, 'config', 'user.name', 'Tester')
+    _git(path, 'config', 'user.email', 'tester@example.com')
+    for name in ('a', 'b', op.join('d', 'c'), op.join('d', 'e'), 'f'):
+        if not op.exists(op.dirname(op.join(path, name))):
+            os.makedirs(op.dirname(op.join(path, name)))
+        with open(op.join(path, name), 'w') as f:
+            f.write(name)
+    _git(path, 'add', '.')
+    _git(path, 'commit', '-q', '-m', 'initial')
+
+
+def _modify(path):
+    with open(op.join(path, 'a'), 'w') as f:
+        f.write('modified')
+    os.unlink(op.join(path, 'd', 'c'))
+    os.unlink(op.join(path, 'f'))
+    os.symlink('b', op.join(path, 'f'))
+    with open(op.join(path, 'u'), 'w') as f:
+        f.write('untracked')
+    os.makedirs(op.join(path, 'ud'))
+    with open(op.join(path, 'ud', 'x'), 'w') as f:
+        f.write('untracked')
+
+
+def _git_status(path):
+    out = _git(path, 'status', '--porcelain', '-z').decode('utf-8')
+    return sorted(
+        (op.join(path, p.rstrip('/')), _porcelain_states[line[1]])
+        for line in out.split('\0') if line
+        for p in [line[3:]])
+
+
+def _rev_status(path):
+    return sorted(
+        (r['path'], r['state'])
+        for r in Dataset(path).rev_status(result_renderer=None)
+        if r['state'] != 'clean')
+
+
+def _fast_status(path):
+    def query(paths=None):
+        raise AssertionError('unexpected query of {}'.format(paths))
+    return fast_status(path, query, untracked='normal')
+
+
+@with_tempfile(mkdir=True)
+def test_status_like_git(path):
+    repo = op.join(path, 'repo')
+    _make_repo(repo)
+    # a clean repository is reported from the index alone
+    res = _fast_status(repo)
+    ok_(res is not None)
+    assert_equal(
+        [r['state'] for r in res],
+        ['clean'] * 5)
+    _modify(repo)
+    assert_equal(_rev_status(repo), _git_status(repo))
+
+
+@with_tempfile(mkdir=True)
+def test_split_index(path):
+    repo = op.join(path, 'repo')
+    _make_repo(repo)
+    _git(repo, 'config', 'core.splitIndex', 'true')
+    _git(repo, 'update-index', '--split-index')
+    with open(op.join(repo, 'b'), 'w') as f:
+        f.write('staged')
+    _git(repo, 'add', 'b')
+    _git(repo, 'commit', '-q', '-m', 'split')
+    # entries of a split index are incomplete, Git must be asked instead
+    ok_(open_index(op.join(repo, '.git')) is None)
+    ok_(_fast_status(repo) is None)
+    assert_equal(
+        [p for p, mode, sha, stage in iter_staged(repo)],
+        [b'a', b'b', b'd/c', b'd/e', b'f'])
+    _modify(repo)
+    assert_equal(_rev_status(repo), _git_status(repo))
+
+
+@with_tempfile(mkdir=True)
+def test_sha256(path):
+    repo = op.join(path, 'repo')
+    _make_repo(repo, '--object-format=sha256')
+    ok_(open_index(op.join(repo, '.git')) is None)
+    assert_equal(
+        [len(sha) for p, mode, sha, stage in iter_staged(repo)],
+        [64] * 5)
+
+
+@with_tempfile(mkdir=True)
+def test_extended_flags(path):
+    repo = op.join(path, 'repo')
+    _make_repo(repo)
+    with open(op.join(repo, 'n'), 'w') as f:
+        f.write('new')
+    _git(repo, 'add', '--intent-to-add', 'n')
+    # an intent-to-add entry is not really staged
+    ok_(open_index(op.join(repo, '.git')) is None)
+    ok_(_fast_status(repo) is None)
+    _git(repo, 'reset', '-q')
+    ok_(open_index(op.join(repo, '.git')) is not None)
+    # a skip-worktree entry need not be in the work tree
+    _git(repo, 'update-index', '--skip-worktree', 'b')
+    os.unlink(op.join(repo, 'b'))
+    ok_(open_index(op.join(repo, '.git')) is None)
+    ok_(_fast_status(repo) is None)
@@ -0,0 +1,146 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test ignore rules against `git check-ignore`"""
+
+import os
+import os.path as op
+import subprocess
+
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from ..gitignore import IgnoreMatcher
+
+_ignore_files = {
+    'excludes': u'*.global\n!keep.global\n',
+    op.join('repo', '.git', 'info', 'exclude'): u'excluded\n',
+    op.join('repo', '.gitignore'): u'''\
+# comment
+*.log
+!important.log
+build/
+**/tmp
+a/**/z
+/rooted
+doc/*.txt
+\\#hash
+trailing\\ 
+spaces   
+deep/**
+!deep/kept
+[ab]c?.dat
+''',
+    op.join('repo', 'sub', '.gitignore'): u'''\
+!*.log
+local
+/only-here/
+''',
+}
+
+# directories end with a separator
+_paths = [
+    'x.log', 'important.log', 'x.global', 'keep.global', 'excluded',
+    'build/', 'build/f', 'sub/build', 'tmp/', 'sub/tmp', 'sub/deeper/tmp/',
+    'a/z', 'a/b/z', 'a/b/c/z/', 'b/a/z', 'rooted', 'sub/rooted',
+    'doc/x.txt', 'doc/sub/x.txt', 'sub/doc/x.txt', '#hash', 'trailing ',
+    'spaces', 'spaces   ', 'deep/f', 'deep/kept', 'ac1.dat', 'bcx.dat',
+    'cc1.dat', 'sub/x.log', 'sub/x.global', 'sub/local', 'sub/s/local/',
+    'sub/only-here/', 'only-here/', 'sub/s/only-here/', 'plain',
+]
+
+
+def _git(path, *args, **kwargs):
+    return subprocess.check_output(('git',) + args, cwd=path, **kwargs)
+
+
+def _git_ignored(repo, paths):
+    proc = subprocess.Popen(
+        ['git', 'check-ignore', '--no-index', '-z', '--stdin'], cwd=repo,
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    out, err = proc.communicate(
+        b''.join(p.encode('utf-8') + b'\0' for p in paths))
+    # exit code 1 if nothing is ignored
+    ok_(proc.returncode in (0, 1))
+    return set(p for p in out.decode('utf-8').split('\0') if p)
+
+
+def _ignored(matcher, repo, paths):
+    """Walk like untracked content is discovered, top-down"""
+    ignored = set()
+    matchers = {'': matcher}
+    for p in sorted(paths):
+        parent = op.dirname(p)
+        if any(parent == d or parent.startswith(d + '/') for d in ignored):
+            # not descended into, Git reports any content as ignored
+            ignored.add(p)
+            continue
+        parent_matcher = matchers[parent] if parent in matchers \
+            else _matcher_for(matchers, repo, parent)
+        if parent_matcher.is_ignored(p, op.isdir(op.join(repo, p))):
+            ignored.add(p)
+    return ignored
+
+
+def _matcher_for(matchers, repo, reldir):
+    parent = op.dirname(reldir)
+    matcher = matchers[parent] if parent in matchers \
+        else _matcher_for(matchers, repo, parent)
+    matchers[reldir] = matcher.for_directory(repo, reldir)
+    return matchers[reldir]
+
+
+@with_tempfile(mkdir=True)
+def test_ignored_like_git(path):
+    repo = op.join(path, 'repo')
+    _git(path, 'init', '-q', repo)
+    excludes = op.join(path, 'excludes')
+    _git(repo, 'config', 'core.excludesFile', excludes)
+    for name, content in _ignore_files.items():
+        if not op.exists(op.dirname(op.join(path, name))):
+            os.makedirs(op.dirname(op.join(path, name)))
+        with open(op.join(path, name), 'w') as f:
+            f.write(content)
+    paths = []
+    for p in _paths:
+        full = op.join(repo, p)
+        if p.endswith('/'):
+            if not op.exists(full):
+                os.makedirs(full)
+        else:
+            if not op.exists(op.dirname(full)):
+                os.makedirs(op.dirname(full))
+            with open(full, 'w') as f:
+                f.write(u'content')
+        paths.append(p.rstrip('/'))
+    # all leading directories are matched as well
+    paths = sorted(set(
+        p[:i] for p in paths for i in range(1, len(p) + 1)
+        if i == len(p) or p[i] == '/'))
+    git = _git_ignored(repo, paths)
+    ok_(git)
+    matcher = IgnoreMatcher.for_worktree(
+        repo, op.join(repo, '.git'), excludes_file=excludes)
+    assert_equal(sorted(_ignored(matcher, repo, paths)), sorted(git))
+    # without a configured excludes file, Git's default one is used
+    os.makedirs(op.join(path, 'git'))
+    os.rename(excludes, op.join(path, 'git', 'ignore'))
+    _git(repo, 'config', '--unset', 'core.excludesFile')
+    with patch.dict('os.environ', {'XDG_CONFIG_HOME': path}):
+        git = _git_ignored(repo, paths)
+        assert_in('x.global', git)
+        assert_equal(
+            sorted(_ignored(
+                IgnoreMatcher.for_worktree(repo, op.join(repo, '.git')),
+                repo, paths)),
+            sorted(git))
@@ -0,0 +1,130 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test content hashing against hashlib, Git, and git-annex"""
+
+import hashlib
+import os
+import os.path as op
+import subprocess
+
+from datalad.api import create
+from datalad.support.external_versions import external_versions
+from datalad.tests.utils import (
+    SkipTest,
+    assert_equal,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from .. import hashing
+
+_samples = {
+    'empty': b'',
+    'small.txt': b'small content\n',
+    'large.tar.gz': b'0123456789abcdef' * 4096,
+    'odd.dat': b'\0\xff' * 1000 + b'x',
+}
+
+
+def _make_samples(path):
+    for name, content in _samples.items():
+        with open(op.join(path, name), 'wb') as f:
+            f.write(content)
+    return [op.join(path, name) for name in sorted(_samples)]
+
+
+@with_tempfile(mkdir=True)
+def test_hash_files(path):
+    files = _make_samples(path)
+    # small files are buffered, large ones memory-mapped
+    for threshold in (hashing.large_file_threshold, 100):
+        with patch.object(hashing, 'large_file_threshold', threshold):
+            for algorithm in ('md5', 'sha1', 'sha256'):
+                stats = hashing.HashStats()
+                res = dict(hashing.hash_files(
+                    files + [op.join(path, 'nothere')], algorithm,
+                    jobs=2, stats=stats))
+                ok_(isinstance(res.pop(op.join(path, 'nothere')), OSError))
+                assert_equal(
+                    res,
+                    dict((p, hashlib.new(
+                        algorithm, _samples[op.basename(p)]).hexdigest())
+                        for p in files))
+                assert_equal(stats.files, len(files))
+                assert_equal(
+                    stats.bytes, sum(len(c) for c in _samples.values()))
+            # Git blob IDs
+            out = subprocess.check_output(
+                ['git', 'hash-object', '--no-filters'] + files)
+            assert_equal(
+                [hashing.hash_file(p, 'sha1', git_blob=True) for p in files],
+                out.decode('ascii').split())
+
+
+def test_key_extension():
+    for name, ext in (
+            ('a.tar.gz', '.tar.gz'),
+            ('a.b.c.txt', '.c.txt'),
+            ('noext', ''),
+            ('a.toolong', ''),
+            ('a.toolong.gz', '.gz'),
+            (op.join('d.dir', 'f'), '')):
+        assert_equal(hashing.get_key_extension(name), ext)
+    assert_equal(hashing.get_key_backend('MD5E-s1--abc.txt'),
+                 ('MD5E', 'md5'))
+    assert_equal(hashing.get_key_backend('WORM-s1--x'), ('WORM', None))
+
+
+@with_tempfile(mkdir=True)
+def test_annex_keys(path):
+    files = _make_samples(path)
+    keys = {}
+    for p in files:
+        content = _samples[op.basename(p)]
+        backend = 'SHA256E' if p.endswith('.gz') else 'MD5E'
+        keys[p] = hashing.get_annex_key(
+            p, backend,
+            hashlib.new(hashing.get_key_backend(backend)[1],
+                        content).hexdigest(),
+            len(content))
+    assert_equal(
+        keys[op.join(path, 'large.tar.gz')],
+        'SHA256E-s65536--{}.tar.gz'.format(
+            hashlib.sha256(_samples['large.tar.gz']).hexdigest()))
+    keys[op.join(path, 'odd.dat')] = 'WORM-s2001--m1s2'
+    res = dict(hashing.verify_annex_keys(keys, jobs=2))
+    assert_equal(res, dict((p, not p.endswith('.dat')) for p in files))
+    with open(op.join(path, 'small.txt'), 'wb') as f:
+        f.write(b'modified')
+    assert_equal(
+        dict(hashing.verify_annex_keys(keys))[op.join(path, 'small.txt')],
+        False)
+
+
+@with_tempfile(mkdir=True)
+def test_keys_like_annex(path):
+    if external_versions['cmd:annex'] is None:
+        raise SkipTest('git-annex is not available')
+    ds = create(path)
+    files = _make_samples(ds.path)
+    for backend in ('MD5E', 'SHA1', 'SHA256E', 'SHA512E'):
+        algorithm = hashing.get_key_backend(backend)[1]
+        for p in files:
+            try:
+                out = subprocess.check_output(
+                    ['git', 'annex', 'calckey', '--backend', backend, p],
+                    cwd=ds.path)
+            except subprocess.CalledProcessError:
+                raise SkipTest('git-annex does not support calckey')
+            assert_equal(
+                hashing.get_annex_key(
+                    p, backend, hashing.hash_file(p, algorithm),
+                    os.stat(p).st_size),
+                out.decode('ascii').strip())
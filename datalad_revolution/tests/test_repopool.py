@@ -0,0 +1,66 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test the pool of dataset and repository instances"""
+
+import os.path as op
+
+from datalad.api import create
+from datalad.tests.utils import (
+    assert_equal,
+    ok_,
+    with_tempfile,
+)
+
+from ..dataset import RevolutionDataset as Dataset
+from ..repopool import RepoPool
+
+
+class Batched(object):
+    """Stands in for the batched git-annex processes of a repository"""
+    def __init__(self):
+        self.closed = 0
+
+    def close(self):
+        self.closed += 1
+
+
+@with_tempfile(mkdir=True)
+def test_eviction_and_reuse(path):
+    paths = [op.join(path, name) for name in ('a', 'b', 'c')]
+    for p in paths:
+        create(p, no_annex=True)
+    pool = RepoPool(size=2)
+    a, b = [pool.get_dataset(p) for p in paths[:2]]
+    batched = b.repo._batched = Batched()
+    assert_equal(len(pool), 2)
+    # instances are reused, as the same flyweight
+    ok_(pool.get_dataset(paths[0]) is a)
+    ok_(pool.get_repo(paths[0]) is a.repo)
+    ok_(Dataset(paths[0]) is a)
+    # the least recently used dataset is dropped, and its processes closed
+    c = pool.get_dataset(paths[2])
+    assert_equal(len(pool), 2)
+    assert_equal(batched.closed, 1)
+    ok_(pool.get_dataset(paths[0]) is a)
+    ok_(pool.get_dataset(paths[2]) is c)
+    # a changed configuration yields a new instance
+    batched = c.repo._batched = Batched()
+    with open(op.join(paths[2], '.git', 'config'), 'a') as f:
+        f.write(u'[datalad "x"]\n\ty = z\n')
+    new_c = pool.get_dataset(paths[2])
+    ok_(new_c is not c)
+    assert_equal(new_c.config.get('datalad.x.y'), 'z')
+    assert_equal(batched.closed, 1)
+    # nothing is pooled without a repository
+    ok_(pool.get_dataset(op.join(path, 'nothere')).repo is None)
+    assert_equal(len(pool), 2)
+    batched = new_c.repo._batched = Batched()
+    pool.clear()
+    assert_equal(len(pool), 0)
+    assert_equal(batched.closed, 1)
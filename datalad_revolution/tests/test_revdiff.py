@@ -0,0 +1,152 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test parallel difference reports against serial ones"""
+
+import os
+import os.path as op
+import threading
+
+from datalad.api import (
+    create,
+    diff,
+)
+from datalad.support.external_versions import external_versions
+from datalad.support.gitrepo import GitRepo
+from datalad.tests.utils import (
+    SkipTest,
+    assert_equal,
+    assert_in,
+    ok_,
+    with_tempfile,
+)
+
+from ..dataset import (
+    RevolutionConfigManager,
+    RevolutionDataset as Dataset,
+)
+from ..repopool import get_dataset
+from .. import revdiff  # noqa: F401
+
+
+def _report(res):
+    return [(r['path'], r['type'], r['state']) for r in res]
+
+
+def _streamed(res):
+    # a streamed report has deleted content in path order, and no
+    # records for the dataset itself
+    return sorted(
+        (r['path'], r['type'], r['state'], r.get('bytesize', None))
+        for r in res if r['path'] != r['parentds'])
+
+
+@with_tempfile(mkdir=True)
+def test_parallel_diff(path):
+    ds = create(path, no_annex=True)
+    sub = ds.create('sub', no_annex=True)
+    subsub = sub.create('subsub', no_annex=True)
+    for d in (ds, sub, subsub):
+        for name in ('a', 'b'):
+            with open(op.join(d.path, name), 'w') as f:
+                f.write(name)
+    ds.save(recursive=True)
+    for d in (ds, sub, subsub):
+        with open(op.join(d.path, 'a'), 'w') as f:
+            f.write('modified')
+        with open(op.join(d.path, 'u'), 'w') as f:
+            f.write('untracked')
+    ds = Dataset(path)
+    serial = _report(ds.rev_diff(
+        fr='HEAD', to=None, recursive=True, jobs=1, result_renderer=None))
+    assert_in((op.join(path, 'sub', 'subsub', 'a'), 'file', 'modified'),
+              serial)
+    assert_equal(
+        serial,
+        _report(diff(fr='HEAD', to=None, dataset=path, recursive=True,
+                     result_renderer=None)))
+    assert_equal(
+        serial,
+        _report(ds.rev_diff(
+            fr='HEAD', to=None, recursive=True, jobs=4,
+            result_renderer=None)))
+
+
+@with_tempfile(mkdir=True)
+def test_concurrent_instances(path):
+    create(path, no_annex=True)
+    datasets = []
+    values = []
+    barrier = threading.Event()
+
+    def get():
+        barrier.wait()
+        ds = get_dataset(path)
+        datasets.append(ds)
+        for i in range(20):
+            ds.config.reload(force=True)
+            values.append(ds.config.get('core.bare', None))
+
+    threads = [threading.Thread(target=get) for i in range(8)]
+    for t in threads:
+        t.start()
+    barrier.set()
+    for t in threads:
+        t.join()
+    assert_equal(len(datasets), 8)
+    ok_(all(ds is datasets[0] for ds in datasets))
+    ok_(isinstance(datasets[0].repo, GitRepo))
+    ok_(isinstance(datasets[0].config, RevolutionConfigManager))
+    # no reader saw a partially loaded configuration
+    assert_equal(values, ['false'] * 160)
+
+
+def _check_streamed_diff(path):
+    ds = Dataset(path)
+    for fr in ('HEAD~1', None):
+        assert_equal(
+            _streamed(diff(fr=fr, to='HEAD', dataset=path, recursive=True,
+                           result_renderer=None)),
+            _streamed(ds.rev_diff(fr=fr, to='HEAD', recursive=True,
+                                  result_renderer=None)))
+
+
+@with_tempfile(mkdir=True)
+def test_streamed_diff(path):
+    ds = create(path, no_annex=True)
+    sub = ds.create('sub', no_annex=True)
+    # a symlink into the annex object store is reported as a file, no
+    # matter whether there is an annex
+    for d in (ds, sub):
+        os.symlink(
+            op.join('.git', 'annex', 'objects', 'XX', 'YY', 'key', 'key'),
+            op.join(d.path, 'annexed'))
+        os.symlink('elsewhere', op.join(d.path, 'link'))
+        with open(op.join(d.path, 'file'), 'w') as f:
+            f.write('content')
+    ds.save(recursive=True)
+    res = _streamed(Dataset(path).rev_diff(
+        fr='HEAD~1', to='HEAD', recursive=True, result_renderer=None))
+    assert_in(op.join(path, 'sub', 'annexed'),
+              [r[0] for r in res if r[1] == 'file'])
+    assert_in(op.join(path, 'link'),
+              [r[0] for r in res if r[1] == 'symlink'])
+    _check_streamed_diff(path)
+
+
+@with_tempfile(mkdir=True)
+def test_streamed_diff_annex(path):
+    if external_versions['cmd:annex'] is None:
+        raise SkipTest('no git-annex')
+    ds = create(path)
+    sub = ds.create('sub')
+    for d in (ds, sub):
+        with open(op.join(d.path, 'annexed'), 'w') as f:
+            f.write('annexed content')
+    ds.save(recursive=True)
+    _check_streamed_diff(path)
@@ -0,0 +1,94 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test status reports of many independent datasets"""
+
+import os.path as op
+
+from datalad.api import create
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from .. import revmultistatus
+from ..dataset import RevolutionDataset as Dataset
+from ..revmultistatus import multi_status
+
+
+def _report(res):
+    return [(r['path'], r['type'], r['state']) for r in res]
+
+
+def _make_datasets(path, names):
+    roots = []
+    for i, name in enumerate(names):
+        ds = create(op.join(path, name), no_annex=True)
+        if i % 2:
+            ds.create('sub', no_annex=True)
+        for j in range(i + 1):
+            with open(op.join(ds.path, 'u{}'.format(j)), 'w') as f:
+                f.write(u'untracked')
+        roots.append(ds.path)
+    return roots
+
+
+@with_tempfile(mkdir=True)
+def test_multi_status(path):
+    roots = _make_datasets(path, ('a', 'b', 'c', 'd'))
+    for recursive in (False, True):
+        for jobs in (1, 3):
+            by_root = dict((root, []) for root in roots)
+            for r in multi_status(roots, recursive=recursive, jobs=jobs):
+                # every record is tagged with its dataset
+                by_root[r['root']].append(r)
+            for root in roots:
+                ok_(by_root[root])
+                ok_(all(r['path'].startswith(root) for r in by_root[root]))
+                # the records of a dataset are those of a separate query,
+                # in order
+                assert_equal(
+                    _report(by_root[root]),
+                    _report(Dataset(root).rev_status(
+                        recursive=recursive, result_renderer=None)))
+    assert_in(
+        (op.join(roots[3], 'u3'), 'file', 'untracked'),
+        _report(multi_status(roots[3:])))
+
+
+@with_tempfile(mkdir=True)
+def test_multi_status_error(path):
+    roots = _make_datasets(path, ('a', 'b'))
+    nothere = op.join(path, 'nothere')
+    res = list(multi_status([roots[0], nothere, roots[1]], jobs=2))
+    errors = [r for r in res if r['status'] != 'ok']
+    # one error record for the dataset that does not exist
+    assert_equal(len(errors), 1)
+    assert_equal(errors[0]['root'], nothere)
+    assert_equal(errors[0]['path'], nothere)
+    assert_equal(errors[0]['status'], 'error')
+    # the other datasets are reported in full
+    assert_equal(
+        sorted(r['path'] for r in res if r['status'] == 'ok'),
+        sorted(r['path'] for root in roots
+               for r in Dataset(root).rev_status(result_renderer=None)))
+
+
+@with_tempfile(mkdir=True)
+def test_multi_status_stop_early(path):
+    roots = _make_datasets(path, ('a', 'b', 'c'))
+    # workers wait for the consumer after a single result, and give up
+    # when it stops
+    with patch.object(revmultistatus, 'max_pending_results', 1):
+        res = multi_status(roots, jobs=2)
+        r = next(res)
+        assert_in(r['root'], roots)
+        res.close()
@@ -0,0 +1,101 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test requests from the thin client to a running server"""
+
+import json
+import os
+import os.path as op
+import subprocess
+import sys
+import threading
+
+from six.moves import StringIO
+
+from datalad.api import create
+from datalad.tests.utils import (
+    assert_equal,
+    assert_false,
+    assert_raises,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from .. import client
+from ..dataset import RevolutionDataset as Dataset
+from ..revserver import CommandServer
+from .. import revstatus  # noqa: F401
+
+
+def _report(res):
+    return [(r['path'], r['type'], r['state']) for r in res]
+
+
+def test_client_without_datalad():
+    # DataLad is not loaded by the client
+    out = subprocess.check_output([
+        sys.executable, '-c',
+        'import sys, datalad_revolution.client; '
+        'print(any(m.split(".")[0] == "datalad" for m in sys.modules))'])
+    assert_equal(out.strip(), b'False')
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile(mkdir=True)
+def test_round_trip(path, sockdir):
+    ds = create(path, no_annex=True)
+    ds.create('sub', no_annex=True)
+    with open(op.join(path, 'u'), 'w') as f:
+        f.write('untracked')
+    sock = op.join(sockdir, 's')
+    server = CommandServer(sock)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        pong = list(client.request('ping', socket_path=sock))
+        assert_equal(pong, [])
+        target = _report(Dataset(path).rev_status(
+            recursive=True, result_renderer=None))
+        assert_equal(
+            _report(client.request(
+                'rev_status', socket_path=sock, cwd=path, recursive=True)),
+            target)
+        # relative to the working directory of the request
+        assert_equal(
+            _report(client.request(
+                'rev_status', socket_path=sock, cwd=op.join(path, 'sub'),
+                dataset=op.pardir, recursive=True)),
+            target)
+        assert_raises(
+            client.ServerError,
+            list, client.request('nothere', socket_path=sock))
+        # the command line tool, the socket is not looked up when given
+        with patch.object(client, 'get_socket_path') as get_socket_path, \
+                patch('sys.stdout', new_callable=StringIO) as out:
+            assert_equal(
+                client.main(['--socket', sock, '--json', 'rev-status',
+                             '-d', path, '-r']),
+                0)
+        assert_false(get_socket_path.called)
+        assert_equal(
+            _report(json.loads(l) for l in out.getvalue().splitlines()),
+            target)
+    finally:
+        server.shutdown()
+        server.close()
+    ok_(not op.exists(sock))
+    # no server
+    with patch('sys.stderr', new_callable=StringIO):
+        assert_equal(client.main(['--socket', sock, 'ping']), 2)
+    # the socket is looked up, if not given
+    with patch.dict(os.environ, {client.socket_env: sock}), \
+            patch('sys.stderr', new_callable=StringIO) as err:
+        assert_equal(client.main(['ping']), 2)
+    ok_(sock in err.getvalue())
@@ -0,0 +1,93 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test parallel status reports against serial ones"""
+
+import os
+import os.path as op
+import subprocess
+
+from datalad.api import (
+    create,
+    status,
+)
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    with_tempfile,
+)
+
+from ..dataset import RevolutionDataset as Dataset
+from .. import revstatus  # noqa: F401
+
+
+def _make_hierarchy(path, unregistered=True):
+    ds = create(path, no_annex=True)
+    sub = ds.create('sub', no_annex=True)
+    sub.create('subsub', no_annex=True)
+    ds.save(recursive=True)
+    untracked = [
+        op.join(path, 'u'),
+        op.join(path, 'udir', 'deeper', 'u'),
+        op.join(path, 'u-1'),
+        op.join(path, 'sub', 'subsub', 'u'),
+    ]
+    if unregistered:
+        # a nested repository that is staged, but not registered in
+        # .gitmodules
+        nested = op.join(path, 'nested')
+        create(nested, no_annex=True)
+        subprocess.check_call(['git', 'add', 'nested'], cwd=path)
+        untracked.append(op.join(nested, 'u'))
+    os.makedirs(op.join(path, 'udir', 'deeper'))
+    for p in untracked:
+        with open(p, 'w') as f:
+            f.write('untracked')
+    return ds
+
+
+def _report(res):
+    # in reporting order, which must not depend on the number of jobs
+    return [(r['path'], r['type'], r['state']) for r in res]
+
+
+@with_tempfile(mkdir=True)
+def test_parallel_status(path):
+    _make_hierarchy(path)
+    ds = Dataset(path)
+    serial = _report(ds.rev_status(
+        recursive=True, jobs=1, result_renderer=None))
+    assert_in((op.join(path, 'nested', 'u'), 'file', 'untracked'), serial)
+    assert_in(
+        (op.join(path, 'sub', 'subsub', 'u'), 'file', 'untracked'), serial)
+    assert_equal(
+        serial,
+        _report(status(dataset=path, recursive=True, result_renderer=None)))
+    assert_equal(
+        serial,
+        _report(ds.rev_status(
+            recursive=True, jobs=4, result_renderer=None)))
+
+
+@with_tempfile(mkdir=True)
+def test_targeted_status(path):
+    # a path constrained regular query fails on a subdataset that is not
+    # registered in .gitmodules
+    _make_hierarchy(path, unregistered=False)
+    ds = Dataset(path)
+    # a trailing separator addresses the content of a subdataset
+    for paths in (['sub/'], ['sub/subsub/'], ['sub/', 'u'],
+                  ['sub', 'sub/'], ['sub/', 'sub/subsub/u'], ['sub/subsub']):
+        target = _report(status(
+            dataset=ds, path=paths, recursive=True, result_renderer=None))
+        for jobs in (1, 4):
+            assert_equal(
+                target,
+                _report(ds.rev_status(
+                    path=paths, recursive=True, jobs=jobs,
+                    result_renderer=None)))
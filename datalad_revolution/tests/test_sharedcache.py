@@ -0,0 +1,119 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test sharing of query results between processes"""
+
+import errno
+import os
+import os.path as op
+import shutil
+
+from datalad.api import create
+from datalad.tests.utils import (
+    assert_equal,
+    assert_not_equal,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from .. import sharedcache
+
+_params = dict(command='test')
+
+
+class Query(object):
+    """Counts how often the query is performed"""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        yield dict(path='a', status='ok', logger=object())
+        yield dict(path='b', status='ok')
+
+
+def _cache_dir(path):
+    return op.join(path, '.git', 'datalad', 'revolution', 'sharedcache')
+
+
+def _shared(path, query, max_age=60):
+    return list(sharedcache.shared_results(
+        path, _params, query, max_age=max_age))
+
+
+_expected = [dict(path='a', status='ok'), dict(path='b', status='ok')]
+
+
+@with_tempfile(mkdir=True)
+def test_cache_hit(path):
+    create(path, no_annex=True)
+    query = Query()
+    res = _shared(path, query)
+    # the computing process reports the original records
+    assert_equal([r['path'] for r in res], ['a', 'b'])
+    ok_('logger' in res[0])
+    assert_equal(query.calls, 1)
+    # a recent result is reused
+    assert_equal(_shared(path, query), _expected)
+    assert_equal(query.calls, 1)
+    # but not by a process that was not waiting for it
+    _shared(path, query, max_age=0)
+    assert_equal(query.calls, 2)
+    # the key changes with the index
+    key = sharedcache.get_key(path, _params)
+    with open(op.join(path, 'new'), 'w') as f:
+        f.write(u'new')
+    create(path, force=True, no_annex=True).save('new')
+    assert_not_equal(sharedcache.get_key(path, _params), key)
+    _shared(path, query)
+    assert_equal(query.calls, 3)
+    # a result that cannot be read is computed again
+    key = sharedcache.get_key(path, _params)
+    with open(op.join(_cache_dir(path), key + '.json'), 'w') as f:
+        f.write(u'{incomplete')
+    assert_equal([r['path'] for r in _shared(path, query)], ['a', 'b'])
+    assert_equal(query.calls, 4)
+    assert_equal(_shared(path, query), _expected)
+    assert_equal(query.calls, 4)
+    # no temporary files are left behind
+    ok_(not [n for n in os.listdir(_cache_dir(path)) if n.endswith('.tmp')])
+
+
+@with_tempfile(mkdir=True)
+def test_fallback(path):
+    create(path, no_annex=True)
+    query = Query()
+    # the results cannot be shared without file locks
+    with patch('fcntl.lockf', side_effect=IOError(errno.ENOLCK, 'no locks')):
+        assert_equal(len(_shared(path, query)), 2)
+        assert_equal(len(_shared(path, query)), 2)
+    assert_equal(query.calls, 2)
+    # nor if the cache cannot be created
+    shutil.rmtree(_cache_dir(path))
+    with open(_cache_dir(path), 'w') as f:
+        f.write(u'not a directory')
+    assert_equal(len(_shared(path, query)), 2)
+    assert_equal(query.calls, 3)
+    os.unlink(_cache_dir(path))
+    os.rmdir(op.dirname(_cache_dir(path)))
+    with open(op.dirname(_cache_dir(path)), 'w') as f:
+        f.write(u'not a directory')
+    assert_equal(len(_shared(path, query)), 2)
+    assert_equal(query.calls, 4)
+    os.unlink(op.dirname(_cache_dir(path)))
+    # nor if the results cannot be written
+    with patch('os.rename', side_effect=OSError(errno.EROFS, 'read-only')):
+        assert_equal(len(_shared(path, query)), 2)
+    assert_equal(query.calls, 5)
+    ok_(not [n for n in os.listdir(_cache_dir(path))
+             if not n.endswith('.lock')])
+    # an existing cache directory is fine
+    _shared(path, query)
+    assert_equal(_shared(path, query), _expected)
+    assert_equal(query.calls, 6)
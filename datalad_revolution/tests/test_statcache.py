@@ -0,0 +1,151 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test the persistent cache of file stat fingerprints"""
+
+import os
+import os.path as op
+import sqlite3
+import time
+
+from datalad.tests.utils import (
+    assert_equal,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from .. import statcache
+from ..statcache import StatCache
+
+
+def _write(path, content, age=10):
+    with open(path, 'w') as f:
+        f.write(content)
+    if age:
+        t = time.time() - age
+        os.utime(path, (t, t))
+    return os.lstat(path)
+
+
+def _record(git_dir, path, content):
+    # the change time is always recent, racy entries are tested separately
+    with patch.object(statcache, 'racy_interval', 0), \
+            StatCache(git_dir) as cache:
+        ok_(cache.update('f', _write(path, content), 'sha-' + content))
+
+
+@with_tempfile(mkdir=True)
+def test_invalidation(path):
+    git_dir = op.join(path, '.git')
+    f = op.join(path, 'f')
+    _record(git_dir, f, 'content')
+    st = os.lstat(f)
+    with StatCache(git_dir) as cache:
+        assert_equal(cache.lookup('f', st), ('sha-content', None))
+        assert_equal(cache.lookup('other', st), None)
+    # changed size
+    with StatCache(git_dir) as cache:
+        ok_(cache.lookup('f', _write(f, 'longer content')) is None)
+        assert_equal(cache.recorded('f'), ('sha-content', None))
+    # changed mtime, same size
+    _record(git_dir, f, 'content')
+    t = time.time() - 100
+    os.utime(f, (t, t))
+    with StatCache(git_dir) as cache:
+        ok_(cache.lookup('f', os.lstat(f)) is None)
+    # changed inode, same size and mtime
+    _record(git_dir, f, 'content')
+    st = os.lstat(f)
+    _write(f + '.new', 'CONTENT', age=0)
+    os.utime(f + '.new', ns=(st.st_atime_ns, st.st_mtime_ns))
+    os.rename(f + '.new', f)
+    new_st = os.lstat(f)
+    assert_equal(new_st.st_mtime_ns, st.st_mtime_ns)
+    ok_(new_st.st_ino != st.st_ino)
+    with StatCache(git_dir) as cache:
+        ok_(cache.lookup('f', new_st) is None)
+    # a fingerprint taken from the stat result of the recording is trusted
+    _record(git_dir, f, 'content')
+    with StatCache(git_dir) as cache:
+        assert_equal(cache.lookup('f', os.lstat(f)), ('sha-content', None))
+
+
+@with_tempfile(mkdir=True)
+def test_racy_clean(path):
+    git_dir = op.join(path, '.git')
+    f = op.join(path, 'f')
+    # a file modified as it is recorded may be modified again without a
+    # change of its timestamps
+    with StatCache(git_dir) as cache:
+        ok_(not cache.update('f', _write(f, 'content', age=0), 'sha'))
+        ok_(cache.lookup('f', os.lstat(f)) is None)
+    ok_(not op.exists(StatCache(git_dir).path))
+    st = _write(f, 'content', age=0)
+    with patch.object(statcache, 'racy_interval', 0):
+        with StatCache(git_dir) as cache:
+            ok_(cache.update('f', st, 'sha'))
+    with StatCache(git_dir) as cache:
+        assert_equal(cache.lookup('f', st), ('sha', None))
+
+
+@with_tempfile(mkdir=True)
+def test_corrupt_database(path):
+    git_dir = op.join(path, '.git')
+    f = op.join(path, 'f')
+    _record(git_dir, f, 'content')
+    db_path = StatCache(git_dir).path
+    with open(db_path, 'wb') as db:
+        db.write(b'garbage' * 1000)
+    st = os.lstat(f)
+    with patch.object(statcache, 'racy_interval', 0), \
+            StatCache(git_dir) as cache:
+        ok_(cache.lookup('f', st) is None)
+        ok_(cache.update('f', st, 'sha-new'))
+    # the database was replaced
+    with StatCache(git_dir) as cache:
+        assert_equal(cache.lookup('f', st), ('sha-new', None))
+
+
+@with_tempfile(mkdir=True)
+def test_unusable_database(path):
+    git_dir = op.join(path, '.git')
+    f = op.join(path, 'f')
+    _record(git_dir, f, 'content')
+    st = os.lstat(f)
+    # locked by another process
+    other = sqlite3.connect(StatCache(git_dir).path)
+    try:
+        other.execute('BEGIN EXCLUSIVE')
+        with patch.object(statcache, 'lock_timeout', 0.1), \
+                patch.object(statcache, 'racy_interval', 0), \
+                StatCache(git_dir) as cache:
+            ok_(cache.lookup('f', st) is None)
+            ok_(cache.update('f', st, 'sha-new'))
+    finally:
+        other.close()
+    # the database is unchanged
+    with StatCache(git_dir) as cache:
+        assert_equal(cache.lookup('f', st), ('sha-content', None))
+    # cannot be opened
+    with patch('sqlite3.connect',
+               side_effect=sqlite3.OperationalError('unable to open')), \
+            patch.object(statcache, 'racy_interval', 0), \
+            StatCache(git_dir) as cache:
+        ok_(cache.lookup('f', st) is None)
+        ok_(cache.update('f', st, 'sha-new'))
+    # cannot be created
+    git_dir = op.join(path, 'other')
+    os.makedirs(op.join(git_dir, 'datalad'))
+    with open(op.join(git_dir, 'datalad', 'revolution'), 'w') as fobj:
+        fobj.write(u'not a directory')
+    with patch.object(statcache, 'racy_interval', 0), \
+            StatCache(git_dir) as cache:
+        ok_(cache.lookup('f', st) is None)
+        ok_(cache.update('f', st, 'sha'))
+    ok_(not op.exists(StatCache(git_dir).path))
@@ -0,0 +1,106 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Test tracing of git/git-annex calls"""
+
+import json
+import os.path as op
+
+from datalad.api import create
+from datalad.cmd import Runner
+from datalad.support.exceptions import CommandError
+from datalad.support.gitrepo import GitRepo
+from datalad.tests.utils import (
+    assert_equal,
+    assert_in,
+    assert_raises,
+    ok_,
+    patch,
+    with_tempfile,
+)
+
+from .. import tracing
+
+
+def test_command_type():
+    assert_equal(tracing.command_type(['git', 'ls-files', '-z']),
+                 'git ls-files')
+    assert_equal(
+        tracing.command_type(['git', '-c', 'a=b', '--git-dir', 'x', 'config']),
+        'git config')
+    assert_equal(tracing.command_type('git annex find --json'),
+                 'git-annex find')
+    assert_equal(tracing.command_type(['ls', '-l']), 'ls')
+
+
+def test_no_tracing_by_default():
+    # loading the extension leaves DataLad's runner alone
+    ok_(Runner.run is tracing._orig_run)
+
+
+@with_tempfile(mkdir=True)
+@with_tempfile
+@with_tempfile
+def test_trace(path, chrome_path, plain_path):
+    create(path, no_annex=True)
+    repo = GitRepo(path)
+    with tracing.trace_subprocesses() as trace:
+        ok_(Runner.run is not tracing._orig_run)
+        repo._git_custom_command([], ['git', 'ls-files', '-z'])
+        assert_raises(
+            CommandError,
+            repo._git_custom_command, [], ['git', 'rev-parse', 'nothere'],
+            expect_stderr=True)
+        # and a call that was not made by the runner
+        tracing.record_call(['git', 'ls-tree', '-r'], path, 0, 0.5, 0, 10)
+    ok_(Runner.run is tracing._orig_run)
+    assert_equal(len(trace), 3)
+    ls, rev_parse, ls_tree = trace.records
+    assert_equal(ls.argv, ['git', 'ls-files', '-z'])
+    assert_equal(ls.cwd, path)
+    assert_equal(ls.exit_code, 0)
+    ok_(ls.stdout_size > 0)
+    ok_(rev_parse.exit_code != 0)
+    assert_equal(ls_tree.stdout_size, 10)
+    summary = trace.summary()
+    assert_equal(list(summary)[0], 'git ls-tree')
+    assert_equal(summary['git rev-parse']['failed'], 1)
+    assert_equal(summary['git ls-files']['count'], 1)
+
+    trace.dump(chrome_path + '.json')
+    with open(chrome_path + '.json') as f:
+        chrome = json.load(f)
+    assert_equal(
+        [e['name'] for e in chrome['traceEvents']],
+        ['git ls-files', 'git rev-parse', 'git ls-tree'])
+    assert_equal(chrome['traceEvents'][2]['dur'], 500000)
+    trace.dump(plain_path)
+    with open(plain_path) as f:
+        plain = json.load(f)
+    assert_equal(plain[0]['argv'], ['git', 'ls-files', '-z'])
+
+
+@with_tempfile(mkdir=True)
+def test_trace_from_config(path):
+    create(path, no_annex=True)
+    ok_(tracing.enable_tracing_from_config({}) is None)
+    trace_path = op.join(path, 'trace.json')
+    with patch('atexit.register') as register:
+        trace = tracing.enable_tracing_from_config(
+            {'datalad.revolution.trace': trace_path})
+    try:
+        GitRepo(path)._git_custom_command([], ['git', 'status'])
+    finally:
+        tracing.disable_tracing(trace)
+    assert_in('git status', trace.summary())
+    # the trace is written on exit
+    dump = register.call_args[0][0]
+    dump()
+    with open(trace_path) as f:
+        assert_in('git status',
+                  [e['name'] for e in json.load(f)['traceEvents']])
@@ -0,0 +1,336 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Accounting and tracing of git/git-annex subprocess invocations
+
+Tracing is opt-in. It can be enabled for a code block via the
+`trace_subprocesses()` context manager, or for a whole process by
+setting the configuration variable `datalad.revolution.trace` (e.g.
+via the environment variable `DATALAD_REVOLUTION_TRACE`) to the path
+of a file the trace will be written to on exit. The latter is evaluated
+once, when a command of the extension first obtains a dataset from the
+repository pool (see `repopool.get_pool()`), not when the extension is
+loaded. A file name ending in '.json' receives a Chrome trace (loadable
+in chrome://tracing or Perfetto), any other name receives the plain list
+of records.
+
+DataLad's command runner is only replaced while any trace is enabled.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import (
+    OrderedDict,
+    namedtuple,
+)
+from contextlib import contextmanager
+
+from datalad.cmd import Runner
+from datalad.support.exceptions import CommandError
+
+lgr = logging.getLogger('datalad.revolution.tracing')
+
+
+SubprocessRecord = namedtuple(
+    'SubprocessRecord',
+    ['argv', 'cwd', 'start', 'duration', 'exit_code', 'stdout_size',
+     'thread'])
+
+
+# git options that take a separate value argument and precede the
+# actual git command
+_git_opts_with_value = ('-c', '-C', '--git-dir', '--work-tree',
+                        '--namespace', '--exec-path')
+
+
+def command_type(argv):
+    """Determine the command type of a git/git-annex call
+
+    Global options are skipped, such that all invocations of the same
+    (sub)command are aggregated, regardless of their arguments.
+
+    Parameters
+    ----------
+    argv : list or str
+
+    Returns
+    -------
+    str
+      E.g. 'git ls-files', or 'git-annex find'. For any other command
+      just the name of the executable.
+    """
+    if not argv:
+        return ''
+    if not isinstance(argv, (list, tuple)):
+        argv = argv.split()
+    exe = os.path.basename(argv[0])
+    if exe not in ('git', 'git-annex'):
+        return exe
+    args = iter(argv[1:])
+    for a in args:
+        if a in _git_opts_with_value:
+            # skip the value too
+            next(args, None)
+            continue
+        if a.startswith('-'):
+            continue
+        if exe == 'git' and a == 'annex':
+            exe = 'git-annex'
+            continue
+        return '{} {}'.format(exe, a)
+    return exe
+
+
+class SubprocessTrace(object):
+    """Collection of records of traced subprocess invocations
+
+    Records are only taken for git and git-annex calls.
+    """
+    def __init__(self):
+        self.records = []
+        self._lock = threading.Lock()
+        self._t0 = time.time()
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, argv, cwd, start, duration, exit_code, stdout,
+            stdout_size=None):
+        rec = SubprocessRecord(
+            argv=list(argv) if isinstance(argv, (list, tuple))
+            else argv.split(),
+            cwd=cwd,
+            start=start,
+            duration=duration,
+            exit_code=exit_code,
+            stdout_size=len(stdout) if stdout else stdout_size or 0,
+            thread=threading.current_thread().ident,
+        )
+        with self._lock:
+            self.records.append(rec)
+        return rec
+
+    def summary(self):
+        """Aggregate records per command type
+
+        Returns
+        -------
+        OrderedDict
+          Command type (see `command_type()`) to a dict with 'count',
+          'duration' (total, in seconds), 'stdout_size' (total, in bytes),
+          and 'failed' (number of calls with non-zero exit code, or that
+          did not complete, recorded with exit code -1). Sorted
+          by total duration, most expensive command first.
+        """
+        agg = {}
+        with self._lock:
+            records = list(self.records)
+        for r in records:
+            s = agg.setdefault(
+                command_type(r.argv),
+                dict(count=0, duration=0.0, stdout_size=0, failed=0))
+            s['count'] += 1
+            s['duration'] += r.duration
+            s['stdout_size'] += r.stdout_size
+            if r.exit_code:
+                s['failed'] += 1
+        return OrderedDict(
+            sorted(agg.items(), key=lambda x: x[1]['duration'], reverse=True))
+
+    def to_chrome_trace(self):
+        """Return the trace in Chrome's trace event format
+
+        Each subprocess call is represented by a complete ('X') event,
+        with the command type as name and the full argv, working
+        directory, exit code and output size as arguments.
+        """
+        pid = os.getpid()
+        with self._lock:
+            records = list(self.records)
+        events = [
+            dict(
+                name=command_type(r.argv),
+                cat='subprocess',
+                ph='X',
+                ts=int((r.start - self._t0) * 1e6),
+                dur=int(r.duration * 1e6),
+                pid=pid,
+                tid=r.thread,
+                args=dict(
+                    argv=r.argv,
+                    cwd=r.cwd,
+                    exit_code=r.exit_code,
+                    stdout_size=r.stdout_size,
+                ),
+            )
+            for r in records
+        ]
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def to_json(self):
+        with self._lock:
+            return [r._asdict() for r in self.records]
+
+    def dump(self, path):
+        """Write the trace to a file
+
+        A path ending in '.json' receives a Chrome trace, any other path
+        the plain list of records.
+        """
+        content = self.to_chrome_trace() \
+            if path.endswith('.json') else self.to_json()
+        with open(path, 'w') as f:
+            json.dump(content, f, indent=1)
+
+
+# exit code recorded for a call that failed without one
+_failed = -1
+
+# stack of active traces, every traced call is recorded in all of them
+_active_traces = []
+_orig_run = Runner.run
+
+
+def _traced_run(self, cmd, *args, **kwargs):
+    if not _active_traces or not command_type(cmd).startswith('git'):
+        return _orig_run(self, cmd, *args, **kwargs)
+    cwd = kwargs.get('cwd', None) or self.cwd
+    exit_code = 0
+    out = None
+    start = time.time()
+    try:
+        out = _orig_run(self, cmd, *args, **kwargs)
+        return out
+    except CommandError as e:
+        exit_code = _failed if e.code is None else e.code
+        raise
+    except BaseException:
+        # the call did not complete, e.g. the executable was not found or
+        # the process was interrupted
+        exit_code = _failed
+        raise
+    finally:
+        duration = time.time() - start
+        stdout = out[0] if isinstance(out, tuple) else None
+        for t in list(_active_traces):
+            t.add(cmd, cwd, start, duration, exit_code, stdout)
+
+
+def record_call(argv, cwd, start, duration, exit_code, stdout_size):
+    """Record a git/git-annex call that was not made by DataLad's runner
+
+    For calls whose output is streamed, rather than collected by the
+    runner. Nothing is recorded, unless tracing is enabled.
+    """
+    for t in list(_active_traces):
+        t.add(argv, cwd, start, duration, exit_code, None,
+              stdout_size=stdout_size)
+
+
+def enable_tracing(trace=None):
+    """Start recording git/git-annex calls into a trace
+
+    Parameters
+    ----------
+    trace : SubprocessTrace, optional
+      If not given, a new trace is created.
+
+    Returns
+    -------
+    SubprocessTrace
+    """
+    if trace is None:
+        trace = SubprocessTrace()
+    if Runner.run is not _traced_run:
+        Runner.run = _traced_run
+    _active_traces.append(trace)
+    return trace
+
+
+def disable_tracing(trace):
+    """Stop recording into a trace that was enabled before"""
+    _active_traces.remove(trace)
+    if not _active_traces:
+        Runner.run = _orig_run
+
+
+@contextmanager
+def trace_subprocesses(trace=None):
+    """Context manager to record all git/git-annex calls in a block
+
+    Usage::
+
+      with trace_subprocesses() as trace:
+          ds.rev_status(recursive=True)
+      for cmd, stats in trace.summary().items():
+          print(cmd, stats['count'], stats['duration'])
+    """
+    trace = enable_tracing(trace)
+    try:
+        yield trace
+    finally:
+        disable_tracing(trace)
+
+
+def enable_tracing_from_config(cfg=None):
+    """Enable process-wide tracing, if requested by configuration
+
+    Parameters
+    ----------
+    cfg : ConfigManager, optional
+      Defaults to DataLad's process-wide configuration.
+
+    Returns
+    -------
+    SubprocessTrace or None
+    """
+    if cfg is None:
+        from datalad import cfg
+    path = cfg.get('datalad.revolution.trace', None)
+    if not path:
+        return None
+    import atexit
+    trace = enable_tracing()
+    lgr.debug('Tracing git/git-annex calls into %s', path)
+
+    def _dump():
+        try:
+            trace.dump(path)
+        except Exception as e:  # pragma: no cover
+            lgr.warning('Failed to write subprocess trace to %s: %s',
+                        path, e)
+    atexit.register(_dump)
+    return trace
+
+
+# result of evaluating the configuration for the process, see
+# `get_configured_trace()`
+_configured_trace = []
+_configured_lock = threading.Lock()
+
+
+def get_configured_trace():
+    """Return the process-wide trace, enabling it on the first call
+
+    The configuration is only evaluated on the first call, see
+    `enable_tracing_from_config()`.
+
+    Returns
+    -------
+    SubprocessTrace or None
+      None, unless tracing is requested by configuration.
+    """
+    with _configured_lock:
+        if not _configured_trace:
+            _configured_trace.append(enable_tracing_from_config())
+        return _configured_trace[0]
@@ -0,0 +1,298 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Streaming difference report between two recorded states
+
+The trees of both states are listed by `git ls-tree -r -z`, and both
+listings are merge-walked as they are read. Git lists tree content in the
+byte order of the full paths, hence records for any path can be reported
+as soon as the path was seen in both listings. Memory use does not depend
+on the size of the trees or of the difference, while a regular difference
+report holds the content information of both states of a dataset in
+memory before the first record is reported.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import subprocess
+import tempfile
+import time
+
+from datalad.cmd import GitRunner
+from datalad.support.exceptions import CommandError
+
+from .gitindex import get_git_dir
+from .tracing import record_call
+
+lgr = logging.getLogger('datalad.revolution.treediff')
+
+# number of bytes read from a listing at once
+_chunksize = 1024 * 1024
+
+_mode_types = {
+    b'100644': 'file',
+    b'100755': 'file',
+    b'120000': 'symlink',
+    b'160000': 'dataset',
+}
+
+
+class LinkTargets(object):
+    """Read the targets of recorded symlinks from a single Git process
+
+    Targets are read on demand by `git cat-file --batch`, which is only
+    started for the first symlink. Use as a context manager, the process
+    is stopped on exit.
+
+    Parameters
+    ----------
+    repo_path : str
+      Root of the repository.
+    """
+    _cmd = ['git', 'cat-file', '--batch']
+
+    def __init__(self, repo_path):
+        self.repo_path = repo_path
+        self._proc = None
+        self._start = None
+        self._size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+
+    def get(self, sha):
+        """Return the target of the symlink blob with a Git SHA (bytes)"""
+        if self._proc is None:
+            self._start = time.time()
+            self._proc = subprocess.Popen(
+                self._cmd, cwd=self.repo_path, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                env=GitRunner.get_git_environ_adjusted())
+        self._proc.stdin.write(sha.encode('ascii') + b'\n')
+        self._proc.stdin.flush()
+        header = self._proc.stdout.readline()
+        # <sha> SP <type> SP <size> LF <content> LF
+        props = header.split()
+        if len(props) != 3:
+            raise CommandError(
+                cmd=' '.join(self._cmd),
+                msg='cannot read symlink {}: {}'.format(
+                    sha, header.decode('utf-8', 'replace').strip()))
+        target = self._proc.stdout.read(int(props[2]) + 1)[:-1]
+        self._size += len(header) + len(target) + 1
+        return target
+
+    def close(self):
+        if self._proc is None:
+            return
+        self._proc.stdin.close()
+        self._proc.wait()
+        self._proc.stdout.close()
+        record_call(self._cmd, self.repo_path, self._start,
+                    time.time() - self._start, self._proc.returncode,
+                    self._size)
+        self._proc = None
+
+
+def iter_tree(repo_path, ref, link_targets=None):
+    """Yield the content of a recorded tree, as it is listed by Git
+
+    Parameters
+    ----------
+    repo_path : str
+      Root of the repository.
+    ref : str
+      Any tree-ish. The root tree of a commit is listed, not the work
+      tree of any subdirectory.
+    link_targets : LinkTargets, optional
+      If given, symlinks that point into the annex object store are
+      reported as files, like DataLad reports them: their symlink nature
+      depends on the mode of the annex.
+
+    Yields
+    ------
+    (bytes, str, str, int or None)
+      Path relative to the repository root ('/' as separator), type
+      ('file', 'symlink', 'dataset', or the Git file mode for anything
+      else), Git SHA, and size (None, unless the type is 'file').
+
+    Raises
+    ------
+    CommandError
+      If the listing fails, e.g. for an invalid `ref`.
+    """
+    cmd = ['git', 'ls-tree', '-r', '-z', '-l', '--full-tree', ref]
+    start = time.time()
+    size = 0
+    # the output is streamed, which DataLad's runner cannot do, but Git is
+    # called like the runner would. Error messages go to a file, where
+    # they can never block Git
+    with tempfile.TemporaryFile() as stderr:
+        proc = subprocess.Popen(
+            cmd, cwd=repo_path, stdout=subprocess.PIPE, stderr=stderr,
+            env=GitRunner.get_git_environ_adjusted())
+        try:
+            buf = b''
+            while True:
+                chunk = proc.stdout.read(_chunksize)
+                if not chunk:
+                    break
+                size += len(chunk)
+                lines = (buf + chunk).split(b'\0')
+                buf = lines.pop()
+                for line in lines:
+                    yield _parse_line(line, link_targets)
+            if buf:
+                yield _parse_line(buf, link_targets)
+            if proc.wait():
+                stderr.seek(0)
+                raise CommandError(
+                    cmd=' '.join(cmd), code=proc.returncode,
+                    stderr=stderr.read().decode('utf-8', 'replace'))
+        finally:
+            if proc.poll() is None:
+                # the consumer stopped early
+                proc.kill()
+                proc.wait()
+            proc.stdout.close()
+            record_call(cmd, repo_path, start, time.time() - start,
+                        proc.returncode, size)
+
+
+def _parse_line(line, link_targets=None):
+    # <mode> SP <type> SP <object> SP+ <size> TAB <path>
+    props, path = line.split(b'\t', 1)
+    mode, _, sha, size = props.split(None, 3)
+    sha = sha.decode('ascii')
+    type_ = _mode_types.get(mode, None)
+    if type_ is None:
+        type_ = mode.decode('ascii')
+    elif type_ == 'symlink' and link_targets is not None and \
+            b'.git/annex/objects' in link_targets.get(sha):
+        # the size remains that of the symlink, like DataLad reports it
+        type_ = 'file'
+    return (
+        path,
+        type_,
+        sha,
+        int(size) if type_ == 'file' else None,
+    )
+
+
+def _props(rec):
+    props = {'type': rec[1], 'gitshasum': rec[2]}
+    if rec[3] is not None:
+        props['bytesize'] = rec[3]
+    return props
+
+
+def merge_trees(fr_tree, to_tree):
+    """Merge-walk two tree listings, yielding the state of every path
+
+    Parameters
+    ----------
+    fr_tree, to_tree : iterable
+      Records as yielded by `iter_tree()`, in Git's order.
+
+    Yields
+    ------
+    (bytes, dict)
+      Path and properties ('state', 'type', 'gitshasum',
+      'prev_gitshasum', 'bytesize'), like those reported by
+      `GitRepo.diffstatus()` for two recorded states.
+    """
+    fr_tree = iter(fr_tree)
+    to_tree = iter(to_tree)
+    fr_rec = next(fr_tree, None)
+    to_rec = next(to_tree, None)
+    while fr_rec is not None or to_rec is not None:
+        if to_rec is None or (fr_rec is not None and fr_rec[0] < to_rec[0]):
+            # no size is reported for content that is gone
+            props = {
+                'type': fr_rec[1],
+                'gitshasum': fr_rec[2],
+                'state': 'deleted',
+            }
+            yield fr_rec[0], props
+            fr_rec = next(fr_tree, None)
+        elif fr_rec is None or to_rec[0] < fr_rec[0]:
+            props = _props(to_rec)
+            props['state'] = 'added'
+            yield to_rec[0], props
+            to_rec = next(to_tree, None)
+        else:
+            props = _props(to_rec)
+            props['prev_gitshasum'] = fr_rec[2]
+            props['state'] = 'clean' if fr_rec[2] == to_rec[2] \
+                and fr_rec[1] == to_rec[1] else 'modified'
+            yield to_rec[0], props
+            fr_rec = next(fr_tree, None)
+            to_rec = next(to_tree, None)
+
+
+def iter_diff(ds_path, fr, to, recursion_limit=0):
+    """Yield a difference report between two recorded states of a dataset
+
+    Parameters
+    ----------
+    ds_path : str
+      Root of the dataset.
+    fr : str or None
+      State to compare from. None compares from an empty dataset.
+    to : str
+      State to compare to.
+    recursion_limit : int or None
+      Number of subdataset levels to report on. None reports on all
+      installed subdatasets. The state pair of a subdataset is determined
+      by its records in the two states of the superdataset.
+
+    Yields
+    ------
+    dict
+      Result records, as reported by DataLad's `diff` command, but without
+      the 'action' and 'refds' properties. Records for deleted content are
+      reported in the order of the paths, rather than after all other
+      records of a dataset.
+    """
+    with LinkTargets(ds_path) as link_targets:
+        for r in _iter_diff(ds_path, fr, to, recursion_limit, link_targets):
+            yield r
+
+
+def _iter_diff(ds_path, fr, to, recursion_limit, link_targets):
+    try:
+        for path, props in merge_trees(
+                iter_tree(ds_path, fr, link_targets) if fr else (),
+                iter_tree(ds_path, to, link_targets)):
+            path = op.normpath(op.join(ds_path, os.fsdecode(path)))
+            props.update(path=path, parentds=ds_path, status='ok')
+            yield props
+            if props['type'] != 'dataset' or \
+                    props['state'] not in ('added', 'modified') or \
+                    recursion_limit == 0 or get_git_dir(path) is None:
+                continue
+            for r in iter_diff(
+                    path,
+                    props.get('prev_gitshasum', None),
+                    props['gitshasum'],
+                    None if recursion_limit is None else recursion_limit - 1):
+                yield r
+    except CommandError as e:
+        yield dict(
+            path=ds_path,
+            status='impossible',
+            message=(
+                'Cannot compare %s and %s: %s', fr, to,
+                (e.stderr or '').strip()),
+        )
@@ -0,0 +1,230 @@
+# emacs: -*- mode: python; py-indent-offset: 4; tab-width: 4; indent-tabs-mode: nil -*-
+# ex: set sts=4 ts=4 sw=4 noet:
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+#
+#   See COPYING file distributed along with the datalad package for the
+#   copyright and license terms.
+#
+# ## ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ### ##
+"""Discovery of untracked content in a work tree, without calling Git
+
+Directories are listed with `os.scandir()` on a pool of worker threads.
+Tracked content is known from the index (see `gitindex`), ignored content
+is identified with `gitignore.IgnoreMatcher`, including the global
+excludes file configured as `core.excludesFile` (see `config`). Neither
+ignored directories, nor subdatasets (or any other nested repository)
+are descended into. Content is discovered in no particular order, use
+`git_order()` to report it like Git does.
+"""
+
+__docformat__ = 'restructuredtext'
+
+import logging
+import os
+import os.path as op
+import threading
+from six.moves import queue
+
+from .config import get_excludes_file
+from .gitignore import IgnoreMatcher
+from .gitindex import (
+    get_git_dir,
+    iter_staged,
+    scandir,
+)
+from .hierarchy import (
+    WorkStealingPool,
+    get_jobs,
+)
+
+lgr = logging.getLogger('datalad.revolution.untracked')
+
+_done = object()
+
+
+def get_tracked(worktree, git_dir=None):
+    """Return the sets of tracked paths and their parent directories
+
+    All paths are relative to the work tree root, with '/' as separator.
+    """
+    return collect_tracked(
+        os.fsdecode(path)
+        for path, mode, sha, stage in iter_staged(worktree, git_dir))
+
+
+def collect_tracked(paths):
+    """Return the sets of tracked paths and their parent directories
+
+    Parameters
+    ----------
+    paths : iterable
+      Tracked paths, relative to the work tree root ('/' as separator).
+    """
+    tracked = set()
+    tracked_dirs = set([''])
+    for path in paths:
+        tracked.add(path)
+        d = path.rpartition('/')[0]
+        while d not in tracked_dirs:
+            tracked_dirs.add(d)
+            d = d.rpartition('/')[0]
+    return tracked, tracked_dirs
+
+
+def git_order(record):
+    """Sort key for untracked content in the order Git lists it
+
+    Git sorts by the bytes of the path, with a trailing slash for a
+    directory.
+
+    Parameters
+    ----------
+    record : (str, str)
+      Path and type, as yielded by `iter_untracked()`.
+    """
+    path, type_ = record
+    path = os.fsencode(path)
+    return path + b'/' if type_ == 'directory' else path
+
+
+def iter_untracked(worktree, untracked='normal', jobs='auto', tracked=None,
+                   matcher=None):
+    """Yield untracked content of a work tree, as it is discovered
+
+    Parameters
+    ----------
+    worktree : str
+      Root of the work tree.
+    untracked : {'normal', 'all'}
+      With 'normal', a directory that contains no tracked content is
+      reported as a whole (if it contains any non-ignored content),
+      with 'all' any untracked file in it is reported individually.
+      Nested repositories are always reported as a directory.
+    jobs : int or 'auto'
+      Number of threads listing directories.
+    tracked : (set, set), optional
+      Tracked paths and their parent directories, as returned by
+      `get_tracked()`. Read from the index, if not given.
+    matcher : IgnoreMatcher, optional
+      Matcher for the work tree root directory. Built from the work tree's
+      ignore rules and configuration, if not given.
+
+    Yields
+    ------
+    (str, str)
+      Path relative to the work tree root ('/' as separator), and type
+      ('file', 'symlink', or 'directory'). The order of reports is not
+      deterministic, see `git_order()`.
+    """
+    if untracked not in ('normal', 'all'):
+        raise ValueError('Unsupported untracked mode: {}'.format(untracked))
+    git_dir = get_git_dir(worktree)
+    if tracked is None:
+        tracked = get_tracked(worktree, git_dir)
+    if matcher is None:
+        matcher = IgnoreMatcher.for_worktree(
+            worktree, git_dir=git_dir,
+            excludes_file=get_excludes_file(worktree))
+    walker = _Walker(worktree, untracked, tracked, get_jobs(jobs))
+    for r in walker.run(matcher):
+        yield r
+
+
+class _Walker(object):
+    def __init__(self, worktree, untracked, tracked, jobs):
+        self.worktree = worktree
+        self.untracked = untracked
+        self.tracked, self.tracked_dirs = tracked
+        self.jobs = jobs
+        self.results = queue.Queue()
+        self._pending = 0
+        self._lock = threading.Lock()
+        self._pool = None
+
+    def run(self, matcher):
+        self._pool = WorkStealingPool(self.jobs)
+        self._submit('', matcher)
+        try:
+            while True:
+                r = self.results.get()
+                if r is _done:
+                    break
+                if isinstance(r, Exception):
+                    raise r
+                yield r
+        finally:
+            # also reached when the consumer stops early
+            self._pool.cancel()
+            self._pool.shutdown()
+
+    def _submit(self, reldir, matcher):
+        with self._lock:
+            self._pending += 1
+        self._pool.submit(self._scan, reldir, matcher)
+
+    def _scan(self, reldir, matcher):
+        try:
+            self._scan_dir(reldir, matcher)
+        except Exception as e:
+            self.results.put(e)
+        finally:
+            with self._lock:
+                self._pending -= 1
+                finished = not self._pending
+            if finished:
+                self.results.put(_done)
+
+    def _scan_dir(self, reldir, matcher):
+        if reldir:
+            matcher = matcher.for_directory(self.worktree, reldir)
+        prefix = reldir + '/' if reldir else ''
+        # a directory without any tracked content inside
+        untracked_dir = reldir not in self.tracked_dirs
+        try:
+            entries = scandir(op.join(self.worktree, reldir))
+        except OSError as e:
+            lgr.debug('Cannot list %s: %s', reldir, e)
+            return
+        for e in entries:
+            if e.name == '.git':
+                continue
+            path = prefix + e.name
+            if not untracked_dir and path in self.tracked:
+                # includes registered subdatasets
+                continue
+            is_dir = e.is_dir(follow_symlinks=False)
+            if matcher.is_ignored(path, is_dir):
+                continue
+            if not is_dir:
+                self.results.put(
+                    (path, 'symlink' if e.is_symlink() else 'file'))
+            elif op.lexists(op.join(e.path, '.git')):
+                # nested repository that is not registered
+                self.results.put((path, 'directory'))
+            elif not untracked_dir and path in self.tracked_dirs:
+                self._submit(path, matcher)
+            elif self.untracked == 'all':
+                self._submit(path, matcher)
+            elif self._has_content(path, matcher):
+                self.results.put((path, 'directory'))
+
+    def _has_content(self, reldir, matcher):
+        """Whether an untracked directory has any non-ignored content"""
+        matcher = matcher.for_directory(self.worktree, reldir)
+        try:
+            entries = scandir(op.join(self.worktree, reldir))
+        except OSError:
+            return False
+        subdirs = []
+        for e in entries:
+            path = reldir + '/' + e.name
+            if e.name == '.git':
+                # nested repository
+                return True
+            is_dir = e.is_dir(follow_symlinks=False)
+            if matcher.is_ignored(path, is_dir):
+                continue
+            if not is_dir:
+                return True
+            subdirs.append(path)
+        return any(self._has_content(d, matcher) for d in subdirs)
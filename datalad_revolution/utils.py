@@ -1,3 +1,5 @@
+import os
+
 from six import PY2
 import datalad.support.ansi_colors as ac
 
@@ -24,3 +26,19 @@ state_color_map = {
 
 def nothere(*args, **kwargs):
     raise NotImplementedError
+
+
+def file_fingerprint(path):
+    """Return the stat properties that identify a version of a file
+
+    Returns
+    -------
+    tuple or None
+      Modification time, change time, size, and inode, or None if the file
+      does not exist. Any change of the file changes at least one of them.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_ctime_ns, st.st_size, st.st_ino
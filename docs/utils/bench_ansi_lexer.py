@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""Benchmark the ANSI color lexer on synthetic status transcripts.
+
+Times the single-pass lexer of `AnsiColorLexer` and the rule-based
+lexing of pygments' `RegexLexer` it replaces. That both produce the same
+text with the same colors for these transcripts is tested by
+datalad_revolution/tests/test_ansi_lexer.py.
+
+Usage:
+
+    python docs/utils/bench_ansi_lexer.py [--lines N] [--repeat N]
+"""
+from __future__ import absolute_import
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import argparse
+import os.path as op
+import random
+import sys
+import time
+
+import pygments.lexer
+
+sys.path.insert(0, op.dirname(op.abspath(__file__)))
+
+from pygments_ansi_color import AnsiColorLexer  # noqa: E402
+
+# the states and colors of a datalad status report
+_states = (
+    ('clean', None),
+    ('modified', 31),
+    ('deleted', 31),
+    ('untracked', 31),
+    ('added', 32),
+)
+_types = ('file', 'symlink', 'dataset', 'directory')
+
+# some less common sequences, including invalid ones
+special_lines = (
+    '\x1b[33;44mwarning\x1b[39;49m: \x1b[Kcheck\x1b[m\n',
+    'progress \x1b[2K\x1b[1Gdone\n',
+    'junk \x1b[0;59;"A"p sequence\n',
+    'lone \x1b escape\n',
+)
+
+
+def make_transcript(lines, seed=0):
+    """Return a colored status transcript with the given number of lines."""
+    rnd = random.Random(seed)
+    out = []
+    for i in range(lines):
+        state, color = rnd.choice(_states)
+        label = '\x1b[1;{}m{}\x1b[0m'.format(color, state) \
+            if color else state
+        out.append('{:>9}: sub{}/dir{}/file{}.dat (\x1b[1m{}\x1b[0m)\n'.format(
+            label, i % 7, i % 101, i, rnd.choice(_types)))
+        if rnd.random() < 0.01:
+            out.append(rnd.choice(special_lines))
+    return ''.join(out)
+
+
+def _time(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.time()
+        result = fn()
+        t = time.time() - t
+        best = t if best is None else min(best, t)
+    return best, result
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '--lines', type=int, default=200000,
+        help='number of lines of the transcript [default: %(default)s]')
+    parser.add_argument(
+        '--repeat', type=int, default=3,
+        help='number of timed runs, the best is reported '
+        '[default: %(default)s]')
+    args = parser.parse_args(args)
+
+    text = make_transcript(args.lines)
+    print('transcript: {} lines, {:.1f} MB'.format(
+        args.lines, len(text) / 1e6))
+
+    def regex():
+        return list(pygments.lexer.RegexLexer.get_tokens_unprocessed(
+            AnsiColorLexer(), text))
+
+    def single_pass():
+        return list(AnsiColorLexer().get_tokens_unprocessed(text))
+
+    t_regex, regex_tokens = _time(regex, args.repeat)
+    t_fast, fast_tokens = _time(single_pass, args.repeat)
+    print('regex lexer:       {:7.3f} s, {} tokens'.format(
+        t_regex, len(regex_tokens)))
+    print('single-pass lexer: {:7.3f} s, {} tokens ({:.1f}x)'.format(
+        t_fast, len(fast_tokens), t_regex / t_fast))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -47,6 +47,51 @@ def _token_from_lexer_state(bold, fg_color, bg_color):
         return getattr(Color, token_name)
 
 
+# token for every combination of bold, foreground, and background color
+_token_table = dict(
+    ((bold, fg_color, bg_color),
+     _token_from_lexer_state(bold, fg_color, bg_color))
+    for bold, fg_color, bg_color in itertools.product(
+        (False, True),
+        (None,) + tuple(_ansi_code_to_color.values()),
+        (None,) + tuple(_ansi_code_to_color.values()),
+    )
+)
+
+# an escape sequence: a lone escape character, the start of a control
+# sequence, or a complete control sequence with its parameters and code
+_escape_regex = re.compile(r'\x1b(?:\[(?:([0-9;=]*)([a-zA-Z]))?)?')
+
+_default_state = (False, None, None)
+
+
+def _apply_graphics_mode(state, value):
+    """Return the lexer state after a "Set Graphics Mode" sequence."""
+    if value == '':
+        return _default_state
+    bold, fg_color, bg_color = state
+    for value in value.split(';'):
+        try:
+            value = int(value)
+        except ValueError:
+            continue
+        if 30 <= value <= 37:
+            fg_color = _ansi_code_to_color[value - 30]
+        elif 40 <= value <= 47:
+            bg_color = _ansi_code_to_color[value - 40]
+        elif value == 1:
+            bold = True
+        elif value == 22:
+            bold = False
+        elif value == 39:
+            fg_color = None
+        elif value == 49:
+            bg_color = None
+        elif value == 0:
+            bold, fg_color, bg_color = _default_state
+    return bold, fg_color, bg_color
+
+
 def color_tokens(fg_colors, bg_colors):
     """Return color tokens for a given set of colors.
 
@@ -114,9 +159,72 @@ class AnsiColorLexer(pygments.lexer.RegexLexer):
 
     @property
     def current_token(self):
-        return _token_from_lexer_state(
-            self.bold, self.fg_color, self.bg_color,
-        )
+        return _token_table[(self.bold, self.fg_color, self.bg_color)]
+
+    def get_tokens_unprocessed(self, text, stack=('root',)):
+        """Produce runs of text with the same token.
+
+        This is equivalent to lexing with the rules in `tokens`, but all
+        escape sequences are found in a single pass, state transitions are
+        cached, and consecutive pieces of text with the same token are
+        joined into a single run, instead of producing one token per escape
+        sequence.
+        """
+        Text = pygments.token.Text
+        state = (self.bold, self.fg_color, self.bg_color)
+        # (state, escape sequence) -> (state, token)
+        transitions = {}
+        # token of the text after the last escape sequence, and the
+        # position reported for it
+        token = Text
+        start = 0
+        pos = 0
+        # position, token, and pieces of text of the current run
+        run_start = 0
+        run_token = None
+        run = []
+        append = run.append
+        for match in itertools.chain(
+                _escape_regex.finditer(text), (None,)):
+            end = len(text) if match is None else match.start()
+            if end > pos:
+                if token is not run_token:
+                    if run:
+                        yield run_start, run_token, ''.join(run)
+                        del run[:]
+                    run_start = start
+                    run_token = token
+                append(text[pos:end])
+            if match is None:
+                break
+            start = end
+            pos = match.end()
+            escape = match.group(0)
+            key = (state, escape)
+            try:
+                state, token = transitions[key]
+                continue
+            except KeyError:
+                pass
+            if escape == '\x1b':
+                # a lone escape character, an error for the regular lexer
+                # as well, after which text is never colored
+                if run:
+                    yield run_start, run_token, ''.join(run)
+                    del run[:]
+                    run_token = None
+                yield end, pygments.token.Error, escape
+                token = Text
+                start += 1
+                continue
+            value, code = match.groups()
+            new_state = _apply_graphics_mode(state, value) \
+                if code == 'm' else state
+            transitions[key] = new_state, _token_table[new_state]
+            state, token = transitions[key]
+        if run:
+            yield run_start, run_token, ''.join(run)
+        self.bold, self.fg_color, self.bg_color = state
 
     def process(self, match):
         """Produce the next token and bit of text.
@@ -52,5 +52,8 @@ setup(
         'datalad.tests': [
             'revolution=datalad_revolution',
         ],
+        'console_scripts': [
+            'datalad-rev-client=datalad_revolution.client:main',
+        ],
     },
 )